@@ -0,0 +1,339 @@
+"""Contrôle de charge des timelines: coalescence et admission.
+
+Coalescence (TIMELINE_COALESCE=1, défaut): des requêtes simultanées pour la
+même page (utilisateur, limit, curseur, stratégie) ne lancent qu'un fan-out;
+les suivantes attendent le résultat (ou l'erreur) de la première. Un post,
+un follow ou un unfollow détache la requête en vol de l'utilisateur
+(forget): les requêtes arrivées ensuite relancent un calcul qui le voit.
+
+Admission (ADMISSION_MAX_CONCURRENT > 0): au plus ADMISSION_MAX_CONCURRENT
+calculs de timeline (fan-out) à la fois par worker. Les requêtes servies par
+le cache ou par un calcul en vol ne prennent pas de place. Les suivantes
+attendent leur tour dans une file FIFO d'au plus ADMISSION_MAX_QUEUE
+requêtes, au plus ADMISSION_QUEUE_TIMEOUT secondes. File pleine ou attente
+trop longue: 503 immédiat avec Retry-After, plutôt qu'un délai d'expiration
+côté client.
+
+Échéance (REQUEST_DEADLINE > 0): budget total d'une requête de timeline,
+compté dès son arrivée, attente dans la file comprise. Le délai des requêtes
+par followee (TIMELINE_QUERY_TIMEOUT) est borné par le temps restant
+(timeout()), et une requête dont l'échéance est passée quand vient son tour
+est refusée.
+"""
+import asyncio
+import collections
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+# Coalescence des requêtes de timeline identiques simultanées
+TIMELINE_COALESCE = os.environ.get('TIMELINE_COALESCE', '1') == '1'
+# Requêtes de timeline servies en même temps par worker (0 = pas de limite)
+ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT', '0'))
+# Requêtes en attente au-delà desquelles une nouvelle requête est refusée
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', '32'))
+# Attente maximale (s) d'une place avant refus
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '0.5'))
+# Budget total (s) d'une requête de timeline (0 = pas d'échéance)
+REQUEST_DEADLINE = float(os.environ.get('REQUEST_DEADLINE', '0'))
+# Valeur de l'en-tête Retry-After des réponses 503
+RETRY_AFTER = os.environ.get('ADMISSION_RETRY_AFTER', '1')
+
+# Échéance (time.monotonic()) de la requête en cours, None si aucune
+_deadline = contextvars.ContextVar('tinyinsta_deadline', default=None)
+
+
+class Overloaded(Exception):
+    """Requête refusée: file pleine, attente trop longue ou échéance dépassée."""
+
+
+def remaining():
+    """Secondes restant avant l'échéance de la requête en cours (None si aucune)."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def timeout(default):
+    """`default` (None = illimité) borné par le temps restant avant l'échéance."""
+    left = remaining()
+    if left is None:
+        return default
+    left = max(0.0, left)
+    return left if default is None else min(default, left)
+
+
+# ------------------------------------------------------------
+# Coalescence — une exécution par clé en vol
+# ------------------------------------------------------------
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Regroupe les appels simultanés de même clé; la clé commence par l'utilisateur.
+
+    do() sert les threads (Flask), do_async() la boucle d'événements (asgi.py).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}        # clé -> _Call
+        self._futures = {}      # clé -> asyncio.Future
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Résultat de `fn()`, calculé une fois pour tous les appels simultanés de `key`."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not call.event.wait(timeout(None)):
+                raise Overloaded('échéance dépassée')
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.event.set()
+
+    async def do_async(self, key, fn):
+        """Comme do(), `fn` étant une fonction coroutine."""
+        while True:
+            with self._lock:
+                future = self._futures.get(key)
+                leader = future is None
+                if leader:
+                    future = self._futures[key] = asyncio.get_running_loop().create_future()
+                    self.leaders += 1
+                else:
+                    self.coalesced += 1
+            if leader:
+                break
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout(None))
+            except asyncio.TimeoutError:
+                raise Overloaded('échéance dépassée') from None
+            except asyncio.CancelledError:
+                # Meneur annulé (client parti): on recalcule, sauf si c'est nous
+                if not future.cancelled():
+                    raise
+
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # lue: pas d'avertissement s'il n'y a pas d'attente
+            raise
+        finally:
+            with self._lock:
+                if self._futures.get(key) is future:
+                    del self._futures[key]
+
+    def forget(self, *users):
+        """Les prochains appels pour ces utilisateurs ne rejoignent plus les calculs en vol."""
+        users = set(users)
+        with self._lock:
+            for calls in (self._calls, self._futures):
+                for key in [k for k in calls if k[0] in users]:
+                    del calls[key]
+
+    def stats(self):
+        with self._lock:
+            return {'enabled': True, 'in_flight': len(self._calls) + len(self._futures),
+                    'leaders': self.leaders, 'coalesced': self.coalesced}
+
+
+def make_coalescer():
+    """SingleFlight selon TIMELINE_COALESCE (None si désactivé)."""
+    return SingleFlight() if TIMELINE_COALESCE else None
+
+
+# ------------------------------------------------------------
+# Admission — places, file d'attente FIFO, échéance
+# ------------------------------------------------------------
+class AdmissionController:
+    """Borne les calculs menés en même temps; refuse vite au-delà de la file.
+
+    Une place libérée est donnée directement au plus ancien en attente: une
+    requête qui arrive ne double jamais la file.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float,
+                 deadline: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.deadline = deadline
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters = collections.deque()  # fonctions qui réveillent un appel en attente
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.expired = 0
+
+    def _enter(self, wake):
+        """True si une place est libre; sinon `wake` est mis en file (Overloaded si pleine)."""
+        with self._lock:
+            if self.max_concurrent <= 0 or (self._active < self.max_concurrent
+                                            and not self._waiters):
+                self._active += 1
+                self.admitted += 1
+                return True
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded('file pleine')
+            self._waiters.append(wake)
+            self.queued += 1
+            return False
+
+    def _leave_queue(self, wake):
+        """Retire `wake` de la file après un délai: False si une place lui a déjà été donnée."""
+        with self._lock:
+            try:
+                self._waiters.remove(wake)
+            except ValueError:
+                return False
+            self.timed_out += 1
+            return True
+
+    def _wait_time(self):
+        # L'attente d'une place est prise sur le budget de la requête
+        return timeout(self.queue_timeout)
+
+    def acquire(self):
+        """Attend une place (bloquant); Overloaded si refusé."""
+        event = threading.Event()
+        if self._enter(event.set):
+            return
+        if not event.wait(self._wait_time()) and self._leave_queue(event.set):
+            raise Overloaded("délai d'attente dépassé")
+        with self._lock:
+            self.admitted += 1
+
+    async def acquire_async(self):
+        """Comme acquire(), sans bloquer la boucle d'événements."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        if self._enter(wake):
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self._wait_time())
+        except asyncio.TimeoutError:
+            if self._leave_queue(wake):
+                raise Overloaded("délai d'attente dépassé") from None
+        except asyncio.CancelledError:
+            # Place déjà donnée: rendue pour le suivant
+            if not self._leave_queue(wake):
+                self.release()
+            raise
+        with self._lock:
+            self.admitted += 1
+
+    def release(self):
+        """Rend une place, donnée au plus ancien en attente s'il y en a un."""
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft()()
+            else:
+                self._active -= 1
+
+    def check_deadline(self):
+        """Overloaded si l'échéance de la requête en cours est passée."""
+        left = remaining()
+        if left is not None and left <= 0:
+            with self._lock:
+                self.expired += 1
+            raise Overloaded('échéance dépassée')
+
+    @contextlib.contextmanager
+    def admit(self):
+        """Une place pendant le bloc (threads); l'échéance est vérifiée une fois admis."""
+        self.acquire()
+        try:
+            self.check_deadline()
+            yield
+        finally:
+            self.release()
+
+    @contextlib.asynccontextmanager
+    async def admit_async(self):
+        """Comme admit(), pour la boucle d'événements."""
+        await self.acquire_async()
+        try:
+            self.check_deadline()
+            yield
+        finally:
+            self.release()
+
+    def start_request(self):
+        """Fixe l'échéance de la requête en cours (REQUEST_DEADLINE): jeton pour finish_request()."""
+        return _deadline.set(time.monotonic() + self.deadline if self.deadline else None)
+
+    def finish_request(self, token):
+        _deadline.reset(token)
+
+    def init_app(self, app, endpoints):
+        """Fixe l'échéance des routes Flask `endpoints` dès l'arrivée de la requête."""
+        from flask import g, request
+
+        @app.before_request
+        def _start_deadline():
+            if request.endpoint in endpoints:
+                g.deadline_token = self.start_request()
+
+        @app.teardown_request
+        def _finish_deadline(exc):
+            token = g.pop('deadline_token', None)
+            if token is not None:
+                self.finish_request(token)
+
+    def stats(self):
+        with self._lock:
+            return {'enabled': True, 'max_concurrent': self.max_concurrent,
+                    'max_queue': self.max_queue, 'queue_timeout': self.queue_timeout,
+                    'deadline': self.deadline, 'active': self._active,
+                    'waiting': len(self._waiters), 'admitted': self.admitted,
+                    'queued': self.queued, 'rejected': self.rejected,
+                    'timed_out': self.timed_out, 'expired': self.expired}
+
+
+def make_admission():
+    """Contrôleur selon ADMISSION_MAX_CONCURRENT et REQUEST_DEADLINE (None si désactivé)."""
+    if ADMISSION_MAX_CONCURRENT <= 0 and REQUEST_DEADLINE <= 0:
+        return None
+    return AdmissionController(ADMISSION_MAX_CONCURRENT, ADMISSION_MAX_QUEUE,
+                               ADMISSION_QUEUE_TIMEOUT, REQUEST_DEADLINE)
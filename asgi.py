@@ -0,0 +1,367 @@
+"""Mode de service asynchrone (ASGI) de TinyInsta.
+
+    gunicorn -k uvicorn_worker.UvicornWorker -b :$PORT asgi:app
+
+/api/timeline (GET) et /post (POST de formulaire) sont servis par des
+handlers async: un worker garde de nombreuses requêtes en vol au lieu d'être
+bloqué par chaque RPC Datastore. Toutes les autres routes (pages HTML,
+/login, /follow, /admin/...) sont celles de l'application Flask, exécutées
+sur un pool de threads (a2wsgi).
+
+Le client google-cloud-datastore est synchrone: chaque appel au stockage est
+attendu sur un pool de threads d'E/S dédié (ASYNC_IO_THREADS), jamais sur la
+boucle d'événements. En fan-out-on-read avec les stratégies serial et
+threads, les requêtes par followee d'une page sont lancées ensemble
+(asyncio.wait); merge, recent, le mode write et les instantanés
+(TIMELINE_SNAPSHOT_SIZE) gardent leur propre regroupement des lectures et
+s'exécutent d'un bloc sur le même pool.
+
+Réponses, session, cache, métriques (Server-Timing), table d'identité par
+requête (loader.py), coalescence et admission (admission.py) sont les mêmes
+qu'en WSGI; l'attente d'une place ou d'un calcul en vol ne bloque pas la
+boucle.
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import heapq
+import os
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.cookies import SimpleCookie
+
+from a2wsgi import WSGIMiddleware
+from itsdangerous import BadSignature
+from werkzeug.http import parse_etags
+
+import admission
+import capture
+import formats
+import loader
+import main
+import metrics
+
+# Threads attendant les RPC de stockage des handlers async (tous les handlers du worker)
+ASYNC_IO_THREADS = int(os.environ.get('ASYNC_IO_THREADS', '64'))
+# Threads exécutant les routes Flask (pages HTML, /login, /follow, /admin/...)
+ASYNC_WSGI_THREADS = int(os.environ.get('ASYNC_WSGI_THREADS', '10'))
+
+# Stratégies dont les requêtes par followee sont lancées en async
+GATHER_STRATEGIES = ('serial', 'threads')
+
+_io_pool = ThreadPoolExecutor(max_workers=ASYNC_IO_THREADS, thread_name_prefix='async-io')
+
+
+async def _run(fn, *args):
+    """Exécute `fn(*args)` sur le pool d'E/S, dans une copie du contexte courant.
+
+    Le contexte porte les mesures (metrics) et la table d'identité (loader)
+    de la requête.
+    """
+    call = functools.partial(contextvars.copy_context().run, fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(_io_pool, call)
+
+
+# ------------------------------------------------------------
+# Requêtes et réponses
+# ------------------------------------------------------------
+class Request:
+    """Vue minimale d'une requête HTTP ASGI."""
+
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self._receive = receive
+        self.args = _first_values(scope.get('query_string', b'').decode('latin-1'))
+        # Formulaire lu par le handler, repris par la capture (capture.py)
+        self.form_data = None
+
+    def header(self, name: bytes):
+        for key, value in self.scope['headers']:
+            if key == name:
+                return value.decode('latin-1')
+        return None
+
+    @functools.cached_property
+    def session(self):
+        """Session Flask (cookie signé par app.secret_key), vide si absente ou invalide."""
+        app = main.app
+        cookie = SimpleCookie(self.header(b'cookie') or '')
+        morsel = cookie.get(app.config['SESSION_COOKIE_NAME'])
+        serializer = app.session_interface.get_signing_serializer(app)
+        if morsel is None or serializer is None:
+            return {}
+        try:
+            max_age = int(app.permanent_session_lifetime.total_seconds())
+            return serializer.loads(morsel.value, max_age=max_age)
+        except BadSignature:
+            return {}
+
+    async def form(self):
+        body = bytearray()
+        while True:
+            message = await self._receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        self.form_data = _first_values(body.decode('utf-8'))
+        return self.form_data
+
+
+def _first_values(query: str):
+    # Comme request.args.get de Flask: la première valeur d'un paramètre répété
+    values = {}
+    for key, value in urllib.parse.parse_qsl(query, keep_blank_values=True):
+        values.setdefault(key, value)
+    return values
+
+
+def _json(body, status: int = 200):
+    # Même encodage que jsonify (clés triées, compact hors debug)
+    return status, 'application/json', main.app.json.response(body).get_data()
+
+
+def _redirect(location: str):
+    return 302, 'text/html; charset=utf-8', b'', [(b'location', location.encode())]
+
+
+# ------------------------------------------------------------
+# Timeline — mêmes étapes que main.timeline_page, E/S attendues
+# ------------------------------------------------------------
+def _cache_lookup(cache, user, cache_key):
+    # Génération lue avant le calcul, comme dans main.timeline_page
+    gen = cache.generation(user)
+    return gen, cache.get(user, *cache_key, gen=gen)
+
+
+async def timeline_page(user: str, limit: int, strategy: str = None, cursor: str = None):
+    """Version async de main.timeline_page (None si l'utilisateur n'existe pas)."""
+    before = main.decode_cursor(cursor) if cursor else None
+    cache_key = (limit, cursor or '')
+    cache = main.timeline_cache
+
+    gen = None
+    if cache:
+        with metrics.stage('cache'):
+            gen, page = await _run(_cache_lookup, cache, user, cache_key)
+        if page is not None:
+            return page
+
+    async def compute():
+        control = main.admission_control
+        async with control.admit_async() if control else contextlib.nullcontext():
+            with metrics.stage('user'):
+                user_entity = await _run(main.loader.get_user, user)
+            if user_entity is None:
+                return None
+
+            posts = await get_timeline(user, limit, strategy, before, user_entity)
+            page = main.make_page(posts, limit, before)
+
+        if cache:
+            with metrics.stage('cache'):
+                await _run(functools.partial(cache.set, user, page, *cache_key, gen=gen))
+        return page
+
+    if main.coalescer:
+        return await main.coalescer.do_async((user, *cache_key, strategy), compute)
+    return await compute()
+
+
+async def get_timeline(user: str, limit: int, strategy: str, before, user_entity):
+    strategy = strategy or main.TIMELINE_STRATEGY
+    if main.TIMELINE_MODE == 'write' or strategy not in GATHER_STRATEGIES \
+            or main.TIMELINE_SNAPSHOT_SIZE:
+        return await _run(main.get_timeline, user, limit, strategy, before, user_entity)
+
+    fetch_limit = limit + (len(before.seen) if before else 0)
+    posts = []
+    pages = main.followee_pages(user)
+    while True:
+        authors = await _run(next, pages, None)
+        if authors is None:
+            break
+        with metrics.stage('posts'):
+            page_posts = await _gather_author_posts(authors, fetch_limit, before)
+        with metrics.stage('merge'):
+            posts = heapq.nlargest(fetch_limit, posts + page_posts, key=lambda p: p.get('created'))
+    return await _run(main.hydrate_posts, main.finish_timeline(posts, limit, before))
+
+
+async def _gather_author_posts(authors, limit: int, before):
+    """Requêtes par followee lancées ensemble, avec le délai et la politique
+    d'échec de main._run_concurrently (TIMELINE_QUERY_TIMEOUT borné par
+    l'échéance, TIMELINE_PARTIAL_RESULTS)."""
+    timeout = main.query_timeout()
+    tasks = [asyncio.ensure_future(_run(main.author_posts, author, limit, before, timeout))
+             for author in authors]
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+
+    posts = []
+    failed = len(pending)
+    for task in done:
+        if task.exception() is not None:
+            main.app.logger.error("Requête timeline en échec", exc_info=task.exception())
+            failed += 1
+            continue
+        posts.extend(task.result())
+    main.check_failures(failed, len(authors))
+    return posts
+
+
+# ------------------------------------------------------------
+# Handlers async
+# ------------------------------------------------------------
+async def api_timeline(request):
+    user = request.args.get('user') or request.session.get('user')
+    if not user:
+        return _json({"error": "missing user"}, 400)
+
+    fmt = formats.negotiate(request.header(b'accept'), request.args.get('format'))
+    if fmt is None:
+        return _json({"error": "unsupported format",
+                      "formats": sorted(formats.MIMETYPES.values())}, 406)
+
+    try:
+        limit, strategy = main.timeline_params(request.args)
+    except ValueError:
+        return _json({"error": "unknown strategy",
+                      "strategies": sorted(main.TIMELINE_STRATEGIES)}, 400)
+
+    control = main.admission_control
+    token = control.start_request() if control else None
+    try:
+        page = await timeline_page(user, limit, strategy, request.args.get('cursor'))
+    except ValueError:
+        return _json({"error": "invalid cursor"}, 400)
+    except main.TimelineUnavailable as e:
+        return _json({"error": "timeline unavailable", "detail": str(e)}, 503)
+    except admission.Overloaded as e:
+        status, content_type, body = _json({"error": "overloaded", "detail": str(e)}, 503)
+        return status, content_type, body, [(b'retry-after', admission.RETRY_AFTER.encode())]
+    finally:
+        if token is not None:
+            control.finish_request(token)
+
+    if page is None:
+        return _json({"error": "unknown user"}, 404)
+
+    etag = formats.etag(user, page, fmt)
+    headers = [(b'etag', f'"{etag}"'.encode()), (b'vary', b'Accept')]
+    if parse_etags(request.header(b'if-none-match')).contains(etag):
+        return 304, None, b'', headers
+    if fmt == 'ndjson':
+        with metrics.stage('serialize'):
+            return 200, formats.MIMETYPES[fmt], formats.ndjson_page(user, page), headers
+    if fmt == 'msgpack':
+        with metrics.stage('serialize'):
+            return 200, formats.MIMETYPES[fmt], formats.pack_page(user, page), headers
+    status, content_type, body = _json(main.timeline_json(user, page))
+    return status, content_type, body, headers
+
+
+async def post(request):
+    user = request.session.get('user')
+    if not user:
+        return _redirect('/')
+
+    content = (await request.form()).get('content')
+    if content is None:
+        return _json({"error": "missing content"}, 400)
+
+    entity = main.store.new_post(user, content, datetime.utcnow())
+    if main.post_buffer:
+        # add() peut attendre que le tampon se vide (backpressure)
+        await _run(main.post_buffer.add, entity)
+        return _redirect('/')
+
+    # main.publish_post, l'anneau et l'inbox étant écrits en parallèle
+    await _run(main.store.put_post, entity)
+    writes = [_run(main.store.push_recent, [entity])]
+    if main.TIMELINE_MODE == 'write':
+        writes.append(_run(main.fanout_post, entity))
+    await asyncio.gather(*writes)
+    await _run(main.invalidate_after_post, user)
+    return _redirect('/')
+
+
+def _form_post(request):
+    # Les autres encodages (multipart...) sont laissés à Flask
+    content_type = request.header(b'content-type') or ''
+    return content_type.startswith('application/x-www-form-urlencoded')
+
+
+# (méthode, chemin) -> (handler, condition sur la requête ou None)
+ROUTES = {
+    ('GET', '/api/timeline'): (api_timeline, None),
+    ('POST', '/post'): (post, _form_post),
+}
+
+
+# ------------------------------------------------------------
+# Application ASGI
+# ------------------------------------------------------------
+class App:
+    """Routes async de ROUTES, le reste délégué à l'application Flask."""
+
+    def __init__(self, flask_app, routes):
+        self.routes = routes
+        self.wsgi = WSGIMiddleware(flask_app, workers=ASYNC_WSGI_THREADS)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+
+        route = self.routes.get((scope.get('method'), scope.get('path'))) \
+            if scope['type'] == 'http' else None
+        request = Request(scope, receive) if route else None
+        if route is None or (route[1] is not None and not route[1](request)):
+            return await self.wsgi(scope, receive, send)
+
+        # Même cycle qu'une requête Flask (hooks de metrics.init_app, loader et capture)
+        metrics.start_request()
+        loader.open_scope()
+        if main.trace_recorder:
+            # Utilisateur lu avant le handler, comme dans capture.TraceRecorder.init_app
+            ts, t0, user = time.time(), time.perf_counter(), request.session.get('user')
+        try:
+            response = await route[0](request)
+        except Exception:
+            main.app.logger.exception("Erreur dans %s", scope['path'])
+            response = _json({"error": "internal server error"}, 500)
+        if main.trace_recorder:
+            main.trace_recorder.record(scope['method'], scope['path'],
+                                       user or request.args.get('user'),
+                                       capture.trace_params(request.args, request.form_data),
+                                       response[0], time.perf_counter() - t0, ts)
+
+        # (statut, type ou None, corps en bytes[, en-têtes])
+        status, content_type, body, *extra = response
+        headers = [(b'content-type', content_type.encode())] if content_type else []
+        headers.append((b'content-length', str(len(body)).encode()))
+        headers += extra[0] if extra else []
+        timing = metrics.finish_request(scope['path'], status)
+        if timing is not None:
+            headers.append((b'server-timing', timing.encode()))
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # Les posts encore dans le tampon de /post sont écrits avant l'arrêt
+                if main.post_buffer:
+                    await _run(main.post_buffer.flush)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = App(main.app, ROUTES)
@@ -0,0 +1,467 @@
+"""Benchmarks TinyInsta (remplace benchmark_conc.sh, benchmark_fanout.sh et benchmark_post.sh).
+
+Par défaut l'application tourne dans ce processus (serveur WSGI local,
+STORAGE_BACKEND=memory) et chaque point de grille est re-seedé avec la
+logique de seed.py, de façon déterministe (--seed). Avec --base-url, la
+charge vise un serveur distant et le seed écrit dans le backend choisi
+(--backend, ex: datastore) que ce serveur lit.
+
+Benchmarks (mêmes grilles que README_PROJET.md):
+  conc   : /api/timeline selon la concurrence      -> out/conc.csv
+  post   : /api/timeline selon les posts par user  -> out/post.csv
+  fanout : /api/timeline selon les followees       -> out/fanout.csv
+  write  : /post et /follow selon la concurrence   -> out/write_post.csv, out/write_follow.csv
+  modes  : /api/timeline selon la concurrence, pour chaque serveur local
+           (wsgi, wsgi-sync, asgi)                  -> out/modes_<serveur>.csv
+
+Le serveur local est choisi avec --server: wsgi (un thread par requête),
+wsgi-sync (une requête à la fois, comme le worker sync de gunicorn de
+app.yaml) ou asgi (uvicorn, voir asgi.py). Le backend mémoire répond sans
+latence réseau: --storage-latency ajoute un délai à chaque appel au stockage
+pour reproduire les RPC Datastore.
+
+Les CSV sont au format long (PARAM,AVG_TIME,RUN,FAILED + percentiles,
+débit), lu par transform_csv.py puis plot_results.py. L'histogramme complet
+des latences de chaque run est écrit dans out/<nom>_hist.csv.
+"""
+import argparse
+import csv
+import http.cookiejar
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import seed
+from workload import DISTRIBUTIONS, Workload
+
+OUT_DIR = 'out'
+CONCURRENCIES = [1, 10, 20, 50, 100, 1000]
+POSTS_PER_USER = [10, 100, 1000]
+FANOUTS = [10, 50, 100]
+# Concurrences du benchmark modes (wsgi-sync traite une requête à la fois)
+MODE_CONCURRENCIES = [1, 10, 20, 50, 100]
+SERVERS = ['wsgi', 'wsgi-sync', 'asgi']
+# Bornes supérieures (ms) des classes de l'histogramme; la dernière est +inf
+HIST_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+CSV_HEADER = ['PARAM', 'AVG_TIME', 'RUN', 'FAILED', 'P50', 'P95', 'P99', 'MAX',
+              'RPS', 'REQUESTS', 'ERRORS']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks TinyInsta (latences et débit).")
+    parser.add_argument('benchmarks', nargs='*', default=['conc', 'post', 'fanout'],
+                        choices=['conc', 'post', 'fanout', 'write', 'modes'],
+                        help="Benchmarks à lancer (défaut: conc post fanout)")
+    parser.add_argument('--base-url', type=str, default=None,
+                        help="Serveur à mesurer (défaut: application locale dans ce processus)")
+    parser.add_argument('--server', type=str, default='wsgi', choices=SERVERS,
+                        help="Serveur local: wsgi, wsgi-sync ou asgi (défaut: wsgi)")
+    parser.add_argument('--storage-latency', type=float, default=0,
+                        help="Délai (ms) ajouté à chaque appel au stockage de l'application locale")
+    parser.add_argument('--backend', type=str, default=None,
+                        help="Backend seedé avec --base-url (défaut: $STORAGE_BACKEND ou datastore)")
+    parser.add_argument('--no-seed', action='store_true',
+                        help="Ne pas seeder: les données en place servent à tous les points de grille")
+    parser.add_argument('--users', type=int, default=1000, help="Nombre d'utilisateurs seedés")
+    parser.add_argument('--prefix', type=str, default='user', help="Préfixe des usernames")
+    parser.add_argument('--requests', type=int, default=500, help="Nombre de requêtes par run")
+    parser.add_argument('--runs', type=int, default=3, help="Nombre de runs par point de grille")
+    parser.add_argument('--concurrency', type=int, default=50,
+                        help="Concurrence des benchmarks post et fanout")
+    parser.add_argument('--strategy', type=str, default=None,
+                        help="Stratégie de timeline (serial|threads|merge), résultats dans <nom>_<stratégie>.csv")
+    parser.add_argument('--limit', type=int, default=20, help="Taille de page de /api/timeline")
+    parser.add_argument('--seed', type=int, default=42, help="Graine du seed et de la charge")
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='uniform',
+                        help="Graphe seedé: uniform (degrés identiques) ou zipf (loi de puissance, voir workload.py)")
+    parser.add_argument('--workers', type=int, default=8, help="Threads d'écriture du seed")
+    parser.add_argument('--pause', type=float, default=0, help="Pause (secondes) entre deux runs")
+    parser.add_argument('--timeout', type=float, default=30, help="Délai maximal d'une requête (secondes)")
+    return parser.parse_args()
+
+
+# ------------------------------------------------------------
+# Cible — application locale (serveur dans un thread) ou distante
+# ------------------------------------------------------------
+class SlowStorage:
+    """Stockage dont chaque appel attend `delay` secondes (latence d'une RPC)."""
+
+    def __init__(self, store, delay: float):
+        self._store = store
+        self.delay = delay
+
+    def __getattr__(self, name):
+        attr = getattr(self._store, name)
+        # new_user/new_post construisent une entité sans RPC
+        if name.startswith(('_', 'new_')) or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            time.sleep(self.delay)
+            return attr(*args, **kwargs)
+
+        setattr(self, name, call)
+        return call
+
+
+class Target:
+    """Application mesurée et stockage à seeder."""
+
+    def __init__(self, args):
+        self.args = args
+        self.app_module = None
+        self.server = None
+        self._stop = None
+        if args.base_url:
+            from storage import make_storage
+            self.base_url = args.base_url.rstrip('/')
+            self.store = None if args.no_seed else make_storage(args.backend)
+            return
+
+        # L'application lit STORAGE_BACKEND à l'import
+        os.environ.setdefault('STORAGE_BACKEND', 'memory')
+        import main
+        # Une ligne de log par requête fausserait la mesure
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        self.app_module = main
+        # Le seed écrit directement, seule l'application subit la latence
+        self.store = main.store
+        if args.storage_latency:
+            main.store = main.loader.store = SlowStorage(main.store, args.storage_latency / 1000)
+        self.use(args.server)
+
+    def use(self, server):
+        """Sert l'application locale avec `server` (voir SERVERS)."""
+        if self._stop is not None:
+            self._stop()
+        if server == 'asgi':
+            import uvicorn
+            import asgi
+            config = uvicorn.Config(asgi.app, host='127.0.0.1', port=0, log_level='warning',
+                                    backlog=4096)
+            instance = uvicorn.Server(config)
+            threading.Thread(target=instance.run, daemon=True).start()
+            while not instance.started:
+                time.sleep(0.05)
+            port = instance.servers[0].sockets[0].getsockname()[1]
+
+            def stop():
+                instance.should_exit = True
+        else:
+            from werkzeug.serving import make_server
+            instance = make_server('127.0.0.1', 0, self.app_module.app,
+                                   threaded=(server == 'wsgi'))
+            # File d'attente large: les clients en trop attendent au lieu d'échouer
+            instance.socket.listen(4096)
+            threading.Thread(target=instance.serve_forever, daemon=True).start()
+            port = instance.server_port
+            stop = instance.shutdown
+        self.server = server
+        self._stop = stop
+        self.base_url = f"http://127.0.0.1:{port}"
+
+    def reseed(self, posts_per_user, followees_per_user):
+        """Remplace les données par un jeu déterministe; retourne les usernames."""
+        args = self.args
+        names = [f"{args.prefix}{i}" for i in range(1, args.users + 1)]
+        if self.store is None:
+            return names
+
+        print(f"[Seed] {args.users} users | {posts_per_user} posts/user | "
+              f"{followees_per_user} followees/user | {args.distribution}")
+        self.store.clear()
+        opts = argparse.Namespace(
+            workers=args.workers,
+            max_in_flight=2 * args.workers,
+            checkpoint=seed.Checkpoint(None, {}),
+        )
+        config = {'posts_per_user': posts_per_user, 'followees_per_user': followees_per_user,
+                  'seed': args.seed, 'base_time': datetime.utcnow().isoformat()}
+        if args.distribution != 'uniform':
+            config['distribution'] = args.distribution
+        source = Workload(names, config)
+        seed.ensure_users(self.store, source, opts)
+        seed.assign_follows(self.store, source, opts)
+        seed.create_posts(self.store, source, opts)
+        # Anneaux des posts récents, comme seed.py: sans eux `recent` et les
+        # instantanés mesureraient le repli sur l'index
+        seed.rebuild_rings(self.store, source, opts)
+
+        main = self.app_module
+        if main is not None:
+            # Même état qu'après /admin/seed: inbox construites en mode write, cache vide
+            if main.TIMELINE_MODE == 'write':
+                for entity in self.store.iter_users():
+                    main.backfill_inbox(entity)
+            if main.timeline_cache:
+                main.timeline_cache.clear()
+        return names
+
+    def close(self):
+        if self._stop is not None:
+            self._stop()
+
+
+# ------------------------------------------------------------
+# Charge — N requêtes réparties sur C clients concurrents
+# ------------------------------------------------------------
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # /post, /follow et /login répondent par une redirection vers /: on mesure
+    # l'écriture seule, comme `ab`, sans recharger la page d'accueil
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def _opener():
+    return urllib.request.build_opener(
+        urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+
+def _call(opener, url, data=None, timeout=30):
+    """Exécute une requête; True si la réponse est un succès (2xx ou redirection)."""
+    body = urllib.parse.urlencode(data).encode() if data is not None else None
+    try:
+        with opener.open(url, data=body, timeout=timeout) as resp:
+            resp.read()
+            return True
+    except urllib.error.HTTPError as e:
+        return 300 <= e.code < 400
+    except OSError:
+        return False
+
+
+def run_load(workload, n_requests, concurrency):
+    """Lance `n_requests` appels de workload sur `concurrency` clients.
+
+    `workload(client, i)` exécute le i-ème appel et retourne True si réussi;
+    `client` est l'état d'un client (workload.client(c)). Retourne
+    (latences en ms, nombre d'échecs, durée totale en s).
+    """
+    counter = itertools.count()
+    lock = threading.Lock()
+
+    def client_loop(c):
+        client = workload.client(c)
+        latencies, errors = [], 0
+        while True:
+            with lock:
+                i = next(counter)
+            if i >= n_requests:
+                return latencies, errors
+            t0 = time.perf_counter()
+            ok = workload(client, i)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            errors += not ok
+
+    concurrency = max(1, min(concurrency, n_requests))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='bench') as pool:
+        results = list(pool.map(client_loop, range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [ms for lat, _ in results for ms in lat]
+    return latencies, sum(e for _, e in results), elapsed
+
+
+class TimelineLoad:
+    """GET /api/timeline, les utilisateurs lus tournent sur une permutation fixe."""
+
+    def __init__(self, base_url, names, args):
+        self.base_url = base_url
+        self.names = random.Random(args.seed).sample(names, len(names))
+        self.limit = args.limit
+        self.strategy = args.strategy
+        self.timeout = args.timeout
+
+    def client(self, c):
+        return _opener()
+
+    def __call__(self, opener, i):
+        params = {'user': self.names[i % len(self.names)], 'limit': self.limit}
+        if self.strategy:
+            params['strategy'] = self.strategy
+        url = f"{self.base_url}/api/timeline?{urllib.parse.urlencode(params)}"
+        return _call(opener, url, timeout=self.timeout)
+
+
+class WriteLoad:
+    """POST /post ou /follow; chaque client est connecté sous son propre utilisateur."""
+
+    def __init__(self, base_url, names, args, action):
+        self.base_url = base_url
+        self.names = names
+        self.seed = args.seed
+        self.action = action
+        self.timeout = args.timeout
+
+    def client(self, c):
+        opener = _opener()
+        user = self.names[c % len(self.names)]
+        _call(opener, f"{self.base_url}/login", {'username': user}, self.timeout)
+        return opener, user, random.Random(f"{self.seed}:{c}")
+
+    def __call__(self, client, i):
+        opener, user, rng = client
+        if self.action == 'post':
+            data = {'content': f"Bench post {i} by {user}"}
+        else:
+            data = {'to_follow': rng.choice(self.names)}
+        return _call(opener, f"{self.base_url}/{self.action}", data, self.timeout)
+
+
+# ------------------------------------------------------------
+# Résultats — CSV long + histogramme
+# ------------------------------------------------------------
+def _percentile(sorted_values, p):
+    # Rang le plus proche
+    if not sorted_values:
+        return None
+    rank = max(1, round(p / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _histogram(latencies):
+    counts = [0] * (len(HIST_BOUNDS_MS) + 1)
+    for ms in latencies:
+        i = 0
+        while i < len(HIST_BOUNDS_MS) and ms > HIST_BOUNDS_MS[i]:
+            i += 1
+        counts[i] += 1
+    return zip(HIST_BOUNDS_MS + ['inf'], counts)
+
+
+class ResultWriter:
+    """out/<nom>.csv (format long) et out/<nom>_hist.csv, réécrits à chaque benchmark."""
+
+    def __init__(self, name):
+        os.makedirs(OUT_DIR, exist_ok=True)
+        self.path = os.path.join(OUT_DIR, f"{name}.csv")
+        self.hist_path = os.path.join(OUT_DIR, f"{name}_hist.csv")
+        with open(self.path, 'w', newline='') as f:
+            csv.writer(f).writerow(CSV_HEADER)
+        with open(self.hist_path, 'w', newline='') as f:
+            csv.writer(f).writerow(['PARAM', 'RUN', 'LE_MS', 'COUNT'])
+
+    def add(self, param, run, latencies, errors, elapsed):
+        ordered = sorted(latencies)
+        n = len(ordered)
+        avg = sum(ordered) / n if n else None
+        row = [param, _fmt(avg), run, int(errors > 0 or not n),
+               _fmt(_percentile(ordered, 50)), _fmt(_percentile(ordered, 95)),
+               _fmt(_percentile(ordered, 99)), _fmt(ordered[-1] if n else None),
+               _fmt(n / elapsed if elapsed else None), n, errors]
+        with open(self.path, 'a', newline='') as f:
+            csv.writer(f).writerow(row)
+        with open(self.hist_path, 'a', newline='') as f:
+            writer = csv.writer(f)
+            for bound, count in _histogram(ordered):
+                writer.writerow([param, run, bound, count])
+
+        print(f"  {param} run {run}: avg {row[1]} ms | p50 {row[4]} | p95 {row[5]} | "
+              f"p99 {row[6]} | max {row[7]} | {row[8]} req/s | {errors} échecs")
+
+
+def _fmt(value):
+    return 'N/A' if value is None else f"{value:.3f}"
+
+
+def _output_name(name, args):
+    # Même convention que benchmark_conc.sh: la stratégie historique garde le nom attendu
+    if name in ('conc', 'post', 'fanout') and args.strategy and args.strategy != 'serial':
+        name = f"{name}_{args.strategy}"
+    if not args.base_url and args.server != 'wsgi':
+        name = f"{name}_{args.server}"
+    return name
+
+
+def _measure(writer, param, workload, concurrency, args):
+    for run in range(1, args.runs + 1):
+        latencies, errors, elapsed = run_load(workload, args.requests, concurrency)
+        writer.add(param, run, latencies, errors, elapsed)
+        if args.pause:
+            time.sleep(args.pause)
+
+
+# ------------------------------------------------------------
+# Benchmarks
+# ------------------------------------------------------------
+def bench_conc(target, args):
+    print("Démarrage du benchmark de Charge...")
+    writer = ResultWriter(_output_name('conc', args))
+    names = target.reseed(posts_per_user=50, followees_per_user=20)
+    workload = TimelineLoad(target.base_url, names, args)
+    for c in CONCURRENCIES:
+        _measure(writer, c, workload, c, args)
+
+
+def bench_post(target, args):
+    print("Démarrage du benchmark sur la Taille des Posts...")
+    writer = ResultWriter(_output_name('post', args))
+    for p in POSTS_PER_USER:
+        names = target.reseed(posts_per_user=p, followees_per_user=20)
+        _measure(writer, p, TimelineLoad(target.base_url, names, args), args.concurrency, args)
+
+
+def bench_fanout(target, args):
+    print("Démarrage du benchmark sur le Fanout...")
+    writer = ResultWriter(_output_name('fanout', args))
+    for f in FANOUTS:
+        names = target.reseed(posts_per_user=100, followees_per_user=f)
+        _measure(writer, f, TimelineLoad(target.base_url, names, args), args.concurrency, args)
+
+
+def bench_write(target, args):
+    print("Démarrage du benchmark des Écritures (/post, /follow)...")
+    for action in ('post', 'follow'):
+        writer = ResultWriter(_output_name(f"write_{action}", args))
+        for c in CONCURRENCIES:
+            # Re-seed à chaque point: les écritures précédentes ne faussent pas le suivant
+            names = target.reseed(posts_per_user=50, followees_per_user=20)
+            _measure(writer, c, WriteLoad(target.base_url, names, args, action), c, args)
+
+
+def bench_modes(target, args):
+    print("Démarrage du benchmark des Modes de service (wsgi, wsgi-sync, asgi)...")
+    if target.app_module is None:
+        raise SystemExit("[Bench] modes compare les serveurs locaux: incompatible avec --base-url.")
+    names = target.reseed(posts_per_user=50, followees_per_user=20)
+    workload = TimelineLoad(None, names, args)
+    for server in SERVERS:
+        target.use(server)
+        workload.base_url = target.base_url
+        writer = ResultWriter(f"modes_{server}")
+        for c in MODE_CONCURRENCIES:
+            _measure(writer, c, workload, c, args)
+
+
+BENCHMARKS = {
+    'conc': bench_conc,
+    'post': bench_post,
+    'fanout': bench_fanout,
+    'write': bench_write,
+    'modes': bench_modes,
+}
+
+
+def main():
+    args = parse_args()
+    target = Target(args)
+    print(f"[Bench] Cible: {target.base_url} | {args.requests} requêtes x {args.runs} runs")
+    try:
+        for name in dict.fromkeys(args.benchmarks):
+            BENCHMARKS[name](target, args)
+    finally:
+        target.close()
+    print(f"[Bench] Terminé. CSV dans {OUT_DIR}/ (transform_csv.py puis plot_results.py).")
+
+
+if __name__ == '__main__':
+    main()
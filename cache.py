@@ -0,0 +1,305 @@
+"""Cache des pages de timeline (TIMELINE_CACHE=off|local|shared).
+
+- local  : LRU en mémoire du processus, avec TTL et budget en octets.
+- shared : cache partagé entre workers/instances via un serveur compatible
+           redis (REDIS_URL). Sans REDIS_URL, une doublure en mémoire est
+           utilisée (tests, dev local). La borne en octets et l'éviction LRU
+           sont alors celles du serveur (maxmemory + allkeys-lru).
+
+Les valeurs sont sérialisées (pickle) avant stockage: la taille comptée est
+celle réellement occupée, et les deux backends se comportent à l'identique.
+
+L'invalidation repose sur une génération par utilisateur incluse dans les
+clés: invalider revient à changer la génération, les anciennes entrées ne
+sont plus jamais lues et disparaissent par LRU/TTL. La génération est lue
+avant le calcul d'une page et la page n'est rangée que sous celle-ci, si
+elle est toujours courante: une page calculée pendant une invalidation
+n'est jamais servie.
+
+FragmentCache garde en plus, par processus, le fragment HTML de timeline
+rendu pour la page d'accueil (FRAGMENT_CACHE_SIZE utilisateurs, LRU).
+"""
+import fnmatch
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class LocalBackend:
+    """LRU en mémoire du processus, avec TTL et budget en octets."""
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()  # clé -> (expiration, valeur)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def _drop(self, key):
+        _, value = self._data.pop(key)
+        self._bytes -= len(key) + len(value)
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes):
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            while self._data and self._bytes + size > self.max_bytes:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._bytes += size
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'local',
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class InMemoryRedis:
+    """Doublure locale du sous-ensemble de l'API redis utilisé par SharedBackend."""
+
+    def __init__(self):
+        self._data = {}  # clé -> (expiration ou None, valeur)
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            entry = self._data.get(name)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[name]
+                return None
+            return value
+
+    def set(self, name, value, ex=None):
+        expires = time.monotonic() + ex if ex else None
+        with self._lock:
+            self._data[name] = (expires, value)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(1 for n in names if self._data.pop(n, None) is not None)
+
+    def scan_iter(self, match='*'):
+        with self._lock:
+            keys = [k for k in self._data if fnmatch.fnmatchcase(k, match)]
+        return iter(keys)
+
+    def info(self, section=None):
+        return {'evicted_keys': 0, 'keys': len(self._data)}
+
+
+class SharedBackend:
+    """Cache partagé via un client compatible redis (get/set/delete/scan_iter)."""
+
+    def __init__(self, redis_client, ttl: float, prefix: str = 'tinyinsta:'):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str):
+        return self.redis.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes):
+        self.redis.set(self.prefix + key, value, ex=max(1, int(self.ttl)))
+
+    def delete(self, key: str):
+        self.redis.delete(self.prefix + key)
+
+    def clear(self):
+        keys = list(self.redis.scan_iter(match=self.prefix + '*'))
+        for i in range(0, len(keys), 500):
+            self.redis.delete(*keys[i:i + 500])
+
+    def stats(self):
+        try:
+            evicted = self.redis.info('stats').get('evicted_keys', 0)
+        except Exception:
+            evicted = None
+        return {'backend': 'shared', 'evictions': evicted}
+
+
+class TimelineCache:
+    """Pages de timeline par utilisateur, invalidées par génération."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def generation(self, user: str) -> bytes:
+        """Génération courante de `user`, à lire avant de calculer une page."""
+        gen_key = f"gen:{user}"
+        gen = self.backend.get(gen_key)
+        if gen is None:
+            # Génération inconnue (jamais posée, invalidée ou évincée): on en
+            # crée une nouvelle pour qu'aucune entrée antérieure ne puisse resservir
+            gen = uuid.uuid4().hex[:12].encode()
+            self.backend.set(gen_key, gen)
+        return gen
+
+    def _key(self, user: str, gen: bytes, parts):
+        return ':'.join(['tl', user, gen.decode()] + [str(p) for p in parts])
+
+    def get(self, user: str, *parts, gen: bytes):
+        """Page rangée sous `gen` (voir generation()), ou None."""
+        raw = self.backend.get(self._key(user, gen, parts))
+        if raw is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return pickle.loads(raw)
+
+    def set(self, user: str, value, *parts, gen: bytes):
+        """Range `value` sous `gen`, lue avant le calcul; False si `user` a été invalidé depuis."""
+        key = self._key(user, gen, parts)
+        if self.backend.get(f"gen:{user}") != gen:
+            self._count('stale')
+            return False
+        self.backend.set(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        # Invalidation entre la vérification et l'écriture: l'entrée reste
+        # sous une génération abandonnée, jamais relue; on la retire
+        if self.backend.get(f"gen:{user}") != gen:
+            self.backend.delete(key)
+            self._count('stale')
+            return False
+        return True
+
+    def invalidate(self, *users: str):
+        for user in users:
+            self.backend.delete(f"gen:{user}")
+        self._count('invalidations', len(users))
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            counters = {'hits': self.hits, 'misses': self.misses,
+                        'invalidations': self.invalidations, 'stale': self.stale}
+        return {**counters, **self.backend.stats()}
+
+
+class FragmentCache:
+    """Fragment HTML rendu par utilisateur, pour une version de sa timeline, éviction LRU.
+
+    Une seule version est gardée par utilisateur: une timeline qui change
+    remplace son fragment, jamais servi pour une autre version.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # utilisateur -> (version, fragment)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user: str, version: str):
+        with self._lock:
+            entry = self._data.get(user)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._data.move_to_end(user)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, user: str, version: str, fragment):
+        with self._lock:
+            self._data[user] = (version, fragment)
+            self._data.move_to_end(user)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+def make_fragment_cache():
+    """Cache des fragments HTML selon FRAGMENT_CACHE_SIZE (None si 0)."""
+    size = int(os.environ.get('FRAGMENT_CACHE_SIZE', '1000'))
+    return FragmentCache(size) if size > 0 else None
+
+
+def make_cache(kind: str = None):
+    """Construit le cache selon TIMELINE_CACHE (None si désactivé)."""
+    kind = kind or os.environ.get('TIMELINE_CACHE', 'off')
+    ttl = float(os.environ.get('TIMELINE_CACHE_TTL', '30'))
+
+    if kind == 'off':
+        return None
+    if kind == 'local':
+        max_bytes = int(os.environ.get('TIMELINE_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+        return TimelineCache(LocalBackend(max_bytes, ttl))
+    if kind == 'shared':
+        url = os.environ.get('REDIS_URL')
+        if url:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("TIMELINE_CACHE=shared avec REDIS_URL nécessite le paquet 'redis'") from e
+            redis_client = redis.Redis.from_url(url)
+        else:
+            redis_client = InMemoryRedis()
+        return TimelineCache(SharedBackend(redis_client, ttl))
+    raise ValueError(f"TIMELINE_CACHE inconnu: {kind}")
@@ -0,0 +1,160 @@
+"""Capture d'un échantillon des requêtes réelles (TRACE_FILE), rejouées par replay.py.
+
+Chaque requête retenue ajoute une ligne NDJSON au fichier de trace:
+
+    {"ts":1760000000.123,"method":"GET","route":"/api/timeline","user":"alice",
+     "params":{"limit":"20"},"status":200,"ms":12.41}
+
+ts est l'heure d'arrivée (epoch, secondes), ms la latence côté serveur
+jusqu'à la réponse. Les paramètres sont ceux de la query string et du
+formulaire, sauf le jeton d'administration; le contenu d'un post est
+remplacé par sa longueur (content_len): la trace ne garde aucun texte.
+
+Seules les routes du trafic utilisateur sont capturées (TRACE_ENDPOINTS:
+pages, timeline, followers, login, post, follow...), jamais /admin ni
+/_ah. L'échantillonnage (TRACE_SAMPLE, fraction) se fait par utilisateur:
+un utilisateur retenu l'est pour toutes ses requêtes, ce qui garde des
+sessions complètes (login puis post, follow puis timeline).
+
+Les lignes sont écrites par paquets de TRACE_FLUSH_LINES, chaque paquet en
+un seul write() sur un fichier ouvert en ajout: plusieurs workers peuvent
+partager le fichier sans entrelacer leurs lignes. `{pid}` dans TRACE_FILE
+donne un fichier par worker. Un arrêt normal écrit le reste (atexit).
+
+Désactivé (TRACE_FILE vide), aucun hook n'est installé.
+"""
+import atexit
+import json
+import os
+import random
+import threading
+import time
+import zlib
+
+# Fichier de trace (vide: capture désactivée); `{pid}` est remplacé par le pid du worker
+TRACE_FILE = os.environ.get('TRACE_FILE', '')
+# Fraction des utilisateurs dont les requêtes sont capturées
+TRACE_SAMPLE = float(os.environ.get('TRACE_SAMPLE', '1'))
+# Lignes gardées en mémoire avant écriture
+TRACE_FLUSH_LINES = int(os.environ.get('TRACE_FLUSH_LINES', '100'))
+# Endpoints Flask capturés (trafic utilisateur)
+TRACE_ENDPOINTS = ('index', 'api_timeline', 'api_followers', 'login', 'logout',
+                   'post', 'follow', 'unfollow')
+
+# Paramètres jamais écrits dans la trace
+_SECRET_PARAMS = ('token',)
+
+
+def sampled(user, rate: float) -> bool:
+    """Vrai si les requêtes de `user` sont capturées (même réponse dans tous les workers)."""
+    if rate >= 1:
+        return True
+    if not user:
+        return random.random() < rate
+    return zlib.crc32(user.encode('utf-8')) / 2 ** 32 < rate
+
+
+def trace_params(args, form=None):
+    """Paramètres d'une requête tels qu'écrits dans la trace."""
+    params = {k: v for k, v in args.items() if k not in _SECRET_PARAMS}
+    for key, value in (form or {}).items():
+        if key == 'content':
+            params['content_len'] = len(value)
+        elif key not in _SECRET_PARAMS:
+            params[key] = value
+    return params
+
+
+class TraceRecorder:
+    """Ajoute les requêtes échantillonnées au fichier de trace, par paquets."""
+
+    def __init__(self, path: str, sample: float, flush_lines: int):
+        self.path = path
+        self.sample = sample
+        self.flush_lines = max(1, flush_lines)
+        self._lock = threading.Lock()
+        self._lines = []
+        self._fd = None
+        self._pid = None
+        self.recorded = 0
+        self.skipped = 0
+        self.written = 0
+
+    def _open(self):
+        # Ouvert dans le worker (après le fork de gunicorn): un fichier par pid si demandé
+        pid = os.getpid()
+        if self._fd is None or self._pid != pid:
+            self._fd = os.open(self.path.replace('{pid}', str(pid)),
+                               os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            self._pid = pid
+        return self._fd
+
+    def record(self, method: str, route: str, user, params, status: int, seconds: float,
+               ts: float = None):
+        """Ajoute une requête terminée à la trace (si son utilisateur est échantillonné)."""
+        if not sampled(user, self.sample):
+            with self._lock:
+                self.skipped += 1
+            return
+        line = json.dumps({'ts': round(ts if ts is not None else time.time() - seconds, 3),
+                           'method': method, 'route': route, 'user': user,
+                           'params': params, 'status': status,
+                           'ms': round(seconds * 1000, 2)},
+                          separators=(',', ':'), ensure_ascii=False)
+        with self._lock:
+            self._lines.append(line)
+            self.recorded += 1
+            if len(self._lines) < self.flush_lines:
+                return
+            lines, self._lines = self._lines, []
+        self._write(lines)
+
+    def _write(self, lines):
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+        with self._lock:
+            os.write(self._open(), data)
+            self.written += len(lines)
+
+    def flush(self):
+        """Écrit tout de suite les lignes en attente."""
+        with self._lock:
+            lines, self._lines = self._lines, []
+        if lines:
+            self._write(lines)
+
+    def init_app(self, app):
+        """Capture les routes TRACE_ENDPOINTS de l'application Flask."""
+        from flask import g, request, session
+
+        @app.before_request
+        def _start_trace():
+            if request.endpoint in TRACE_ENDPOINTS:
+                # Utilisateur lu avant la route: /logout vide la session
+                g.trace_start = (time.time(), time.perf_counter(), session.get('user'))
+
+        @app.after_request
+        def _record_trace(response):
+            start = g.pop('trace_start', None)
+            if start is not None:
+                ts, t0, user = start
+                # /login: celui qui se connecte; sans session: le propriétaire de la timeline
+                user = user or session.get('user') or request.values.get('user')
+                self.record(request.method, request.url_rule.rule, user,
+                            trace_params(request.args, request.form),
+                            response.status_code, time.perf_counter() - t0, ts)
+            return response
+
+    def stats(self):
+        with self._lock:
+            return {'enabled': True, 'path': self.path, 'sample': self.sample,
+                    'recorded': self.recorded, 'skipped': self.skipped,
+                    'written': self.written, 'pending': len(self._lines)}
+
+
+def make_recorder():
+    """Enregistreur selon TRACE_FILE (None si la capture est désactivée)."""
+    if not TRACE_FILE:
+        return None
+    recorder = TraceRecorder(TRACE_FILE, TRACE_SAMPLE, TRACE_FLUSH_LINES)
+    atexit.register(recorder.flush)
+    return recorder
@@ -0,0 +1,179 @@
+"""Formats de réponse de /api/timeline, choisis par l'en-tête Accept ou ?format=.
+
+- json    : application/json (défaut), un seul document.
+- ndjson  : application/x-ndjson, une ligne JSON par post puis une ligne
+            finale {"count", "next_cursor", "user"}. Seul l'encodage change:
+            la page est calculée entière (fusion, condensat de l'ETag) avant
+            l'envoi, et envoyée en un seul corps.
+- msgpack : application/msgpack, encodage binaire compact: dates en
+            millisecondes depuis l'epoch, auteurs internés (chaque nom une
+            seule fois, les posts y renvoient par indice):
+            {"user", "count", "authors": [nom...],
+             "items": [[indice auteur, created ms, content]...], "next_cursor"}
+
+Chaque page a un condensat de son contenu (page_digest, calculé une fois à
+la construction et gardé en cache avec la page). L'ETag d'une réponse en
+dérive avec l'utilisateur et le format: If-None-Match répond 304 sans
+sérialiser la page.
+"""
+import hashlib
+import json
+import struct
+from datetime import datetime, timedelta, timezone
+
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+# Format -> type MIME; l'ordre départage les Accept génériques (*/*: json)
+MIMETYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'msgpack': 'application/msgpack',
+}
+# Types acceptés en plus dans Accept
+_ALIASES = {
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'application/x-msgpack': 'msgpack',
+}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MILLISECOND = timedelta(milliseconds=1)
+
+
+def negotiate(accept: str = None, fmt: str = None):
+    """Format de la réponse ('json', 'ndjson', 'msgpack') ou None si aucun ne convient."""
+    if fmt:
+        return fmt if fmt in MIMETYPES else None
+    if not accept:
+        return 'json'
+    offered = list(MIMETYPES.values()) + list(_ALIASES)
+    best = parse_accept_header(accept, MIMEAccept).best_match(offered)
+    if best is None:
+        return None
+    return _ALIASES.get(best) or next(f for f, m in MIMETYPES.items() if m == best)
+
+
+def _iso(created):
+    # Même rendu que la réponse JSON historique
+    return (created or datetime.utcnow()).isoformat() + 'Z'
+
+
+def _epoch_millis(dt):
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - _EPOCH) // _MILLISECOND
+
+
+# ------------------------------------------------------------
+# ETag
+# ------------------------------------------------------------
+def page_digest(items, next_cursor):
+    """Condensat du contenu d'une page (auteurs, contenus, dates, curseur)."""
+    h = hashlib.blake2b(digest_size=16)
+    for item in items:
+        created = item['created']
+        h.update(f"{item['author']}\0{created.isoformat() if created else ''}\0".encode())
+        h.update((item['content'] or '').encode())
+        h.update(b'\1')
+    h.update((next_cursor or '').encode())
+    return h.hexdigest()
+
+
+def etag(user: str, page, fmt: str):
+    """ETag (sans guillemets) de la page de `user` servie au format `fmt`."""
+    digest = page.get('digest') or page_digest(page['items'], page['next_cursor'])
+    return hashlib.blake2b(f"{user}\0{fmt}\0{digest}".encode(), digest_size=12).hexdigest()
+
+
+# ------------------------------------------------------------
+# NDJSON
+# ------------------------------------------------------------
+def ndjson_page(user: str, page):
+    """Page encodée en NDJSON (bytes): un post par ligne, puis la ligne finale."""
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    lines = [dumps({'author': item['author'], 'content': item['content'],
+                    'created': _iso(item['created'])}) for item in page['items']]
+    lines.append(dumps({'count': len(page['items']), 'next_cursor': page['next_cursor'],
+                        'user': user}))
+    return ('\n'.join(lines) + '\n').encode()
+
+
+# ------------------------------------------------------------
+# msgpack — encodeur du sous-ensemble utilisé (nil, bool, int, str, array, map)
+# ------------------------------------------------------------
+def pack_page(user: str, page):
+    """Page encodée en msgpack, auteurs internés et dates en millisecondes."""
+    authors, index, items = [], {}, []
+    for item in page['items']:
+        author = item['author']
+        i = index.get(author)
+        if i is None:
+            i = index[author] = len(authors)
+            authors.append(author)
+        items.append([i, _epoch_millis(item['created']), item['content']])
+
+    out = bytearray()
+    _pack({'user': user, 'count': len(items), 'authors': authors, 'items': items,
+           'next_cursor': page['next_cursor']}, out)
+    return bytes(out)
+
+
+def _pack(obj, out):
+    if obj is None:
+        out.append(0xc0)
+    elif obj is True or obj is False:
+        out.append(0xc3 if obj else 0xc2)
+    elif isinstance(obj, int):
+        _pack_int(obj, out)
+    elif isinstance(obj, str):
+        data = obj.encode()
+        n = len(data)
+        if n < 32:
+            out.append(0xa0 | n)
+        elif n < 0x100:
+            out += struct.pack('>BB', 0xd9, n)
+        elif n < 0x10000:
+            out += struct.pack('>BH', 0xda, n)
+        else:
+            out += struct.pack('>BI', 0xdb, n)
+        out += data
+    elif isinstance(obj, (list, tuple)):
+        _pack_header(len(obj), 0x90, 0xdc, out)
+        for value in obj:
+            _pack(value, out)
+    elif isinstance(obj, dict):
+        _pack_header(len(obj), 0x80, 0xde, out)
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    else:
+        raise TypeError(f"type non encodable en msgpack: {type(obj).__name__}")
+
+
+def _pack_header(n, fix, base, out):
+    # fixarray/fixmap jusqu'à 15 éléments, puis 16 et 32 bits (base, base + 1)
+    if n < 16:
+        out.append(fix | n)
+    elif n < 0x10000:
+        out += struct.pack('>BH', base, n)
+    else:
+        out += struct.pack('>BI', base + 1, n)
+
+
+def _pack_int(n, out):
+    if 0 <= n < 0x80:
+        out.append(n)
+    elif -32 <= n < 0:
+        out.append(n & 0xff)
+    elif n >= 0:
+        for code, fmt, bound in ((0xcc, '>BB', 1 << 8), (0xcd, '>BH', 1 << 16),
+                                 (0xce, '>BI', 1 << 32), (0xcf, '>BQ', 1 << 64)):
+            if n < bound:
+                out += struct.pack(fmt, code, n)
+                return
+        raise OverflowError(n)
+    else:
+        out += struct.pack('>Bq', 0xd3, n)
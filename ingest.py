@@ -0,0 +1,152 @@
+"""Tampon d'écriture des posts (POST_BUFFER_SIZE > 0).
+
+/post ne fait plus un `put` synchrone par post: le post est ajouté à un
+tampon vidé par un thread de fond, en un seul lot, dès que POST_BUFFER_SIZE
+posts sont en attente ou que le plus ancien attend depuis POST_BUFFER_DELAY
+secondes.
+
+Perte bornée: un post accepté mais pas encore écrit est perdu si le processus
+s'arrête brutalement. Il y en a au plus POST_BUFFER_MAX_PENDING, vieux d'au
+plus POST_BUFFER_DELAY (plus la durée d'une écriture); au-delà, /post attend
+que le tampon se vide. Un arrêt normal vide le tampon (atexit). Les posts
+que `flush_fn` n'a pas écrits (exception, ou index rendus dans son dict
+d'erreurs) sont comptés dans `dropped`, les autres dans `flushed`.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class PostBuffer:
+    """Regroupe des posts et les passe par lots à `flush_fn` depuis un thread de fond."""
+
+    def __init__(self, flush_fn, max_items: int, max_delay: float, max_pending: int):
+        self.flush_fn = flush_fn
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self.max_pending = max(max_pending, max_items)
+        self._items = []
+        self._oldest = None  # time.monotonic() du plus ancien post en attente
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self.accepted = 0
+        self.flushed = 0
+        self.batches = 0
+        self.dropped = 0
+
+    def _start(self):
+        # Démarrage paresseux: le thread naît dans le worker (après le fork de gunicorn)
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='post-buffer', daemon=True)
+            self._thread.start()
+
+    def add(self, entity):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('PostBuffer fermé')
+            self._start()
+            while len(self._items) >= self.max_pending:
+                self._cond.wait()
+            if not self._items:
+                self._oldest = time.monotonic()
+            self._items.append(entity)
+            self.accepted += 1
+            self._cond.notify_all()
+
+    def _take(self):
+        """Attend qu'un lot soit prêt (taille ou délai) et le retire du tampon."""
+        with self._cond:
+            while True:
+                if self._items:
+                    if len(self._items) >= self.max_items or self._closed:
+                        break
+                    remaining = self._oldest + self.max_delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                elif self._closed:
+                    return None
+                else:
+                    self._cond.wait()
+            batch = self._items[:self.max_items]
+            del self._items[:self.max_items]
+            self._oldest = time.monotonic() if self._items else None
+            self._cond.notify_all()
+            return batch
+
+    def _write(self, batch):
+        try:
+            # Erreurs par post ({index dans `batch`: message}), voir main.publish_posts
+            errors = self.flush_fn(batch) or {}
+        except Exception:
+            log.exception("PostBuffer: échec d'écriture de %d posts", len(batch))
+            with self._cond:
+                self.dropped += len(batch)
+            return
+        if errors:
+            failed = sorted(errors)
+            log.error("PostBuffer: %d posts sur %d non écrits (index %s): %s",
+                      len(failed), len(batch), failed, errors[failed[0]])
+        with self._cond:
+            self.flushed += len(batch) - len(errors)
+            self.dropped += len(errors)
+            self.batches += 1
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+            self._write(batch)
+
+    def flush(self):
+        """Écrit immédiatement les posts en attente (dans le thread appelant)."""
+        while True:
+            with self._cond:
+                batch = self._items[:self.max_items]
+                del self._items[:self.max_items]
+                self._oldest = time.monotonic() if self._items else None
+                self._cond.notify_all()
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        # Le thread vide le reste du tampon puis s'arrête
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=30)
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'pending': len(self._items),
+                'accepted': self.accepted,
+                'flushed': self.flushed,
+                'batches': self.batches,
+                'dropped': self.dropped,
+                'max_items': self.max_items,
+                'max_delay': self.max_delay,
+                'max_pending': self.max_pending,
+            }
+
+
+def make_post_buffer(flush_fn):
+    """Construit le tampon selon POST_BUFFER_SIZE (None si désactivé)."""
+    size = int(os.environ.get('POST_BUFFER_SIZE', '0'))
+    if size <= 0:
+        return None
+    delay = float(os.environ.get('POST_BUFFER_DELAY', '0.2'))
+    pending = int(os.environ.get('POST_BUFFER_MAX_PENDING', str(10 * size)))
+    buffer = PostBuffer(flush_fn, size, delay, pending)
+    atexit.register(buffer.close)
+    return buffer
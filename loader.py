@@ -0,0 +1,228 @@
+"""Lecture des entités User et Post: identity map par requête et cache des Users.
+
+Pendant une requête HTTP, chaque User et chaque Post n'est lu qu'une fois:
+les lectures suivantes (timeline_page puis get_timeline, auteurs d'une page
+de followees...) sont servies par la table de la requête, y compris les
+absences. Les lectures multiples sont dédupliquées et groupées en un seul
+get_multi pour les clés encore inconnues.
+
+En option (USER_CACHE_TTL > 0), les Users trouvés sont aussi gardés au
+niveau du processus pendant quelques secondes. Les écritures passant par
+put_user/put_users mettent ce cache à jour; celles des autres workers ne
+sont visibles qu'à l'expiration (ex: le marquage `celebrity`). Les absences
+ne sont pas mises en cache: un utilisateur créé ailleurs est visible tout
+de suite.
+
+Hors requête (thread du tampon /post, seed), pas de table par requête: seul
+le cache du processus s'applique. Les handlers ASGI (asgi.py) ouvrent leur
+table avec open_scope().
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Durée de vie (secondes) des Users dans le cache du processus (0: désactivé)
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '0'))
+# Nombre maximal de Users gardés (éviction LRU)
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+
+# Table de la requête en cours; copiée vers les threads du pool par metrics.bind()
+_current = contextvars.ContextVar('tinyinsta_identity_map', default=None)
+_MISSING = object()
+
+
+class UserCache:
+    """Users récemment lus, avec TTL et éviction LRU."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # nom -> (expiration, entité)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, names):
+        """{nom: entité} pour les noms présents et non expirés."""
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for name in names:
+                entry = self._data.get(name)
+                if entry is None or entry[0] < now:
+                    if entry is not None:
+                        del self._data[name]
+                    self.misses += 1
+                    continue
+                self._data.move_to_end(name)
+                found[name] = entry[1]
+                self.hits += 1
+        return found
+
+    def set_many(self, entities):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for entity in entities:
+                self._data[entity.key.name] = (expires, entity)
+                self._data.move_to_end(entity.key.name)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class _IdentityMap:
+    """Entités lues pendant une requête; None marque une absence connue."""
+
+    def __init__(self):
+        self.users = {}
+        self.posts = {}
+        # Les stratégies concurrentes lisent depuis le pool de threads
+        self.lock = threading.Lock()
+
+
+def open_scope():
+    """Table vide pour la requête courante (hooks Flask, handlers ASGI)."""
+    _current.set(_IdentityMap())
+
+
+class EntityLoader:
+    """Point d'entrée unique des lectures de Users et de Posts par clé.
+
+    Même interface que le stockage (get_user, get_users, get_posts, put_user,
+    put_users): les appelants de main.py n'ont qu'à passer par lui.
+    """
+
+    def __init__(self, store, user_cache: UserCache = None):
+        self.store = store
+        self.user_cache = user_cache
+
+    def init_app(self, app):
+        """Ouvre une table vide au début de chaque requête."""
+
+        @app.before_request
+        def _open_identity_map():
+            open_scope()
+
+        @app.teardown_request
+        def _close_identity_map(exc):
+            _current.set(None)
+
+    # Users
+    def get_user(self, name: str):
+        """Entité User ou None."""
+        found = self._load_users([name])
+        return found.get(name)
+
+    def get_users(self, names):
+        """Entités User existantes parmi `names`, dans l'ordre, sans doublon."""
+        found = self._load_users(names)
+        return [found[n] for n in dict.fromkeys(names) if found.get(n) is not None]
+
+    def _load_users(self, names):
+        scope = _current.get()
+        found, missing = {}, []
+        if scope is not None:
+            with scope.lock:
+                for name in dict.fromkeys(names):
+                    entity = scope.users.get(name, _MISSING)
+                    if entity is _MISSING:
+                        missing.append(name)
+                    else:
+                        found[name] = entity
+        else:
+            missing = list(dict.fromkeys(names))
+
+        if missing and self.user_cache:
+            cached = self.user_cache.get_many(missing)
+            found.update(cached)
+            missing = [n for n in missing if n not in cached]
+        else:
+            cached = {}
+
+        loaded = {}
+        if missing:
+            loaded = {e.key.name: e for e in self.store.get_users(missing)}
+            if self.user_cache and loaded:
+                self.user_cache.set_many(loaded.values())
+            found.update(loaded)
+
+        if scope is not None and (cached or missing):
+            with scope.lock:
+                scope.users.update(cached)
+                scope.users.update(loaded)
+                scope.users.update((n, None) for n in missing if n not in loaded)
+        return found
+
+    def put_user(self, entity):
+        self.store.put_user(entity)
+        self._remember_users([entity])
+
+    def put_users(self, entities):
+        entities = list(entities)
+        self.store.put_users(entities)
+        self._remember_users(entities)
+
+    def _remember_users(self, entities):
+        if self.user_cache:
+            self.user_cache.set_many(entities)
+        scope = _current.get()
+        if scope is not None:
+            with scope.lock:
+                scope.users.update((e.key.name, e) for e in entities)
+
+    # Posts (immuables: seule la table de la requête les garde)
+    def get_posts(self, ids):
+        """Posts existants parmi `ids`, dans l'ordre, sans doublon."""
+        ids = list(dict.fromkeys(ids))
+        scope = _current.get()
+        if scope is None:
+            return self.store.get_posts(ids)
+
+        with scope.lock:
+            missing = [i for i in ids if i not in scope.posts]
+        if missing:
+            loaded = {p.key.id: p for p in self.store.get_posts(missing)}
+            with scope.lock:
+                scope.posts.update((i, loaded.get(i)) for i in missing)
+        with scope.lock:
+            return [scope.posts[i] for i in ids if scope.posts.get(i) is not None]
+
+    def clear(self):
+        """Oublie tout (après /admin/clear)."""
+        if self.user_cache:
+            self.user_cache.clear()
+        scope = _current.get()
+        if scope is not None:
+            with scope.lock:
+                scope.users.clear()
+                scope.posts.clear()
+
+    def stats(self):
+        if not self.user_cache:
+            return {'enabled': False}
+        return {'enabled': True, **self.user_cache.stats()}
+
+
+def make_user_cache():
+    """Cache des Users selon USER_CACHE_TTL (None si désactivé)."""
+    if USER_CACHE_TTL <= 0:
+        return None
+    return UserCache(USER_CACHE_TTL, USER_CACHE_SIZE)
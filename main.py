@@ -1,12 +1,102 @@
-from flask import Flask, request, redirect, url_for, render_template_string, session, jsonify
-from google.cloud import datastore
-from datetime import datetime, timedelta
+# En premier: avec STARTUP_PROFILE=1, les imports suivants sont chronométrés
+import startup
+
+from flask import Flask, Response, request, redirect, url_for, render_template, session, jsonify
+from markupsafe import Markup
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+import base64
+import contextlib
+import contextvars
+import hashlib
+import heapq
+import itertools
+import json
 import os
 import random
+import threading
+
+import admission
+import capture
+import formats
+import metrics
+import purge
+from cache import make_cache, make_fragment_cache
+from ingest import make_post_buffer
+from loader import EntityLoader, make_user_cache
+from storage import BATCH_SIZE, RECENT_POSTS_SIZE, Snapshot, make_storage
 
 app = Flask(__name__)
 app.secret_key = 'dev-key'
-client = datastore.Client()
+# Server-Timing et /admin/metrics (METRICS=1, voir metrics.py)
+metrics.init_app(app)
+# Backend de stockage (STORAGE_BACKEND=datastore|memory, voir storage.py).
+# Le client Datastore n'est construit qu'au premier accès (ou par /_ah/warmup)
+with startup.step('storage'):
+    store = metrics.instrument(make_storage())
+# 0: client Datastore construit et canal ouvert dès l'import (pas de warmup)
+LAZY_INIT = os.environ.get('LAZY_INIT', '1') == '1'
+if not LAZY_INIT:
+    with startup.step('connect'):
+        store.warmup()
+# Lectures de Users/Posts par clé: dédupliquées par requête, Users en cache
+# quelques secondes si USER_CACHE_TTL > 0 (voir loader.py)
+loader = EntityLoader(store, make_user_cache())
+loader.init_app(app)
+
+# Mode de construction de la timeline:
+#  - 'read'  : fan-out-on-read, une requête par followee (défaut)
+#  - 'write' : fan-out-on-write, chaque /post est recopié dans l'inbox des followers
+TIMELINE_MODE = os.environ.get('TIMELINE_MODE', 'read')
+# Au-delà de ce nombre de followers, un auteur est une "célébrité": ses posts
+# ne sont pas recopiés dans les inbox mais lus à la demande (fan-out-on-read)
+CELEBRITY_THRESHOLD = int(os.environ.get('CELEBRITY_THRESHOLD', '1000'))
+# Posts les plus récents d'un followee recopiés dans l'inbox par /follow (et
+# retirés par /unfollow); plus ancien, l'historique est lu en fan-out-on-read
+# sous l'horizon de l'inbox. Aussi la taille des pages de backfill_inbox
+INBOX_BACKFILL_SIZE = int(os.environ.get('INBOX_BACKFILL_SIZE', '100'))
+# Exécution des requêtes par followee:
+#  - 'serial'  : une requête après l'autre (comportement historique)
+#  - 'threads' : requêtes concurrentes sur un pool de threads borné
+#  - 'merge'   : fusion k-way par tas, chaque auteur est lu par petits lots
+#                et seulement tant qu'il peut encore entrer dans le top `limit`
+# Surchargeable par requête via /api/timeline?strategy=... pour les benchmarks
+TIMELINE_STRATEGY = os.environ.get('TIMELINE_STRATEGY', 'serial')
+# Nombre maximal de requêtes Datastore simultanées par worker
+TIMELINE_MAX_WORKERS = int(os.environ.get('TIMELINE_MAX_WORKERS', '16'))
+# Délai (secondes) accordé aux requêtes par followee
+TIMELINE_QUERY_TIMEOUT = float(os.environ.get('TIMELINE_QUERY_TIMEOUT', '5'))
+# 1: on renvoie les posts déjà reçus si des requêtes échouent; 0: erreur 503
+TIMELINE_PARTIAL_RESULTS = os.environ.get('TIMELINE_PARTIAL_RESULTS', '1') == '1'
+# 1: les requêtes par followee sont projetées (clé, created) et seuls les posts
+# retenus sont relus en entier, par lot (hydrate_posts); 0: entités complètes
+TIMELINE_TWO_PHASE = os.environ.get('TIMELINE_TWO_PHASE', '1') == '1'
+# Taille minimale du premier lot lu par auteur dans la stratégie 'merge'
+TIMELINE_MERGE_CHUNK = int(os.environ.get('TIMELINE_MERGE_CHUNK', '5'))
+# Nombre de followees lus (et interrogés) à la fois par get_timeline
+FOLLOW_PAGE_SIZE = int(os.environ.get('FOLLOW_PAGE_SIZE', '100'))
+# Instantanés de timeline: nombre de posts gardés par utilisateur (0: désactivé)
+TIMELINE_SNAPSHOT_SIZE = int(os.environ.get('TIMELINE_SNAPSHOT_SIZE', '0'))
+# Recouvrement (secondes) sous le watermark d'un instantané au rafraîchissement:
+# rattrape les posts dont le created précède de peu leur écriture
+TIMELINE_SNAPSHOT_OVERLAP = float(os.environ.get('TIMELINE_SNAPSHOT_OVERLAP', '2'))
+# Cache des pages de timeline (TIMELINE_CACHE=off|local|shared, voir cache.py)
+timeline_cache = make_cache()
+# Coalescence des requêtes de timeline identiques (TIMELINE_COALESCE) et
+# admission des requêtes de timeline (ADMISSION_*, REQUEST_DEADLINE), voir admission.py
+coalescer = admission.make_coalescer()
+admission_control = admission.make_admission()
+if admission_control:
+    admission_control.init_app(app, ('index', 'api_timeline'))
+# Échantillon des requêtes réelles, rejouable par replay.py (TRACE_FILE, voir capture.py)
+trace_recorder = capture.make_recorder()
+if trace_recorder:
+    trace_recorder.init_app(app)
+# Nombre maximal de posts acceptés par appel à /api/posts
+POST_BULK_MAX = int(os.environ.get('POST_BULK_MAX', '5000'))
+# Nombre de shards par défaut de /admin/shard-posts (auteurs très actifs)
+POST_SHARDS = int(os.environ.get('POST_SHARDS', '8'))
 
 # Template HTML minimal
 TEMPLATE_INDEX = '''
@@ -18,14 +108,16 @@ TEMPLATE_INDEX = '''
     <button>Poster</button>
   </form>
   <h3>Timeline</h3>
-  {% for post in timeline %}
-    <div><b>{{ post['author'] }}</b>: {{ post['content'] }}</div>
-  {% endfor %}
+  {{ timeline_html }}
   <h3>Suivre un utilisateur</h3>
   <form action="/follow" method="post">
     <input name="to_follow" placeholder="Nom d'utilisateur" required>
     <button>Suivre</button>
   </form>
+  <form action="/unfollow" method="post">
+    <input name="to_unfollow" placeholder="Nom d'utilisateur" required>
+    <button>Ne plus suivre</button>
+  </form>
 {% else %}
   <form action="/login" method="post">
     <input name="username" placeholder="Nom d'utilisateur" required>
@@ -34,35 +126,860 @@ TEMPLATE_INDEX = '''
 {% endif %}
 '''
 
+# Lignes de la timeline, rendues à part pour être mises en cache (FragmentCache)
+TEMPLATE_TIMELINE = '''{% for post in timeline %}
+    <div><b>{{ post['author'] }}</b>: {{ post['content'] }}</div>
+  {% endfor %}
+'''
+
+# Compilés une fois au chargement: render_template_string recompile la source
+# à chaque appel. render_template accepte un Template déjà compilé
+with startup.step('templates'):
+    index_template = app.jinja_env.from_string(TEMPLATE_INDEX)
+    timeline_template = app.jinja_env.from_string(TEMPLATE_TIMELINE)
+# Fragment HTML de la timeline par utilisateur (FRAGMENT_CACHE_SIZE, voir cache.py)
+fragment_cache = make_fragment_cache()
+
 # ------------------------------------------------------------
 # TIMELINE — Version stable sans GQL
 # ------------------------------------------------------------
-def get_timeline(user: str, limit: int = 20):
+class TimelineUnavailable(Exception):
+    """Des requêtes par followee ont échoué et les résultats partiels sont refusés."""
+
+
+def author_posts(author: str, limit: int, before=None, timeout: float = None):
+    """Derniers posts d'un auteur (index composite author + shard + created desc).
+
+    Avec TIMELINE_TWO_PHASE, sans contenu: voir hydrate_posts.
+    """
+    posts, _ = store.author_posts(author, limit, before, timeout=timeout,
+                                  keys_only=TIMELINE_TWO_PHASE)
+    return posts
+
+
+def hydrate_posts(posts):
+    """`posts` complétés de leur contenu, relu en un get_multi pour ceux qui n'en ont pas.
+
+    L'ordre est conservé; un post supprimé entre les deux lectures est écarté.
+    """
+    missing = [p.key.id for p in posts if 'content' not in p]
+    if not missing:
+        return posts
+    with metrics.stage('bodies'):
+        full = {p.key.id: p for p in loader.get_posts(missing)}
+    return [p if 'content' in p else full[p.key.id]
+            for p in posts if 'content' in p or p.key.id in full]
+
+
+def _posts_serial(authors, limit, before=None):
+    posts = []
+    for author in authors:
+        posts.extend(author_posts(author, limit, before))
+    return posts
+
+
+def query_timeout():
+    """Délai des requêtes par followee, borné par l'échéance de la requête (REQUEST_DEADLINE)."""
+    return admission.timeout(TIMELINE_QUERY_TIMEOUT)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    # Pool partagé par toutes les requêtes du worker: la concurrence Datastore
+    # reste bornée par TIMELINE_MAX_WORKERS quel que soit le trafic
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=TIMELINE_MAX_WORKERS,
+                                           thread_name_prefix='timeline')
+    return _executor
+
+
+def _run_concurrently(fn, items):
+    """Applique `fn` à chaque élément sur le pool, avec délai et résultats partiels.
+
+    Retourne la liste des résultats dans l'ordre de `items`, avec None pour
+    les appels en échec ou hors délai (voir TIMELINE_PARTIAL_RESULTS).
+    """
+    executor = _get_executor()
+    futures = [executor.submit(metrics.bind(fn), item) for item in items]
+    done, not_done = wait(futures, timeout=query_timeout())
+
+    for f in not_done:
+        f.cancel()
+
+    results = []
+    failed = len(not_done)
+    for f in futures:
+        if f not in done:
+            results.append(None)
+            continue
+        try:
+            results.append(f.result())
+        except Exception:
+            app.logger.exception("Requête timeline en échec")
+            results.append(None)
+            failed += 1
+
+    check_failures(failed, len(items))
+    return results
+
+
+# Échecs de lecture de la timeline en cours de calcul, quand l'appelant les
+# compte (instantanés: une timeline partielle n'est jamais enregistrée)
+_failures = contextvars.ContextVar('tinyinsta_timeline_failures', default=None)
+
+
+def _count_failures(n: int):
+    counter = _failures.get()
+    if counter is not None:
+        counter[0] += n
+
+
+def check_failures(failed: int, total: int):
+    """Applique TIMELINE_PARTIAL_RESULTS quand `failed` requêtes sur `total` ont échoué."""
+    if not failed:
+        return
+    _count_failures(failed)
+    if not TIMELINE_PARTIAL_RESULTS:
+        raise TimelineUnavailable(f"{failed}/{total} requêtes followee en échec")
+    app.logger.warning("Timeline partielle: %d/%d requêtes followee en échec", failed, total)
+
+
+def _posts_threads(authors, limit, before=None):
+    timeout = query_timeout()
+    results = _run_concurrently(
+        lambda author: author_posts(author, limit, before, timeout), authors)
+    return [p for posts in results if posts for p in posts]
+
+
+class _AuthorStream:
+    """Posts d'un auteur du plus récent au plus ancien, lus paresseusement.
+
+    Le premier lot est petit; les suivants doublent de taille et ne sont lus
+    que si la fusion consomme tout le lot courant. Au total un auteur ne
+    fournit jamais plus de `limit` posts.
+    """
+
+    def __init__(self, author: str, chunk: int, limit: int, before=None):
+        self.author = author
+        self._before = before
+        self._chunk = chunk
+        self._remaining = limit
+        self._buffer = []
+        self._cursor = None
+        self._exhausted = False
+        # Calculé dans le thread de la requête: fetch_next tourne sur le pool
+        self._timeout = query_timeout()
+
+    def fetch_next(self):
+        """Lit le lot suivant dans le buffer (un appel RPC)."""
+        size = min(self._chunk, self._remaining)
+        page, self._cursor = store.author_posts(self.author, size, self._before,
+                                                cursor=self._cursor,
+                                                timeout=self._timeout,
+                                                keys_only=TIMELINE_TWO_PHASE)
+        self._buffer.extend(page)
+        self._remaining -= len(page)
+        self._chunk *= 2
+        if len(page) < size or not self._cursor or self._remaining <= 0:
+            self._exhausted = True
+        return self
+
+    def __iter__(self):
+        while True:
+            if not self._buffer:
+                if self._exhausted:
+                    return
+                try:
+                    self.fetch_next()
+                except Exception as e:
+                    _count_failures(1)
+                    if not TIMELINE_PARTIAL_RESULTS:
+                        raise TimelineUnavailable(f"lecture de {self.author} en échec") from e
+                    app.logger.warning("Timeline partielle: lecture de %s en échec", self.author)
+                    return
+                if not self._buffer:
+                    return
+            # Le buffer est court (un lot): pop(0) reste négligeable
+            yield self._buffer.pop(0)
+
+
+def _posts_merge(authors, limit, before=None):
+    if not authors:
+        return []
+    chunk = min(limit, max(TIMELINE_MERGE_CHUNK, -(-limit // len(authors))))
+    streams = [_AuthorStream(author, chunk, limit, before) for author in authors]
+
+    # Le premier lot de chaque auteur est indispensable: on le lit en parallèle
+    primed = _run_concurrently(_AuthorStream.fetch_next, streams)
+    streams = [s for s in primed if s is not None]
+
+    # heapq.merge ne tire sur un flux que lorsque sa tête sort du tas: un
+    # auteur dont les posts sont trop anciens n'est donc jamais relu
+    merged = heapq.merge(*streams, key=_created, reverse=True)
+    return list(itertools.islice(merged, limit))
+
+
+def _posts_recent(authors, limit, before=None):
+    # Une lecture groupée des anneaux (storage.RecentPosts) remplace les
+    # requêtes par auteur. Un anneau contient les derniers posts de l'auteur:
+    # s'il en a au moins `limit` sous le watermark, ce sont les bons; sinon,
+    # si l'auteur a des posts plus anciens (pagination profonde) ou n'a pas
+    # d'anneau, on retombe sur la requête indexée
+    rings = store.recent_posts(authors)
+    posts, fallback = [], []
+    for author in authors:
+        ring = rings.get(author)
+        if ring is None:
+            fallback.append(author)
+            continue
+        selected = [p for p in ring.posts if before is None or p['created'] <= before.created]
+        if len(selected) < limit and ring.truncated:
+            fallback.append(author)
+            continue
+        posts.extend(selected[:limit])
+
+    if fallback:
+        posts.extend(_posts_merge(fallback, limit, before))
+
+    # Seuls les posts retenus dont l'extrait est tronqué sont relus en entier
+    top = heapq.nlargest(limit, posts, key=_created)
+    clipped = [p.key.id for p in top if p.get('clipped')]
+    if clipped:
+        full = {p.key.id: p for p in loader.get_posts(clipped)}
+        top = [full.get(p.key.id, p) for p in top]
+    return top
+
+
+# Stratégies d'exécution des requêtes par followee:
+# (authors, limit, before) -> posts, `before` étant un Watermark ou None
+TIMELINE_STRATEGIES = {
+    'serial': _posts_serial,
+    'threads': _posts_threads,
+    'merge': _posts_merge,
+    'recent': _posts_recent,
+}
+
+
+def get_timeline(user: str, limit: int = 20, strategy: str = None, before=None,
+                 user_entity=None):
+    """Posts des followees de `user` (et les siens), du plus récent au plus ancien.
+
+    `before` (Watermark, voir decode_cursor) restreint aux posts qui suivent
+    la page précédente. `user_entity` évite de relire le User si l'appelant
+    l'a déjà chargé.
+    """
     if not user:
         return []
 
-    user_key = client.key('User', user)
-    user_entity = client.get(user_key)
+    if user_entity is None:
+        user_entity = loader.get_user(user)
 
-    if not user_entity:
+    if user_entity is None:
         return []
 
-    follows = list(set(user_entity.get('follows', []) + [user]))
+    fetch_posts = TIMELINE_STRATEGIES[strategy or TIMELINE_STRATEGY]
+    # Les posts déjà servis au watermark sont relus puis écartés
+    fetch_limit = limit + (len(before.seen) if before else 0)
+
+    posts = None
+    if TIMELINE_SNAPSHOT_SIZE:
+        posts = snapshot_timeline(user, fetch_limit, fetch_posts, before)
+    if posts is None:
+        posts = _collect_timeline(user, fetch_limit, fetch_posts, before)
+
+    # Deuxième phase: le contenu des seuls posts retenus
+    return hydrate_posts(finish_timeline(posts, limit, before))
+
 
+def _collect_timeline(user, limit, fetch_posts, before=None):
+    # Les `limit` posts les plus récents, watermark compris, selon le mode
+    if TIMELINE_MODE == 'write':
+        with metrics.stage('posts'):
+            return _timeline_from_inbox(user, limit, fetch_posts, before)
+
+    return _timeline_from_followees(user, limit, fetch_posts, before)
+
+
+def _timeline_from_followees(user, limit, fetch_posts, before=None):
     # Pas de GQL : trop instable avec IN + ORDER BY sur Datastore en mode standard
+    # Les followees sont lus par pages et on ne garde que le top courant:
+    # la mémoire reste bornée quel que soit le nombre de followees
+    posts = []
+    for authors in followee_pages(user):
+        with metrics.stage('posts'):
+            page_posts = fetch_posts(authors, limit, before)
+        with metrics.stage('merge'):
+            posts = heapq.nlargest(limit, posts + page_posts, key=_created)
+    return posts
+
+
+def finish_timeline(posts, limit: int, before=None):
+    """Écarte les posts déjà servis au watermark et garde les `limit` plus récents."""
+    with metrics.stage('merge'):
+        if before:
+            posts = [p for p in posts if p.key.id not in before.seen]
+
+        # Tri global en mémoire (nécessaire car on merge plusieurs requêtes)
+        return sorted(posts, key=_created, reverse=True)[:limit]
+
+
+def _created(post):
+    return post.get('created')
+
+
+def followee_pages(user: str):
+    """Followees de `user`, lui-même inclus, par pages de FOLLOW_PAGE_SIZE."""
+    pages = store.iter_followee_pages(user, FOLLOW_PAGE_SIZE)
+    with metrics.stage('followees'):
+        first = next(pages, [])
+    yield list(set(first) | {user})
+    while True:
+        with metrics.stage('followees'):
+            page = next(pages, None)
+        if page is None:
+            return
+        yield page
+
+
+def timeline_page(user: str, limit: int = 20, strategy: str = None, cursor: str = None):
+    """Page de timeline sérialisable, servie depuis le cache si possible.
+
+    Retourne {'items': [...], 'next_cursor': ...} ou None si l'utilisateur
+    n'existe pas. Un curseur invalide lève ValueError.
+    """
+    before = decode_cursor(cursor) if cursor else None
+    cache_key = (limit, cursor or '')
+
+    gen = None
+    if timeline_cache:
+        with metrics.stage('cache'):
+            # Lue avant le calcul: une invalidation pendant le calcul l'écarte
+            gen = timeline_cache.generation(user)
+            page = timeline_cache.get(user, *cache_key, gen=gen)
+        if page is not None:
+            return page
+
+    def compute():
+        # Une place d'admission par calcul, pas par requête coalescée
+        with admission_control.admit() if admission_control else contextlib.nullcontext():
+            with metrics.stage('user'):
+                user_entity = loader.get_user(user)
+            if user_entity is None:
+                return None
+
+            entities = get_timeline(user, limit=limit, strategy=strategy, before=before,
+                                    user_entity=user_entity)
+            page = make_page(entities, limit, before)
+
+        if timeline_cache:
+            with metrics.stage('cache'):
+                timeline_cache.set(user, page, *cache_key, gen=gen)
+        return page
+
+    # Requêtes simultanées pour la même page: un seul fan-out (admission.py)
+    if coalescer:
+        return coalescer.do((user, *cache_key, strategy), compute)
+    return compute()
+
+
+def make_page(entities, limit: int, before=None):
+    """Page de timeline sérialisable (mise en cache) à partir des posts.
+
+    `before` est le watermark de la page servie (None pour la première).
+    """
+    items = [{
+        'author': e.get('author'),
+        'content': e.get('content'),
+        'created': e.get('created')
+    } for e in entities]
+    # Page incomplète: plus rien à lire au-delà
+    next_cursor = encode_cursor(entities, before) if len(entities) == limit else None
+    # Condensat gardé avec la page: l'ETag ne demande pas de la relire
+    return {'items': items, 'next_cursor': next_cursor,
+            'digest': formats.page_digest(items, next_cursor)}
+
+
+def timeline_params(args):
+    """(limit, strategy) de /api/timeline; ValueError si la stratégie est inconnue."""
+    try:
+        limit = int(args.get('limit', '20'))
+    except ValueError:
+        limit = 20
+
+    limit = max(1, min(limit, 100))
+
+    strategy = args.get('strategy')
+    if strategy and strategy not in TIMELINE_STRATEGIES:
+        raise ValueError(strategy)
+    return limit, strategy
+
+
+def timeline_json(user: str, page):
+    """Corps JSON de /api/timeline."""
+    with metrics.stage('serialize'):
+        data = [{
+            'author': item['author'],
+            'content': item['content'],
+            'created': (item['created'] or datetime.utcnow()).isoformat() + 'Z'
+        } for item in page['items']]
+
+        return {'user': user, 'count': len(data), 'items': data,
+                'next_cursor': page['next_cursor']}
+
+
+def invalidate_timelines(*users):
+    """Écarte du cache (et des calculs en vol) les timelines des utilisateurs donnés."""
+    if coalescer and users:
+        coalescer.forget(*users)
+    if timeline_cache and users:
+        timeline_cache.invalidate(*users)
+
+
+def invalidate_after_post(author: str):
+    """Invalide la timeline de l'auteur et celles de ses followers.
+
+    Les CELEBRITY_THRESHOLD premiers followers sont invalidés dans la
+    requête; au-delà, le reste l'est hors requête, par pages de followers
+    (voir _invalidate_followers_from).
+    """
+    if not timeline_cache:
+        # Seul un calcul en vol de la timeline de l'auteur peut encore omettre son post
+        invalidate_timelines(author)
+        return
+    followers, cursor = store.followers_page(author, limit=CELEBRITY_THRESHOLD)
+    invalidate_timelines(author, *followers)
+    if cursor:
+        _defer_follower_invalidation(author, cursor)
+
+
+# Invalidations des followers au-delà de CELEBRITY_THRESHOLD: un thread, un
+# parcours par auteur en attente (les posts suivants d'un auteur déjà en
+# attente sont couverts par ce parcours)
+_invalidation_executor = None
+_invalidation_lock = threading.Lock()
+_invalidation_pending = set()
+invalidation_stats = {'authors': 0, 'followers': 0}
+
+
+def _defer_follower_invalidation(author: str, cursor):
+    global _invalidation_executor
+    with _invalidation_lock:
+        if author in _invalidation_pending:
+            return
+        _invalidation_pending.add(author)
+        if _invalidation_executor is None:
+            _invalidation_executor = ThreadPoolExecutor(max_workers=1,
+                                                        thread_name_prefix='invalidate')
+        _invalidation_executor.submit(_invalidate_followers_from, author, cursor)
+
+
+def _invalidate_followers_from(author: str, cursor):
+    """Invalide les followers de `author` à partir de `cursor`, par pages."""
+    with _invalidation_lock:
+        # Un post publié pendant le parcours en relance un
+        _invalidation_pending.discard(author)
+    invalidated = 0
+    try:
+        while cursor:
+            followers, cursor = store.followers_page(author, limit=BATCH_SIZE, cursor=cursor)
+            invalidate_timelines(*followers)
+            invalidated += len(followers)
+    except Exception:
+        app.logger.exception("Invalidation des followers de %s interrompue", author)
+    with _invalidation_lock:
+        invalidation_stats['authors'] += 1
+        invalidation_stats['followers'] += invalidated
+
+
+def wait_invalidations():
+    """Attend la fin des invalidations de followers déjà soumises (tests, arrêt)."""
+    with _invalidation_lock:
+        executor = _invalidation_executor
+    if executor is not None:
+        executor.submit(lambda: None).result()
+
+
+# ------------------------------------------------------------
+# INSTANTANÉS — Timeline matérialisée (TIMELINE_SNAPSHOT_SIZE > 0)
+# ------------------------------------------------------------
+# L'instantané d'un utilisateur garde les ids et dates des
+# TIMELINE_SNAPSHOT_SIZE premiers posts de sa timeline et le created le plus
+# récent couvert (mark). Une première page ne relit que les posts créés
+# après mark - TIMELINE_SNAPSHOT_OVERLAP: anneaux puis requête `created >`
+# par followee sans anneau en fan-out-on-read, inbox et célébrités en
+# fan-out-on-write. Les pages suivantes sont servies par l'instantané tel
+# quel. Quand l'ensemble des followees change (condensat différent, ou
+# /follow et /unfollow qui suppriment l'instantané), il est reconstruit par
+# le chemin complet.
+
+def snapshot_timeline(user: str, limit: int, fetch_posts, before=None):
+    """Les `limit` premiers posts de la timeline servis par l'instantané, ou None.
+
+    None: l'instantané ne suffit pas (page trop profonde, trop grande, lecture
+    en échec) et l'appelant passe par le chemin complet.
+    """
+    if limit > TIMELINE_SNAPSHOT_SIZE:
+        return None
+    with metrics.stage('snapshot'):
+        snapshot = store.get_snapshot(user)
+
+    if before is not None:
+        # La première page a rafraîchi l'instantané: tout ce qui précède le
+        # watermark y est déjà
+        if snapshot is None:
+            return None
+        entries = [e for e in snapshot.entries if e[0] <= before.created]
+        if len(entries) < limit and not snapshot.complete:
+            return None
+        return loader.get_posts([pid for _, pid in entries[:limit]])
+
+    counter = [0]
+    token = _failures.set(counter)
+    try:
+        if snapshot is not None:
+            snapshot = _refresh_snapshot(user, snapshot)
+        if snapshot is None:
+            snapshot = _build_snapshot(user, fetch_posts)
+    finally:
+        _failures.reset(token)
+
+    if counter[0]:
+        # Lecture partielle: servie (TIMELINE_PARTIAL_RESULTS) mais pas enregistrée
+        return None if snapshot is None else loader.get_posts(
+            [pid for _, pid in snapshot.entries[:limit]])
+    with metrics.stage('snapshot'):
+        store.put_snapshot(user, snapshot)
+    return loader.get_posts([pid for _, pid in snapshot.entries[:limit]])
+
+
+def _build_snapshot(user, fetch_posts):
+    # Condensat lu avant les posts: un follow concurrent rendra l'instantané
+    # périmé plutôt que faux
+    followees = _followee_digest(followee_pages(user))
+    posts = _collect_timeline(user, TIMELINE_SNAPSHOT_SIZE, fetch_posts)
+    entries = [(p['created'], p.key.id) for p in posts]
+    return Snapshot(entries, entries[0][0] if entries else _EPOCH, followees,
+                    len(entries) < TIMELINE_SNAPSHOT_SIZE)
+
+
+def _refresh_snapshot(user, snapshot):
+    """Instantané complété des posts postérieurs à son watermark (None: à reconstruire)."""
+    after = snapshot.mark - timedelta(seconds=TIMELINE_SNAPSHOT_OVERLAP)
     posts = []
-    for author in follows:
-        q = client.query(kind='Post')
-        q.add_filter('author', '=', author)
-        q.order = ['-created']
-        posts.extend(list(q.fetch(limit=limit)))
+    pages = []
+    for authors in followee_pages(user):
+        pages.append(authors)
+        with metrics.stage('posts'):
+            if TIMELINE_MODE == 'write':
+                authors = [e.key.name for e in loader.get_users(authors) if e.get('celebrity')]
+            posts = heapq.nlargest(TIMELINE_SNAPSHOT_SIZE, posts + _posts_since(authors, after),
+                                   key=_created)
+    if _followee_digest(pages) != snapshot.followees:
+        return None
+    if TIMELINE_MODE == 'write':
+        with metrics.stage('posts'):
+            posts += loader.get_posts(store.inbox_since(user, after, TIMELINE_SNAPSHOT_SIZE))
+
+    # Un post peut revenir par le recouvrement, ou par l'inbox et une célébrité
+    known = {pid for _, pid in snapshot.entries}
+    fresh = {}
+    for p in posts:
+        if p.key.id not in known:
+            fresh.setdefault(p.key.id, p['created'])
+    if not fresh:
+        return snapshot
+    entries = sorted(snapshot.entries + [(created, pid) for pid, created in fresh.items()],
+                     key=lambda e: e[0], reverse=True)
+    return Snapshot(entries[:TIMELINE_SNAPSHOT_SIZE], max(snapshot.mark, entries[0][0]),
+                    snapshot.followees,
+                    snapshot.complete and len(entries) <= TIMELINE_SNAPSHOT_SIZE)
+
+
+def _posts_since(authors, after):
+    """Posts des `authors` créés après `after` (anneaux, sinon une requête par auteur)."""
+    if not authors:
+        return []
+    posts, rest = [], []
+    rings = store.recent_posts(authors) if RECENT_POSTS_SIZE > 0 else {}
+    for author in authors:
+        ring = rings.get(author)
+        # L'anneau suffit s'il remonte jusqu'à `after`
+        if ring is not None and (not ring.truncated or
+                                 (ring.posts and ring.posts[-1]['created'] <= after)):
+            posts.extend(p for p in ring.posts if p['created'] > after)
+        else:
+            rest.append(author)
+
+    timeout = query_timeout()
+    results = _run_concurrently(
+        lambda author: store.author_posts_since(author, after, TIMELINE_SNAPSHOT_SIZE,
+                                                timeout), rest)
+    posts.extend(p for found in results if found for p in found)
+    return posts
+
+
+def _followee_digest(pages):
+    """Condensat de l'ensemble des followees, indépendant de l'ordre des pages."""
+    total, count = 0, 0
+    for authors in pages:
+        for author in authors:
+            h = hashlib.blake2b(author.encode(), digest_size=8).digest()
+            total = (total + int.from_bytes(h, 'big')) % (1 << 64)
+            count += 1
+    return f"{count}:{total:016x}"
+
+
+def drop_snapshots(*users):
+    """Supprime les instantanés des utilisateurs donnés (followees modifiés)."""
+    if TIMELINE_SNAPSHOT_SIZE and users:
+        store.delete_snapshots(users)
+
+
+# ------------------------------------------------------------
+# PAGINATION — Curseur opaque (watermark sur created)
+# ------------------------------------------------------------
+# Le curseur encode le `created` du dernier post servi et les ids des posts
+# de la page qui partagent exactement ce `created`. La page suivante relit
+# chaque auteur à partir de ce watermark (created <= watermark) en écartant
+# ces ids: seules les nouvelles entités sont lues, et les posts publiés entre
+# deux pages, plus récents que le watermark, ne décalent pas la pagination.
+# Quand une page entière partage le `created` du watermark, les ids déjà
+# écartés sont reportés: un groupe d'ex aequo plus grand que `limit` est
+# servi une fois, page après page.
+
+Watermark = namedtuple('Watermark', ['created', 'seen'])
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _epoch_micros(dt: datetime) -> int:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - _EPOCH) // timedelta(microseconds=1)
+
+
+def encode_cursor(posts, before=None):
+    """Curseur de la page suivant `posts` (triés du plus récent au plus ancien).
+
+    `before` est le watermark de la page `posts` (None pour la première).
+    """
+    last = posts[-1].get('created')
+    seen = [p.key.id for p in posts if p.get('created') == last]
+    if before is not None and _epoch_micros(last) == _epoch_micros(before.created):
+        seen = sorted(before.seen.union(seen))
+    payload = json.dumps({'w': _epoch_micros(last), 's': seen}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str) -> Watermark:
+    """Décode un curseur produit par encode_cursor (ValueError si invalide)."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+        created = _EPOCH + timedelta(microseconds=int(payload['w']))
+        seen = frozenset(int(i) for i in payload['s'])
+    except (TypeError, KeyError, ValueError, OverflowError) as e:
+        raise ValueError('invalid cursor') from e
+    return Watermark(created, seen)
+
+
+# ------------------------------------------------------------
+# INBOX — Fan-out-on-write (TIMELINE_MODE=write)
+# ------------------------------------------------------------
+# Chaque post est recopié (par référence) dans l'inbox de l'auteur et de ses
+# followers: la lecture de la timeline devient une seule requête bornée.
+
+def fanout_post(post):
+    """Recopie un post dans l'inbox de son auteur et de ses followers.
 
-    # Tri global en mémoire (nécessaire car on merge plusieurs requêtes)
-    posts = sorted(posts, key=lambda p: p.get('created'), reverse=True)[:limit]
+    Les auteurs au-delà de CELEBRITY_THRESHOLD followers sont marqués
+    `celebrity` et ne sont plus recopiés: leurs posts sont lus à la demande.
+    """
+    return fanout_posts([post])
 
+
+def fanout_posts(posts):
+    """fanout_post pour un lot: les followers sont lus une fois par auteur."""
+    by_author = {}
+    for post in posts:
+        by_author.setdefault(post['author'], []).append(post)
+
+    items = []
+    for author_entity in loader.get_users(list(by_author)):
+        if author_entity.get('celebrity'):
+            continue
+        author = author_entity.key.name
+
+        followers = store.followers(author, limit=CELEBRITY_THRESHOLD + 1)
+        if len(followers) > CELEBRITY_THRESHOLD:
+            author_entity['celebrity'] = True
+            loader.put_user(author_entity)
+            continue
+
+        owners = set(followers) | {author}
+        items.extend((owner, post) for post in by_author[author] for owner in owners)
+
+    store.put_inbox(items)
+    return len(items)
+
+
+def author_history(author: str):
+    """Tous les posts d'un auteur, par pages de INBOX_BACKFILL_SIZE (clé, author, created)."""
+    cursor = None
+    while True:
+        page, cursor = store.author_posts(author, INBOX_BACKFILL_SIZE, cursor=cursor,
+                                          keys_only=TIMELINE_TWO_PHASE)
+        if page:
+            yield page
+        if len(page) < INBOX_BACKFILL_SIZE or not cursor:
+            return
+
+
+def _author_window(author: str):
+    """(INBOX_BACKFILL_SIZE derniers posts de `author`, created du plus ancien
+    si l'auteur en a d'autres, sinon None)."""
+    posts, cursor = store.author_posts(author, INBOX_BACKFILL_SIZE,
+                                       keys_only=TIMELINE_TWO_PHASE)
+    truncated = cursor and len(posts) == INBOX_BACKFILL_SIZE
+    return posts, posts[-1]['created'] if truncated else None
+
+
+def raise_inbox_horizon(user: str, horizon):
+    """Avance l'horizon de l'inbox de `user`: elle n'est complète qu'au-dessus.
+
+    Les pages qui descendent jusqu'à l'horizon sont lues en fan-out-on-read
+    (voir _timeline_from_inbox). L'horizon ne recule jamais.
+    """
+    entity = store.get_user(user)
+    if entity is None:
+        return
+    current = entity.get('inbox_horizon')
+    if current is None or current < horizon:
+        entity['inbox_horizon'] = horizon
+        loader.put_user(entity)
+
+
+def copy_into_inbox(user: str, authors):
+    """Recopie les derniers posts des `authors` (hors célébrités) dans l'inbox de `user`.
+
+    Au plus INBOX_BACKFILL_SIZE posts par auteur: le coût d'un /follow est
+    borné quel que soit l'historique du followee. S'il a des posts plus
+    anciens, l'horizon de l'inbox avance jusqu'au plus ancien recopié.
+    """
+    copied = 0
+    for entity in loader.get_users(authors):
+        if entity.get('celebrity'):
+            continue
+        posts, horizon = _author_window(entity.key.name)
+        store.put_inbox([(user, post) for post in posts])
+        copied += len(posts)
+        if horizon is not None:
+            raise_inbox_horizon(user, horizon)
+    return copied
+
+
+def remove_from_inbox(user: str, author: str):
+    """Retire de l'inbox de `user` les derniers posts de `author` (après /unfollow).
+
+    Même fenêtre que copy_into_inbox: les posts plus anciens de `author`
+    restent sous l'horizon, où l'inbox n'est plus lue.
+    """
+    posts, horizon = _author_window(author)
+    store.remove_from_inbox([(user, post) for post in posts])
+    if horizon is not None:
+        raise_inbox_horizon(user, horizon)
+    return len(posts)
+
+
+def backfill_inbox(user_entity):
+    """Reconstruit l'inbox d'un utilisateur à partir de ses follows existants.
+
+    Tout l'historique des followees est recopié (hors requête, voir /admin/seed).
+    """
+    user = user_entity.key.name
+    total = 0
+    for authors in followee_pages(user):
+        for entity in loader.get_users(authors):
+            if entity.get('celebrity'):
+                continue
+            for posts in author_history(entity.key.name):
+                store.put_inbox([(user, post) for post in posts])
+                total += len(posts)
+    return total
+
+
+def _timeline_from_inbox(user, limit, fetch_posts, before=None):
+    # Les célébrités ne sont pas dans l'inbox: on les lit comme en fan-out-on-read
+    posts = loader.get_posts(store.inbox(user, limit, before))
+    for authors in followee_pages(user):
+        celebrities = [e.key.name for e in loader.get_users(authors) if e.get('celebrity')]
+        if celebrities:
+            posts = _top_unique(posts + fetch_posts(celebrities, limit, before), limit)
+    posts = _top_unique(posts, limit)
+
+    # Sous l'horizon, l'inbox peut manquer de posts (historique non recopié
+    # au /follow) ou en garder (non retirés à l'/unfollow): la page est
+    # alors lue en fan-out-on-read
+    horizon = loader.get_user(user).get('inbox_horizon')
+    if horizon is not None and (len(posts) < limit or posts[-1]['created'] <= horizon):
+        return _timeline_from_followees(user, limit, fetch_posts, before)
     return posts
 
 
+def _top_unique(posts, limit):
+    # Un auteur devenu célébrité peut encore avoir d'anciens posts dans
+    # l'inbox: les doublons sont écartés avant de tronquer, sinon ils
+    # prendraient la place de posts de la page
+    unique = {p.key.id: p for p in posts}
+    return heapq.nlargest(limit, unique.values(), key=_created)
+
+
+# ------------------------------------------------------------
+# PUBLICATION — Écriture des posts par lots (/api/posts, tampon de /post)
+# ------------------------------------------------------------
+
+def publish_post(entity):
+    """Écrit un post seul (/post sans tampon): anneau, inbox et cache à jour."""
+    store.put_post(entity)
+    store.push_recent([entity])
+    if TIMELINE_MODE == 'write':
+        fanout_post(entity)
+    invalidate_after_post(entity['author'])
+
+
+def publish_posts(entities):
+    """Écrit des posts par lots transactionnels, puis les diffuse.
+
+    Retourne les erreurs par post ({index dans `entities`: message}): un lot
+    en échec n'est pas écrit du tout et n'empêche pas les lots suivants.
+    """
+    written, errors = [], {}
+    for start in range(0, len(entities), BATCH_SIZE):
+        batch = entities[start:start + BATCH_SIZE]
+        try:
+            store.put_posts(batch, atomic=True)
+        except Exception as e:
+            errors.update((start + i, str(e) or type(e).__name__) for i in range(len(batch)))
+            continue
+        written.extend(batch)
+
+    store.push_recent(written)
+    if written and TIMELINE_MODE == 'write':
+        fanout_posts(written)
+    for author in {p['author'] for p in written}:
+        invalidate_after_post(author)
+    return errors
+
+
+# Tampon d'écriture de /post (POST_BUFFER_SIZE > 0, voir ingest.py)
+post_buffer = make_post_buffer(publish_posts)
+
+
 # ------------------------------------------------------------
 # SEED — Fonction interne (utilisée par la route /admin/seed)
 # ------------------------------------------------------------
@@ -72,23 +989,14 @@ def seed_data(users: int = 5, posts: int = 30,
 
     user_names = [f"{prefix}{i}" for i in range(1, users + 1)]
 
-    # Création des utilisateurs
-    created_users = 0
-    for name in user_names:
-        key = client.key('User', name)
-        entity = client.get(key)
-        if entity is None:
-            entity = datastore.Entity(key)
-            entity['follows'] = []
-            client.put(entity)
-            created_users += 1
+    # Création des utilisateurs: une lecture groupée, puis les manquants
+    existing = {e.key.name for e in loader.get_users(user_names)}
+    new_users = [store.new_user(name) for name in user_names if name not in existing]
+    loader.put_users(new_users)
+    created_users = len(new_users)
 
     # Relations de follow
     for name in user_names:
-        key = client.key('User', name)
-        entity = client.get(key)
-        
-        if not entity: continue
 
         others = [u for u in user_names if u != name]
 
@@ -105,26 +1013,29 @@ def seed_data(users: int = 5, posts: int = 30,
         selection = random.sample(others, target)
 
         # On fusionne avec les existants pour ne pas écraser si on re-seed
-        existing_follows = set(entity.get('follows', []))
+        existing_follows = set(store.followees(name))
         new_follows = sorted(list(existing_follows.union(set(selection))))
         
-        entity['follows'] = new_follows
-        client.put(entity)
+        store.set_follows({name: new_follows})
 
     # Posts
     created_posts = 0
     base_time = datetime.utcnow()
 
-    for i in range(posts):
-        author = random.choice(user_names)
-        p = datastore.Entity(client.key('Post'))
-        p.update({
-            'author': author,
-            'content': f"Seed post {i+1} by {author}",
-            'created': base_time - timedelta(seconds=i)
-        })
-        client.put(p)
-        created_posts += 1
+    for start in range(0, posts, BATCH_SIZE):
+        batch = []
+        for i in range(start, min(start + BATCH_SIZE, posts)):
+            author = random.choice(user_names)
+            batch.append(store.new_post(author, f"Seed post {i+1} by {author}",
+                                        base_time - timedelta(seconds=i)))
+        store.put_posts(batch)
+        store.push_recent(batch)
+        if TIMELINE_MODE == 'write':
+            fanout_posts(batch)
+        created_posts += len(batch)
+
+    # Posts antidatés: le rafraîchissement des instantanés ne les verrait pas
+    drop_snapshots(*user_names)
 
     return {
         'users_total': users,
@@ -141,8 +1052,32 @@ def seed_data(users: int = 5, posts: int = 30,
 @app.route('/')
 def index():
     user = session.get('user')
-    timeline = get_timeline(user) if user else []
-    return render_template_string(TEMPLATE_INDEX, user=user, timeline=timeline)
+    page = timeline_page(user) if user else None
+    return render_template(index_template, user=user, timeline_html=timeline_html(user, page))
+
+
+def timeline_html(user: str, page):
+    """Fragment HTML de la timeline, rendu une fois par version de la page.
+
+    La version est le condensat de la page (formats.page_digest), qui doit
+    donc être calculée avant: seul le rendu est économisé. Sans cache de
+    timeline (TIMELINE_CACHE=off, défaut) ni instantanés, chaque / refait le
+    fan-out complet; avec l'un des deux, un rechargement ne coûte que la
+    lecture de la page et ce test.
+    """
+    if page is None:
+        return ''
+    version = page.get('digest') or formats.page_digest(page['items'], page['next_cursor'])
+    if fragment_cache:
+        with metrics.stage('render'):
+            fragment = fragment_cache.get(user, version)
+        if fragment is not None:
+            return fragment
+    with metrics.stage('render'):
+        fragment = Markup(timeline_template.render(timeline=page['items']))
+    if fragment_cache:
+        fragment_cache.set(user, version, fragment)
+    return fragment
 
 
 @app.route('/api/timeline')
@@ -151,36 +1086,168 @@ def api_timeline():
     if not user:
         return jsonify({"error": "missing user"}), 400
 
-    # Vérification simple de l'existence de l'utilisateur
-    if not client.get(client.key('User', user)):
+    # json (défaut), ndjson ou msgpack selon ?format= ou Accept (voir formats.py)
+    fmt = formats.negotiate(request.headers.get('Accept'), request.args.get('format'))
+    if fmt is None:
+        return jsonify({"error": "unsupported format",
+                        "formats": sorted(formats.MIMETYPES.values())}), 406
+
+    try:
+        limit, strategy = timeline_params(request.args)
+    except ValueError:
+        return jsonify({"error": "unknown strategy",
+                        "strategies": sorted(TIMELINE_STRATEGIES)}), 400
+
+    try:
+        page = timeline_page(user, limit=limit, strategy=strategy,
+                             cursor=request.args.get('cursor'))
+    except ValueError:
+        return jsonify({"error": "invalid cursor"}), 400
+
+    # Vérification simple de l'existence de l'utilisateur (faite par timeline_page)
+    if page is None:
         return jsonify({"error": "unknown user"}), 404
 
+    etag = formats.etag(user, page, fmt)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif fmt == 'ndjson':
+        with metrics.stage('serialize'):
+            response = Response(formats.ndjson_page(user, page), mimetype=formats.MIMETYPES[fmt])
+    elif fmt == 'msgpack':
+        with metrics.stage('serialize'):
+            response = Response(formats.pack_page(user, page), mimetype=formats.MIMETYPES[fmt])
+    else:
+        response = jsonify(timeline_json(user, page))
+    response.set_etag(etag)
+    response.vary.add('Accept')
+    return response
+
+
+@app.route('/api/followers')
+def api_followers():
+    """Followers d'un utilisateur, paginés via l'index inverse"""
+    user = request.args.get('user') or session.get('user')
+    if not user:
+        return jsonify({"error": "missing user"}), 400
+
     try:
-        limit = int(request.args.get('limit', '20'))
+        limit = int(request.args.get('limit', '100'))
     except ValueError:
-        limit = 20
+        limit = 100
 
-    limit = max(1, min(limit, 100))
-    entities = get_timeline(user, limit=limit)
+    limit = max(1, min(limit, 1000))
 
-    data = [{
-        'author': e.get('author'),
-        'content': e.get('content'),
-        'created': (e.get('created') or datetime.utcnow()).isoformat() + 'Z'
-    } for e in entities]
+    try:
+        names, next_cursor = store.followers_page(user, limit=limit,
+                                                  cursor=request.args.get('cursor'))
+    except ValueError:
+        return jsonify({"error": "invalid cursor"}), 400
 
-    return jsonify({'user': user, 'count': len(data), 'items': data})
+    return jsonify({'user': user, 'count': len(names), 'items': names,
+                    'next_cursor': next_cursor})
 
 
-@app.route('/admin/seed', methods=['POST'])
-def admin_seed():
-    """Route pour seeder via API (alternative au script local)"""
+_NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+
+def _bulk_items():
+    """Posts du corps de /api/posts: tableau JSON ou NDJSON (un objet par ligne).
+
+    Le NDJSON est lu en flux; une ligne invalide ne rejette que cet élément.
+    """
+    if request.mimetype in _NDJSON_TYPES:
+        for line in request.stream:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield ValueError('invalid json')
+        return
+
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        raise ValueError('expected a JSON array or NDJSON')
+    yield from items
+
+
+@app.route('/api/posts', methods=['POST'])
+def api_posts():
+    """Publication de plusieurs posts en un appel, écrits par lots (put_multi)"""
+    user = session.get('user')
+    admin = _admin_allowed()
+    if not user and not admin:
+        return jsonify({"error": "forbidden"}), 403
+
+    results, entities, indexes = [], [], []
+    try:
+        for index, item in enumerate(_bulk_items()):
+            if index >= POST_BULK_MAX:
+                return jsonify({"error": "too many posts", "max": POST_BULK_MAX}), 413
+
+            error = None
+            if not isinstance(item, dict):
+                error = str(item) if isinstance(item, ValueError) else 'expected an object'
+            elif not isinstance(item.get('content'), str) or not item['content']:
+                error = 'missing content'
+            elif item.get('author') is not None and (not isinstance(item['author'], str)
+                                                     or not item['author']):
+                error = 'invalid author'
+            else:
+                # Publier au nom d'un autre utilisateur demande le SEED_TOKEN
+                author = item.get('author') or user
+                if not author:
+                    error = 'missing author'
+                elif author != user and not admin:
+                    error = 'forbidden author'
+
+            if error:
+                results.append({'index': index, 'error': error})
+                continue
+            results.append({'index': index})
+            indexes.append(index)
+            entities.append(store.new_post(author, item['content'], datetime.utcnow()))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    errors = publish_posts(entities)
+    for i, (index, entity) in enumerate(zip(indexes, entities)):
+        if i in errors:
+            results[index]['error'] = errors[i]
+        else:
+            results[index]['id'] = entity.key.id
+
+    failed = sum(1 for r in results if 'error' in r)
+    return jsonify({'created': len(results) - failed, 'failed': failed,
+                    'results': results})
+
+
+@app.errorhandler(TimelineUnavailable)
+def timeline_unavailable(e):
+    return jsonify({"error": "timeline unavailable", "detail": str(e)}), 503
+
+
+@app.errorhandler(admission.Overloaded)
+def overloaded(e):
+    # Délestage: refus immédiat plutôt qu'une attente jusqu'au délai du client
+    return jsonify({"error": "overloaded", "detail": str(e)}), 503, \
+        {'Retry-After': admission.RETRY_AFTER}
+
+
+def _admin_allowed():
+    """Vérifie le SEED_TOKEN (header X-Seed-Token ou paramètre token)."""
     expected = os.environ.get('SEED_TOKEN')
     provided = request.headers.get('X-Seed-Token') \
         or request.args.get('token') \
         or request.form.get('token')
+    return not expected or provided == expected
+
 
-    if expected and provided != expected:
+@app.route('/admin/seed', methods=['POST'])
+def admin_seed():
+    """Route pour seeder via API (alternative au script local)"""
+    if not _admin_allowed():
         return jsonify({'error': 'forbidden'}), 403
 
     def _int(name, default):
@@ -206,49 +1273,264 @@ def admin_seed():
         prefix=prefix
     )
 
+    if timeline_cache:
+        timeline_cache.clear()
+
     return jsonify({'status': 'ok', **result})
 
 
 @app.route('/admin/clear', methods=['POST'])
 def admin_clear():
-    """Route pour nettoyer la base de données"""
-    expected = os.environ.get('SEED_TOKEN')
-    provided = request.headers.get('X-Seed-Token') \
-        or request.args.get('token') \
-        or request.form.get('token')
+    """Supprime toutes les données en tâche de fond (?wait=1: dans la requête)"""
+    if not _admin_allowed():
+        return jsonify({'error': 'forbidden'}), 403
+
+    # Users, Posts, Inbox (fan-out-on-write), arêtes Follow/Follower, anneaux et
+    # table des shards: pages de clés supprimées en parallèle (purge.py)
+    if request.values.get('wait') == '1':
+        deleted = purge.PurgeJob(store, on_done=_forget_cleared).run()
+        return jsonify({
+            "status": "ok",
+            "users_deleted": deleted['users'],
+            "posts_deleted": deleted['posts'],
+            "inbox_deleted": deleted['inbox'],
+            "follows_deleted": deleted['follows'],
+            "followers_deleted": deleted['followers'],
+            "recent_deleted": deleted['recent'],
+            "shards_deleted": deleted['shards'],
+            "snapshots_deleted": deleted['snapshots']
+        })
 
-    if expected and provided != expected:
+    job, started = purge.start_job(store, on_done=_forget_cleared)
+    return jsonify({'status': 'started' if started else 'running', 'job': job.status()}), 202
+
+
+@app.route('/admin/clear/status')
+def admin_clear_status():
+    """Progression de la suppression lancée par /admin/clear (dans ce worker)"""
+    if not _admin_allowed():
         return jsonify({'error': 'forbidden'}), 403
 
-    # Suppression des Users
-    q_users = client.query(kind='User')
-    users_keys = [e.key for e in q_users.fetch()]
-    if users_keys:
-        client.delete_multi(users_keys)
+    job = purge.current_job()
+    if job is None:
+        return jsonify({'state': 'idle'})
+    return jsonify(job.status())
+
+
+def _forget_cleared():
+    # Caches vidés à la fin de la suppression (même interrompue)
+    loader.clear()
+    if timeline_cache:
+        timeline_cache.clear()
+
+
+@app.route('/admin/backfill-inbox', methods=['POST'])
+def admin_backfill_inbox():
+    """Construit les inbox (fan-out-on-write) à partir des follows existants"""
+    if not _admin_allowed():
+        return jsonify({'error': 'forbidden'}), 403
 
-    # Suppression des Posts
-    q_posts = client.query(kind='Post')
-    posts_keys = [e.key for e in q_posts.fetch()]
-    if posts_keys:
-        client.delete_multi(posts_keys)
+    only = request.values.get('user')
+    if only:
+        entity = loader.get_user(only)
+        users = [entity] if entity is not None else []
+    else:
+        users = store.iter_users()
+
+    users_done = 0
+    items_written = 0
+    for entity in users:
+        items_written += backfill_inbox(entity)
+        users_done += 1
+
+    if timeline_cache:
+        timeline_cache.clear()
 
     return jsonify({
-        "status": "ok",
-        "users_deleted": len(users_keys),
-        "posts_deleted": len(posts_keys)
+        'status': 'ok',
+        'users': users_done,
+        'inbox_items': items_written
     })
 
 
+@app.route('/admin/backfill-recent', methods=['POST'])
+def admin_backfill_recent():
+    """Reconstruit les anneaux de posts récents depuis l'index author + shard + created"""
+    if not _admin_allowed():
+        return jsonify({'error': 'forbidden'}), 403
+
+    only = request.values.get('user')
+    names = [only] if only else (e.key.name for e in store.iter_users())
+
+    authors = 0
+    batch = []
+    for name in names:
+        batch.append(name)
+        if len(batch) == BATCH_SIZE:
+            authors += store.rebuild_recent(batch)
+            batch = []
+    if batch:
+        authors += store.rebuild_recent(batch)
+
+    return jsonify({'status': 'ok', 'authors': authors})
+
+
+@app.route('/admin/shard-posts', methods=['POST'])
+def admin_shard_posts():
+    """Répartit les posts d'un auteur très actif sur plusieurs shards (1: annule)"""
+    if not _admin_allowed():
+        return jsonify({'error': 'forbidden'}), 403
+
+    user = request.values.get('user')
+    try:
+        shards = int(request.values.get('shards', POST_SHARDS))
+    except ValueError:
+        shards = 0
+    if not user or shards < 1:
+        return jsonify({'error': 'missing user or invalid shards'}), 400
+    if loader.get_user(user) is None:
+        return jsonify({'error': 'unknown user'}), 404
+
+    updated = store.shard_posts(user, shards)
+    return jsonify({'status': 'ok', 'author': user, 'shards': shards, 'posts_updated': updated})
+
+
+@app.route('/admin/backfill-followers', methods=['POST'])
+def admin_backfill_followers():
+    """Reconstruit l'index inverse des followers à partir des arêtes Follow"""
+    if not _admin_allowed():
+        return jsonify({'error': 'forbidden'}), 403
+
+    edges = store.rebuild_follower_index()
+    return jsonify({'status': 'ok', 'edges': edges})
+
+
+@app.route('/admin/migrate-follows', methods=['POST'])
+def admin_migrate_follows():
+    """Convertit les listes User.follows (ancien format) en arêtes Follow/Follower"""
+    if not _admin_allowed():
+        return jsonify({'error': 'forbidden'}), 403
+
+    edges = store.migrate_follows()
+
+    if timeline_cache:
+        timeline_cache.clear()
+
+    return jsonify({'status': 'ok', 'edges': edges})
+
+
+@app.route('/admin/migrate-posts', methods=['POST'])
+def admin_migrate_posts():
+    """Réécrit une page de posts avec le contenu hors index (compressé au-delà du seuil) et un shard"""
+    if not _admin_allowed():
+        return jsonify({'error': 'forbidden'}), 403
+
+    try:
+        limit = int(request.values.get('limit', 1000))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return jsonify({'error': 'invalid limit'}), 400
+
+    # Une page par appel: on rappelle avec next_cursor jusqu'à ce qu'il soit nul
+    scanned, updated, next_cursor = store.migrate_posts(request.values.get('cursor') or None,
+                                                        limit)
+    return jsonify({'status': 'ok', 'scanned': scanned, 'updated': updated,
+                    'next_cursor': next_cursor})
+
+
+@app.route('/admin/cache')
+def admin_cache():
+    """Compteurs du cache de timeline (hits, misses, évictions...) et du cache des Users"""
+    if not _admin_allowed():
+        return jsonify({'error': 'forbidden'}), 403
+
+    with _invalidation_lock:
+        deferred = {**invalidation_stats, 'pending': len(_invalidation_pending)}
+    extra = {'users': loader.stats(),
+             'fragments': fragment_cache.stats() if fragment_cache else {'enabled': False},
+             'deferred_invalidations': deferred}
+    if not timeline_cache:
+        return jsonify({'enabled': False, **extra})
+    return jsonify({'enabled': True, **timeline_cache.stats(), **extra})
+
+
+@app.route('/admin/admission')
+def admin_admission():
+    """Compteurs de la coalescence des timelines et du contrôle d'admission"""
+    if not _admin_allowed():
+        return jsonify({'error': 'forbidden'}), 403
+
+    return jsonify({
+        'coalescing': coalescer.stats() if coalescer else {'enabled': False},
+        'admission': admission_control.stats() if admission_control else {'enabled': False},
+    })
+
+
+@app.route('/_ah/warmup')
+def warmup():
+    """Requête de préchauffage App Engine: client Datastore, canal gRPC et pools prêts
+    avant le premier trafic (inbound_services: warmup dans app.yaml)"""
+    with startup.step('warmup'):
+        timings = store.warmup()
+        _get_executor()
+    return jsonify({'status': 'ok', 'timings': timings, 'storage': store.connect_timings})
+
+
+@app.route('/admin/startup')
+def admin_startup():
+    """Profil du démarrage (STARTUP_PROFILE=1): imports par module, étapes, connexion"""
+    if not _admin_allowed():
+        return jsonify({'error': 'forbidden'}), 403
+
+    return jsonify({**startup.report(request.args.get('top', 25, type=int)),
+                    'lazy_init': LAZY_INIT, 'storage': store.connect_timings})
+
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    """Métriques du processus au format texte Prometheus (METRICS=1)"""
+    if not _admin_allowed():
+        return jsonify({'error': 'forbidden'}), 403
+
+    if not metrics.ENABLED:
+        return jsonify({'enabled': False})
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/admin/post-buffer', methods=['GET', 'POST'])
+def admin_post_buffer():
+    """Compteurs du tampon d'écriture de /post; POST le vide immédiatement"""
+    if not _admin_allowed():
+        return jsonify({'error': 'forbidden'}), 403
+
+    if not post_buffer:
+        return jsonify({'enabled': False})
+    if request.method == 'POST':
+        post_buffer.flush()
+    return jsonify({'enabled': True, **post_buffer.stats()})
+
+
+@app.route('/admin/trace', methods=['GET', 'POST'])
+def admin_trace():
+    """Compteurs de la capture des requêtes; POST écrit les lignes en attente"""
+    if not _admin_allowed():
+        return jsonify({'error': 'forbidden'}), 403
+
+    if not trace_recorder:
+        return jsonify({'enabled': False})
+    if request.method == 'POST':
+        trace_recorder.flush()
+    return jsonify(trace_recorder.stats())
+
+
 @app.route('/login', methods=['POST'])
 def login():
     username = request.form['username']
-    key = client.key('User', username)
 
     # Création auto si inexistant à la connexion (feature simpliste)
-    if not client.get(key):
-        entity = datastore.Entity(key)
-        entity['follows'] = []
-        client.put(entity)
+    if loader.get_user(username) is None:
+        loader.put_user(store.new_user(username))
 
     session['user'] = username
     return redirect(url_for('index'))
@@ -267,13 +1549,13 @@ def post():
         return redirect(url_for('index'))
 
     content = request.form['content']
-    entity = datastore.Entity(client.key('Post'))
-    entity.update({
-        'author': user,
-        'content': content,
-        'created': datetime.utcnow()
-    })
-    client.put(entity)
+    entity = store.new_post(user, content, datetime.utcnow())
+    if post_buffer:
+        # Écrit (et diffusé) en lot par le thread de fond, voir ingest.py
+        post_buffer.add(entity)
+        return redirect(url_for('index'))
+
+    publish_post(entity)
     return redirect(url_for('index'))
 
 
@@ -285,18 +1567,37 @@ def follow():
     if not user or user == to_follow:
         return redirect(url_for('index'))
 
-    user_key = client.key('User', user)
-    user_entity = client.get(user_key)
+    if store.add_follow(user, to_follow):
+        # Fan-out-on-write: les posts récents du nouveau followee rejoignent l'inbox
+        if TIMELINE_MODE == 'write':
+            copy_into_inbox(user, [to_follow])
+        drop_snapshots(user)
+        invalidate_timelines(user)
+
+    return redirect(url_for('index'))
+
+
+@app.route('/unfollow', methods=['POST'])
+def unfollow():
+    user = session.get('user')
+    to_unfollow = request.form['to_unfollow']
 
-    if user_entity and to_follow not in user_entity.get('follows', []):
-        if 'follows' not in user_entity:
-            user_entity['follows'] = []
-        user_entity['follows'].append(to_follow)
-        client.put(user_entity)
+    if not user or user == to_unfollow:
+        return redirect(url_for('index'))
+
+    if store.remove_follow(user, to_unfollow):
+        if TIMELINE_MODE == 'write':
+            remove_from_inbox(user, to_unfollow)
+        drop_snapshots(user)
+        invalidate_timelines(user)
 
     return redirect(url_for('index'))
 
 
+# Fin de l'initialisation du module (profil journalisé si STARTUP_PROFILE=1)
+startup.ready()
+
+
 if __name__ == '__main__':
     # Ceci est utilisé pour le développement local.
     # En prod avec Gunicorn, ce bloc n'est pas exécuté, mais l'app est importée.
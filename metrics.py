@@ -0,0 +1,294 @@
+"""Instrumentation des requêtes (METRICS=1).
+
+Par requête: durée de chaque étape du chemin chaud (user, followees, posts,
+merge, serialize...), nombre d'appels au stockage et d'entités lues, renvoyés
+dans l'en-tête Server-Timing. Agrégé par processus: histogrammes de latence
+par route, durée cumulée par étape et compteurs par opération de stockage,
+au format texte Prometheus (/admin/metrics).
+
+Un appel au stockage correspond à une RPC Datastore, sauf pour les
+itérateurs (iter_users...) dont chaque élément est compté comme lu.
+
+Désactivé, stage() renvoie un contexte vide partagé, aucun hook Flask n'est
+installé et le stockage n'est pas enveloppé: le coût se limite à un test de
+booléen par étape.
+"""
+import contextlib
+import contextvars
+import functools
+import os
+import threading
+import time
+import types
+
+ENABLED = os.environ.get('METRICS', '0') == '1'
+
+# Bornes (secondes) des histogrammes de latence par route
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Mesures de la requête en cours; copiées vers les threads du pool via bind()
+_current = contextvars.ContextVar('tinyinsta_request_stats', default=None)
+_NULL = contextlib.nullcontext()
+
+
+class RequestStats:
+    """Mesures d'une requête: étapes (s), appels et entités du stockage."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.calls = 0
+        self.entities = 0
+        self.storage_time = 0.0
+        # Les requêtes par followee peuvent s'exécuter sur plusieurs threads
+        self._lock = threading.Lock()
+
+    def add_stage(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_call(self, seconds, entities):
+        with self._lock:
+            self.calls += 1
+            self.entities += entities
+            self.storage_time += seconds
+
+    def server_timing(self, total):
+        # Le temps de stockage est cumulé sur tous les threads: il peut
+        # dépasser `total` avec les stratégies concurrentes
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        parts.append(f'storage;dur={self.storage_time * 1000:.2f};'
+                     f'desc="calls={self.calls} entities={self.entities}"')
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ', '.join(parts)
+
+
+class _Stage:
+    __slots__ = ('stats', 'name', 't0')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.t0
+        self.stats.add_stage(self.name, seconds)
+        registry.observe_stage(self.name, seconds)
+
+
+def stage(name: str):
+    """Contexte qui chronomètre une étape de la requête en cours."""
+    if not ENABLED:
+        return _NULL
+    stats = _current.get()
+    if stats is None:
+        return _NULL
+    return _Stage(stats, name)
+
+
+def bind(fn):
+    """`fn` exécutée dans une copie du contexte courant (à soumettre à un pool)."""
+    if not ENABLED:
+        return fn
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+# ------------------------------------------------------------
+# Agrégats du processus — format texte Prometheus
+# ------------------------------------------------------------
+class Registry:
+    """Compteurs et histogrammes agrégés sur toutes les requêtes du processus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}   # (route, status) -> n
+        self.latency = {}    # route -> [compteurs par borne..., +Inf, somme]
+        self.stages = {}     # étape -> [somme (s), n]
+        self.storage = {}    # opération -> [appels, entités, somme (s)]
+
+    def observe_request(self, route, status, seconds):
+        with self._lock:
+            key = (route, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            hist = self.latency.setdefault(route, [0] * (len(BUCKETS) + 1) + [0.0])
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    hist[i] += 1
+                    break
+            else:
+                hist[len(BUCKETS)] += 1
+            hist[-1] += seconds
+
+    def observe_stage(self, name, seconds):
+        with self._lock:
+            entry = self.stages.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def observe_storage(self, op, seconds, entities):
+        with self._lock:
+            entry = self.storage.setdefault(op, [0, 0, 0.0])
+            entry[0] += 1
+            entry[1] += entities
+            entry[2] += seconds
+
+    def render(self):
+        with self._lock:
+            requests = dict(self.requests)
+            latency = {route: list(h) for route, h in self.latency.items()}
+            stages = {name: list(e) for name, e in self.stages.items()}
+            storage = {op: list(e) for op, e in self.storage.items()}
+
+        lines = [
+            '# HELP tinyinsta_requests_total Requêtes HTTP traitées, par route et statut.',
+            '# TYPE tinyinsta_requests_total counter',
+        ]
+        for (route, status), n in sorted(requests.items()):
+            lines.append(f'tinyinsta_requests_total{{route="{_escape(route)}",status="{status}"}} {n}')
+
+        lines += [
+            '# HELP tinyinsta_request_duration_seconds Latence des requêtes HTTP, par route.',
+            '# TYPE tinyinsta_request_duration_seconds histogram',
+        ]
+        for route, hist in sorted(latency.items()):
+            label = f'route="{_escape(route)}"'
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ('+Inf',), hist[:-1]):
+                cumulative += n
+                lines.append(f'tinyinsta_request_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'tinyinsta_request_duration_seconds_sum{{{label}}} {hist[-1]:.6f}')
+            lines.append(f'tinyinsta_request_duration_seconds_count{{{label}}} {cumulative}')
+
+        lines += [
+            '# HELP tinyinsta_stage_duration_seconds Durée des étapes du chemin chaud.',
+            '# TYPE tinyinsta_stage_duration_seconds summary',
+        ]
+        for name, (total, n) in sorted(stages.items()):
+            lines.append(f'tinyinsta_stage_duration_seconds_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'tinyinsta_stage_duration_seconds_count{{stage="{name}"}} {n}')
+
+        for metric, index, help_text in (
+                ('tinyinsta_storage_calls_total', 0, 'Appels au stockage (RPC Datastore), par opération.'),
+                ('tinyinsta_storage_entities_total', 1, 'Entités lues ou écrites, par opération.'),
+                ('tinyinsta_storage_duration_seconds_total', 2, 'Durée cumulée des appels au stockage.')):
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+            for op, entry in sorted(storage.items()):
+                value = f'{entry[index]:.6f}' if index == 2 else entry[index]
+                lines.append(f'{metric}{{op="{op}"}} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+# ------------------------------------------------------------
+# Stockage instrumenté
+# ------------------------------------------------------------
+def _count(result):
+    """Nombre d'entités (ou de clés) d'un résultat de méthode de stockage."""
+    if hasattr(result, 'key'):
+        return 1
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        return len(result[0])   # (page, curseur)
+    if isinstance(result, dict):
+        return len(result)      # une entité par clé (ex: recent_posts)
+    return 0
+
+
+class InstrumentedStorage:
+    """Enveloppe un Storage: chaque appel est chronométré et compté."""
+
+    def __init__(self, store):
+        self._store = store
+
+    def _record(self, op, seconds, entities):
+        registry.observe_storage(op, seconds, entities)
+        stats = _current.get()
+        if stats is not None:
+            stats.add_call(seconds, entities)
+
+    def _iterate(self, op, iterator):
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self._record(op, time.perf_counter() - t0, len(item) if isinstance(item, list) else 1)
+            yield item
+
+    def __getattr__(self, name):
+        attr = getattr(self._store, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            t0 = time.perf_counter()
+            result = attr(*args, **kwargs)
+            if isinstance(result, types.GeneratorType):
+                return self._iterate(name, result)
+            self._record(name, time.perf_counter() - t0, _count(result))
+            return result
+
+        # Mis en cache sur l'instance: __getattr__ n'est plus appelé ensuite
+        setattr(self, name, call)
+        return call
+
+
+def instrument(store):
+    """`store` enveloppé si METRICS=1, inchangé sinon."""
+    return InstrumentedStorage(store) if ENABLED else store
+
+
+# ------------------------------------------------------------
+# Intégration Flask (et handlers ASGI, voir asgi.py)
+# ------------------------------------------------------------
+def start_request():
+    """Ouvre les mesures de la requête courante."""
+    if ENABLED:
+        _current.set(RequestStats())
+
+
+def finish_request(route: str, status: int):
+    """Clôt les mesures de la requête: valeur de Server-Timing ou None."""
+    stats = _current.get()
+    if stats is None:
+        return None
+    total = time.perf_counter() - stats.start
+    registry.observe_request(route, status, total)
+    return stats.server_timing(total)
+
+
+def init_app(app):
+    """Installe les hooks de mesure (rien si METRICS est désactivé)."""
+    if not ENABLED:
+        return
+    from flask import request
+
+    @app.before_request
+    def _start_request():
+        start_request()
+
+    @app.after_request
+    def _finish_request(response):
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        timing = finish_request(route, response.status_code)
+        if timing is not None:
+            response.headers['Server-Timing'] = timing
+        return response
+
+    @app.teardown_request
+    def _clear_request(exc):
+        # Les threads du serveur sont réutilisés d'une requête à l'autre
+        _current.set(None)
@@ -23,6 +23,12 @@ PLOTS_TO_GENERATE = [
         'param_name': 'Nombre de followees par utilisateur',
         'output_png': 'fanout.png'
     },
+    {
+        'file': 'replay.csv',
+        'title': 'Temps moyen par requête selon la Route (rejeu de trace)',
+        'param_name': 'Route',
+        'output_png': 'replay.png'
+    },
 ]
 
 # --- Fonction de Plotting ---
@@ -92,7 +98,7 @@ if __name__ == '__main__':
     if not os.path.exists(OUTPUT_DIR):
         print(f"Répertoire '{OUTPUT_DIR}' non trouvé. Assurez-vous que les CSV y sont stockés.")
         
-    # Boucle sur les trois configurations
+    # Boucle sur les configurations
     for plot_config in PLOTS_TO_GENERATE:
         generate_plot(plot_config)
     
@@ -0,0 +1,190 @@
+"""Suppression en masse de toutes les données (/admin/clear, seed.py --clean).
+
+    python purge.py [--backend datastore] [--workers 8]
+
+Chaque kind (storage.CLEAR_KINDS) est parcouru par une requête keys-only
+suivie par curseur, une page de BATCH_SIZE clés à la fois: aucune entité
+n'est lue et la mémoire reste bornée quelle que soit la taille de la base.
+Chaque page est supprimée (delete_multi) sur un pool de PURGE_WORKERS
+threads pendant que la page suivante est lue; au plus PURGE_MAX_IN_FLIGHT
+lots sont en cours à la fois.
+
+Reprise: la suppression est idempotente et une requête ne renvoie que les
+entités restantes. Après une interruption (instance arrêtée, lot en échec),
+relancer la même commande reprend là où les données s'arrêtent.
+
+Depuis /admin/clear, la suppression tourne dans un thread de fond du worker
+(un seul job à la fois par processus); sa progression se lit sur
+/admin/clear/status, servi par le même worker.
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from storage import CLEAR_KINDS, make_storage
+
+log = logging.getLogger(__name__)
+
+# Nombre de threads supprimant des lots en parallèle
+PURGE_WORKERS = int(os.environ.get('PURGE_WORKERS', '8'))
+# Nombre maximal de lots lus mais pas encore supprimés (défaut: 2 x workers)
+PURGE_MAX_IN_FLIGHT = int(os.environ.get('PURGE_MAX_IN_FLIGHT', str(2 * PURGE_WORKERS)))
+
+
+class PurgeJob:
+    """Supprime toutes les données de `store` et suit la progression."""
+
+    def __init__(self, store, workers: int = PURGE_WORKERS,
+                 max_in_flight: int = PURGE_MAX_IN_FLIGHT, on_done=None):
+        self.store = store
+        self.workers = workers
+        self.max_in_flight = max(max_in_flight, workers)
+        self.on_done = on_done
+        self.state = 'pending'
+        self.kind = None
+        self.deleted = {name: 0 for name, _ in CLEAR_KINDS}
+        self.batches = 0
+        self.error = None
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def run(self, report=None):
+        """Supprime tout dans le thread appelant; `report(job)` est appelé après chaque lot."""
+        self.state = 'running'
+        self.started = time.monotonic()
+        try:
+            if self.store.paged_clear:
+                with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='purge') as pool:
+                    for name, kind in CLEAR_KINDS:
+                        self.kind = name
+                        self._purge_kind(pool, name, kind, report)
+            else:
+                # Backend mémoire: clear() est instantané
+                self._add(self.store.clear())
+            self.state = 'done'
+        except Exception as e:
+            self.state = 'failed'
+            self.error = str(e)
+            raise
+        finally:
+            self.kind = None
+            self.finished = time.monotonic()
+            if self.on_done:
+                self.on_done()
+        return dict(self.deleted)
+
+    def _purge_kind(self, pool, name, kind, report):
+        in_flight = set()
+
+        def collect(futures):
+            for f in futures:
+                in_flight.discard(f)
+                self._add({name: f.result()})
+                if report:
+                    report(self)
+
+        try:
+            for keys, _ in self.store.key_pages(kind):
+                if len(in_flight) >= self.max_in_flight:
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                in_flight.add(pool.submit(self.store.delete_keys, keys))
+        finally:
+            # Les lots déjà soumis sont menés à terme, même après une erreur
+            wait(in_flight)
+        collect(list(in_flight))
+
+    def _add(self, counts):
+        with self._lock:
+            for name, n in counts.items():
+                self.deleted[name] = self.deleted.get(name, 0) + n
+            self.batches += 1
+
+    def start(self):
+        """Lance run() dans un thread de fond (les erreurs sont journalisées)."""
+        def target():
+            try:
+                self.run()
+            except Exception:
+                log.exception("Suppression en masse interrompue")
+        threading.Thread(target=target, name='purge-job', daemon=True).start()
+
+    def status(self):
+        with self._lock:
+            deleted = dict(self.deleted)
+            batches = self.batches
+        end = self.finished or time.monotonic()
+        elapsed = end - self.started if self.started else 0.0
+        total = sum(deleted.values())
+        return {
+            'state': self.state,
+            'kind': self.kind,
+            'deleted': deleted,
+            'total': total,
+            'batches': batches,
+            'elapsed': round(elapsed, 3),
+            'rate': round(total / elapsed) if elapsed > 0 else 0,
+            'error': self.error,
+        }
+
+
+# ------------------------------------------------------------
+# Job de fond du processus (/admin/clear)
+# ------------------------------------------------------------
+_job = None
+_job_lock = threading.Lock()
+
+
+def start_job(store, on_done=None):
+    """Lance la suppression en fond, sauf si un job tourne déjà: (job, lancé)."""
+    global _job
+    with _job_lock:
+        if _job is not None and _job.state in ('pending', 'running'):
+            return _job, False
+        _job = PurgeJob(store, on_done=on_done)
+        _job.state = 'running'
+        _job.start()
+        return _job, True
+
+
+def current_job():
+    """Dernier job lancé par ce processus (None si aucun)."""
+    return _job
+
+
+def run_with_progress(job, label, interval: float = 5):
+    """Exécute `job` en affichant la progression toutes les `interval` secondes."""
+    last = [time.monotonic()]
+
+    def report(job):
+        now = time.monotonic()
+        if now - last[0] >= interval:
+            last[0] = now
+            status = job.status()
+            print(f"[{label}] {status['kind']}: {status['total']} entités supprimées, "
+                  f"{status['rate']} entités/s")
+
+    return job.run(report=report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Supprime toutes les données TinyInsta.")
+    parser.add_argument('--backend', type=str, default=None,
+                        help="Backend de stockage (datastore|memory, défaut: $STORAGE_BACKEND ou datastore)")
+    parser.add_argument('--workers', type=int, default=PURGE_WORKERS, help="Nombre de threads de suppression")
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help="Nombre maximal de lots en cours de suppression (défaut: 2 x workers)")
+    args = parser.parse_args()
+
+    job = PurgeJob(make_storage(args.backend), workers=args.workers,
+                   max_in_flight=args.max_in_flight or 2 * args.workers)
+    run_with_progress(job, 'Purge')
+    print(f"[Purge] Terminé: {job.status()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""Rejoue une trace de requêtes capturée en production (TRACE_FILE, voir capture.py).
+
+    python replay.py trace.ndjson [trace-2.ndjson ...] [--speed 2 | --rate 200]
+
+Les requêtes sont envoyées en boucle ouverte: chacune part à son instant
+d'origine (décalage depuis la première, divisé par --speed), que les
+précédentes aient répondu ou non. Une latence est comptée depuis cet
+instant prévu: un serveur (ou un client) saturé allonge les latences au
+lieu de ralentir la charge. --rate fixe plutôt le débit moyen visé.
+
+Par défaut la cible est l'application locale (même serveur que
+benchmark.py: --server, --storage-latency) seedée de façon déterministe
+(--users, --posts-per-user, --followees-per-user, --distribution). Les
+utilisateurs de la trace sont alors projetés sur les utilisateurs seedés
+(même nom de trace -> même utilisateur seedé), y compris dans les
+paramètres user, username, to_follow et to_unfollow. Avec --no-seed, les
+noms de la trace sont gardés.
+
+Chaque utilisateur est connecté avant le début de la mesure (le /login
+d'une session commencée avant la capture n'est pas dans la trace). Le
+contenu des posts est synthétique, de la longueur d'origine. Les curseurs
+de pagination désignent des posts de production: ils sont retirés, sauf
+--keep-cursors.
+
+Résultats: out/replay.csv (format long de benchmark.py, une ligne par route
+et par run, PARAM = route, plus ALL) et out/replay_hist.csv, lus par
+transform_csv.py puis plot_results.py.
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.parse
+import zlib
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark import SERVERS, ResultWriter, Target, _call, _opener, _percentile
+from workload import DISTRIBUTIONS
+
+# Paramètres dont la valeur est un nom d'utilisateur
+USER_PARAMS = ('user', 'username', 'to_follow', 'to_unfollow')
+# Retard (s) du répartiteur au-delà duquel une requête est comptée en retard
+LATE_THRESHOLD = 0.01
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Rejoue une trace capturée (capture.py).")
+    parser.add_argument('traces', nargs='+', help="Fichiers de trace (NDJSON), fusionnés sur ts")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="Facteur d'accélération (2: deux fois plus vite que l'original)")
+    parser.add_argument('--rate', type=float, default=None,
+                        help="Débit moyen visé (req/s), à la place de --speed")
+    parser.add_argument('--max-requests', type=int, default=None,
+                        help="Nombre maximal de requêtes rejouées (les premières de la trace)")
+    parser.add_argument('--max-in-flight', type=int, default=256,
+                        help="Requêtes en vol au plus côté client (au-delà, l'attente compte dans la latence)")
+    parser.add_argument('--runs', type=int, default=1, help="Nombre de rejeux de la trace")
+    parser.add_argument('--name', type=str, default='replay',
+                        help="Nom des CSV de résultats (out/<nom>.csv)")
+    parser.add_argument('--keep-cursors', action='store_true',
+                        help="Garder les curseurs de pagination de la trace")
+    parser.add_argument('--base-url', type=str, default=None,
+                        help="Serveur à mesurer (défaut: application locale dans ce processus)")
+    parser.add_argument('--server', type=str, default='wsgi', choices=SERVERS,
+                        help="Serveur local: wsgi, wsgi-sync ou asgi (défaut: wsgi)")
+    parser.add_argument('--storage-latency', type=float, default=0,
+                        help="Délai (ms) ajouté à chaque appel au stockage de l'application locale")
+    parser.add_argument('--backend', type=str, default=None,
+                        help="Backend seedé avec --base-url (défaut: $STORAGE_BACKEND ou datastore)")
+    parser.add_argument('--no-seed', action='store_true',
+                        help="Ne pas seeder et garder les noms d'utilisateurs de la trace")
+    parser.add_argument('--users', type=int, default=1000, help="Nombre d'utilisateurs seedés")
+    parser.add_argument('--prefix', type=str, default='user', help="Préfixe des usernames")
+    parser.add_argument('--posts-per-user', type=int, default=50, help="Posts seedés par utilisateur")
+    parser.add_argument('--followees-per-user', type=int, default=20,
+                        help="Followees seedés par utilisateur")
+    parser.add_argument('--seed', type=int, default=42, help="Graine du seed")
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='uniform',
+                        help="Graphe seedé: uniform ou zipf (voir workload.py)")
+    parser.add_argument('--workers', type=int, default=8, help="Threads d'écriture du seed")
+    parser.add_argument('--timeout', type=float, default=30, help="Délai maximal d'une requête (secondes)")
+    return parser.parse_args()
+
+
+# ------------------------------------------------------------
+# Trace — lecture, projection des utilisateurs, calendrier
+# ------------------------------------------------------------
+def load_trace(paths, max_requests=None):
+    """Requêtes des fichiers de trace, triées par heure d'arrivée."""
+    events = []
+    for path in paths:
+        with open(path) as f:
+            events.extend(json.loads(line) for line in f if line.strip())
+    events.sort(key=lambda e: e['ts'])
+    return events[:max_requests] if max_requests else events
+
+
+def user_mapper(names):
+    """Fonction nom de la trace -> utilisateur seedé (déterministe), ou identité si `names` est vide."""
+    if not names:
+        return lambda user: user
+    return lambda user: user and names[zlib.crc32(user.encode('utf-8')) % len(names)]
+
+
+def schedule(events, speed=1.0, rate=None):
+    """Décalage (s) de l'envoi de chaque requête depuis le début du rejeu."""
+    if not events:
+        return []
+    t0 = events[0]['ts']
+    duration = events[-1]['ts'] - t0
+    if rate:
+        # Débit moyen d'origine ramené à `rate`; une trace instantanée part d'un bloc
+        speed = rate * duration / len(events) if duration > 0 else float('inf')
+    return [(e['ts'] - t0) / speed for e in events]
+
+
+class Request:
+    """Requête rejouée: méthode, route, paramètres, utilisateur de la session."""
+    __slots__ = ('method', 'route', 'params', 'user')
+
+    def __init__(self, event, map_user, keep_cursors, i):
+        self.method = event['method']
+        self.route = event['route']
+        self.user = map_user(event.get('user'))
+        params = dict(event.get('params') or {})
+        for key in USER_PARAMS:
+            if params.get(key):
+                params[key] = map_user(params[key])
+        if not keep_cursors:
+            params.pop('cursor', None)
+        if 'content_len' in params:
+            # Contenu synthétique de la longueur d'origine
+            size = int(params.pop('content_len'))
+            params['content'] = f"Replay post {i} ".ljust(size, 'x')[:size]
+        self.params = params
+
+
+# ------------------------------------------------------------
+# Rejeu — boucle ouverte
+# ------------------------------------------------------------
+class Replayer:
+    """Envoie les requêtes à leur instant prévu sur un pool de `max_in_flight` threads."""
+
+    def __init__(self, base_url, requests, offsets, args):
+        self.base_url = base_url
+        self.requests = requests
+        self.offsets = offsets
+        self.max_in_flight = args.max_in_flight
+        self.timeout = args.timeout
+        self._sessions = {}
+
+    def login_all(self):
+        """Connecte chaque utilisateur de la trace (hors mesure)."""
+        users = sorted({r.user for r in self.requests if r.user})
+
+        def login(user):
+            opener = _opener()
+            _call(opener, f"{self.base_url}/login", {'username': user}, self.timeout)
+            return user, opener
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            self._sessions = dict(pool.map(login, users))
+
+    def _send(self, request, due):
+        opener = self._sessions.get(request.user) or _opener()
+        url = f"{self.base_url}{request.route}"
+        if request.method == 'GET':
+            if request.params:
+                url += '?' + urllib.parse.urlencode(request.params)
+            ok = _call(opener, url, timeout=self.timeout)
+        else:
+            ok = _call(opener, url, request.params, self.timeout)
+        # Depuis l'instant prévu: l'attente d'un thread libre compte
+        return (time.perf_counter() - due) * 1000, ok
+
+    def run(self):
+        """Un rejeu: ({route: (latences ms, échecs)}, durée s, requêtes parties en retard)."""
+        results = defaultdict(lambda: ([], [0]))
+        lock = threading.Lock()
+        late = 0
+
+        def fire(request, due):
+            ms, ok = self._send(request, due)
+            with lock:
+                latencies, errors = results[request.route]
+                latencies.append(ms)
+                errors[0] += not ok
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_in_flight,
+                                thread_name_prefix='replay') as pool:
+            for request, offset in zip(self.requests, self.offsets):
+                due = start + offset
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -LATE_THRESHOLD:
+                    late += 1
+                pool.submit(fire, request, due)
+        elapsed = time.perf_counter() - start
+        return {route: (lat, err[0]) for route, (lat, err) in results.items()}, elapsed, late
+
+
+def _summary(events):
+    """Latences serveur enregistrées dans la trace, par route (ms)."""
+    recorded = defaultdict(list)
+    for e in events:
+        recorded[e['route']].append(e['ms'])
+    return {route: sorted(ms) for route, ms in recorded.items()}
+
+
+def main():
+    args = parse_args()
+    events = load_trace(args.traces, args.max_requests)
+    if not events:
+        raise SystemExit("[Replay] Trace vide.")
+
+    target = Target(args)
+    try:
+        names = target.reseed(args.posts_per_user, args.followees_per_user) \
+            if target.store is not None else []
+        map_user = user_mapper(names)
+        requests = [Request(e, map_user, args.keep_cursors, i) for i, e in enumerate(events)]
+        offsets = schedule(events, args.speed, args.rate)
+        routes = [route for route, _ in Counter(r.route for r in requests).most_common()]
+        print(f"[Replay] Cible: {target.base_url} | {len(requests)} requêtes sur "
+              f"{offsets[-1]:.1f} s | {len({r.user for r in requests if r.user})} utilisateurs")
+
+        replayer = Replayer(target.base_url, requests, offsets, args)
+        replayer.login_all()
+        writer = ResultWriter(args.name)
+        original = _summary(events)
+        for run in range(1, args.runs + 1):
+            results, elapsed, late = replayer.run()
+            for route in routes:
+                latencies, errors = results.get(route, ([], 0))
+                writer.add(route, run, latencies, errors, elapsed)
+                print(f"    (trace: p50 {_percentile(original[route], 50)} | "
+                      f"p95 {_percentile(original[route], 95)} ms côté serveur)")
+            writer.add('ALL', run, [ms for lat, _ in results.values() for ms in lat],
+                       sum(err for _, err in results.values()), elapsed)
+            if late:
+                print(f"  {late} requêtes parties avec plus de {LATE_THRESHOLD * 1000:.0f} ms "
+                      f"de retard: calendrier non tenu par ce client")
+    finally:
+        target.close()
+    print(f"[Replay] Terminé. CSV dans out/{args.name}.csv (transform_csv.py puis plot_results.py).")
+
+
+if __name__ == '__main__':
+    main()
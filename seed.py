@@ -1,177 +1,360 @@
 import argparse
+import json
+import os
 import random
-from datetime import datetime, timedelta
-from google.cloud import datastore
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
 
-# Taille maximale de lot pour Datastore
-BATCH_SIZE = 500
+from purge import PurgeJob, run_with_progress
+from storage import RECENT_POSTS_SIZE, make_storage
+from workload import BATCH_SIZE, DISTRIBUTIONS, TIMESTAMPS, GraphFile, Workload, export_graph
+
+# Intervalle (secondes) entre deux lignes de progression
+PROGRESS_INTERVAL = 5
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Seed TinyInsta Datastore pour bench/repro.")
-    parser.add_argument('--users', type=int, required=True, help="Nombre d'utilisateurs à créer")
-    parser.add_argument('--posts-per-user', type=int, required=True, help="Nombre de posts par utilisateur")
-    parser.add_argument('--followees-per-user', type=int, required=True, help="Nombre fixe de followees par utilisateur (différent de soi-même)")
+    parser.add_argument('--backend', type=str, default=None,
+                        help="Backend de stockage (datastore|memory, défaut: $STORAGE_BACKEND ou datastore)")
+    parser.add_argument('--users', type=int, help="Nombre d'utilisateurs à créer")
+    parser.add_argument('--posts-per-user', type=int, help="Nombre de posts par utilisateur (moyen en zipf)")
+    parser.add_argument('--followees-per-user', type=int, help="Nombre de followees par utilisateur, différents de soi-même (moyen en zipf)")
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='uniform',
+                        help="uniform: degrés et posts identiques; zipf: popularité et activité en loi de puissance")
+    parser.add_argument('--follow-alpha', type=float, default=1.0,
+                        help="zipf: exposant de la popularité (followers du k-ième user en 1/k^alpha)")
+    parser.add_argument('--post-alpha', type=float, default=1.0,
+                        help="zipf: exposant de l'activité (posts par auteur)")
+    parser.add_argument('--followees-sigma', type=float, default=1.0,
+                        help="zipf: écart type du log du nombre de followees (loi log-normale)")
+    parser.add_argument('--timestamps', choices=TIMESTAMPS, default=None,
+                        help="sequential: un post par seconde; diurnal: profil horaire sur --days jours "
+                             "(défaut: diurnal en zipf, sequential sinon)")
+    parser.add_argument('--days', type=int, default=30, help="diurnal: nombre de jours couverts")
+    parser.add_argument('--export', type=str, default=None,
+                        help="Écrit le graphe généré (NDJSON) pour re-seeder les mêmes données")
+    parser.add_argument('--import', dest='graph', type=str, default=None,
+                        help="Seede le graphe d'un fichier écrit par --export")
     parser.add_argument('--prefix', type=str, default='user', help="Préfixe pour les usernames")
     parser.add_argument('--seed', type=int, default=None, help="Graine aléatoire pour reproductibilité")
     parser.add_argument('--clean', action='store_true', help="Nettoie le Datastore avant insertion")
     parser.add_argument('--dry-run', action='store_true', help="Affiche le plan sans écrire")
-    return parser.parse_args()
+    parser.add_argument('--workers', type=int, default=8, help="Nombre de threads d'écriture")
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help="Nombre maximal de lots en cours d'écriture (défaut: 2 x workers)")
+    parser.add_argument('--checkpoint', type=str, default=None,
+                        help="Fichier de reprise: les lots déjà écrits ne sont pas rejoués")
+    args = parser.parse_args()
+    if not args.graph and None in (args.users, args.posts_per_user, args.followees_per_user):
+        parser.error("--users, --posts-per-user et --followees-per-user sont requis sans --import")
+    return args
+
+
+# ------------------------------------------------------------
+# Reprise — lots terminés par phase, dans un fichier JSON
+# ------------------------------------------------------------
+class Checkpoint:
+    """Lots déjà écrits par phase; reprise possible avec la même configuration.
+
+    Les lots sont générés de façon déterministe à partir de leur numéro (voir
+    workload.batch_rng), un lot rejoué à la reprise est donc identique. Users et
+    follows sont idempotents; seuls les lots de posts en cours d'écriture au
+    moment de l'interruption (au plus --max-in-flight) peuvent être écrits
+    deux fois.
+    """
+
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+        self._done = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state['config'] != config:
+                raise SystemExit(f"[Seed] {path} a été écrit avec une autre configuration "
+                                 f"({state['config']}); supprimez-le ou utilisez --clean.")
+            self._done = {phase: set(batches) for phase, batches in state['done'].items()}
+
+    @classmethod
+    def load_config(cls, path):
+        """Configuration enregistrée dans `path` (None si absent)."""
+        if not path or not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)['config']
+
+    def done(self, phase):
+        with self._lock:
+            return set(self._done.get(phase, ()))
+
+    def mark(self, phase, batch):
+        with self._lock:
+            self._done.setdefault(phase, set()).add(batch)
+            self._save()
+
+    def reset(self):
+        with self._lock:
+            self._done = {}
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        state = {'config': self.config,
+                 'done': {phase: sorted(batches) for phase, batches in self._done.items()}}
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+
+# ------------------------------------------------------------
+# Exécution des lots — pool de threads, lots en vol bornés
+# ------------------------------------------------------------
+class Progress:
+    """Compte les entités écrites et affiche le débit (entités/s)."""
+
+    def __init__(self, label, total):
+        self.label = label
+        self.total = total
+        self.count = 0
+        self.start = time.monotonic()
+        self._last_print = self.start
+
+    def add(self, n):
+        self.count += n
+        now = time.monotonic()
+        if now - self._last_print >= PROGRESS_INTERVAL:
+            self._last_print = now
+            self.report()
+
+    def rate(self):
+        elapsed = time.monotonic() - self.start
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def report(self, final=False):
+        pct = 100.0 * self.count / self.total if self.total else 100.0
+        status = "terminé" if final else "en cours"
+        print(f"[{self.label}] {status}: {self.count}/{self.total} entités ({pct:.1f}%), "
+              f"{self.rate():.0f} entités/s")
+
+
+def run_batches(label, phase, n_batches, task, total, opts):
+    """Exécute task(batch) -> nb d'entités pour chaque lot non encore terminé.
+
+    Au plus opts.max_in_flight lots sont soumis à la fois: la mémoire et le
+    nombre de RPC simultanées restent bornés quelle que soit la taille du seed.
+    """
+    done = opts.checkpoint.done(phase)
+    todo = [b for b in range(n_batches) if b not in done]
+    if done:
+        print(f"[{label}] Reprise: {len(done)}/{n_batches} lots déjà écrits.")
+
+    progress = Progress(label, total)
+    in_flight = {}
+    errors = []
+
+    def collect(futures):
+        # Les lots réussis sont enregistrés même si un autre a échoué
+        for f in futures:
+            batch = in_flight.pop(f)
+            try:
+                n = f.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+            progress.add(n)
+            opts.checkpoint.mark(phase, batch)
+
+    with ThreadPoolExecutor(max_workers=opts.workers, thread_name_prefix='seed') as pool:
+        for batch in todo:
+            if len(in_flight) >= opts.max_in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished)
+            if errors:
+                break
+            in_flight[pool.submit(task, batch)] = batch
+        collect(list(in_flight))
+
+    if errors:
+        print(f"[{label}] Interrompu après {progress.count} entités: relancez avec le même "
+              f"--checkpoint pour reprendre.")
+        raise errors[0]
+    progress.report(final=True)
+    return progress.count
 
 
-def clean_datastore(client):
-    """Supprime tous les Users et Posts par lots de BATCH_SIZE."""
+def clean_datastore(store, opts):
+    """Supprime toutes les données par lots de BATCH_SIZE supprimés en parallèle (purge.py)."""
     print("[Clean] Suppression des Users et Posts en cours...")
-    
-    deleted_users = 0
-    query_users = client.query(kind='User')
-    # Itération par lots de BATCH_SIZE pour éviter de charger toutes les clés en mémoire
-    while True:
-        keys = [u.key for u in query_users.fetch(limit=BATCH_SIZE)]
-        if not keys:
-            break
-        client.delete_multi(keys)
-        deleted_users += len(keys)
-    
-    deleted_posts = 0
-    query_posts = client.query(kind='Post')
-    while True:
-        keys = [p.key for p in query_posts.fetch(limit=BATCH_SIZE)]
-        if not keys:
-            break
-        client.delete_multi(keys)
-        deleted_posts += len(keys)
-
-    print(f"[Clean] Datastore nettoyé. ({deleted_users} users, {deleted_posts} posts supprimés)")
-
-
-def ensure_users(client, names, dry):
-    """Crée les utilisateurs par lots."""
-    new_users = []
-    
-    print(f"[Users] Vérification/Création de {len(names)} utilisateurs...")
-    
-    # 1. On ne veut créer que les utilisateurs qui n'existent pas
-    # Une requête de batch get (lookup) est rapide.
-    user_keys = [client.key('User', name) for name in names]
-    existing_entities = client.get_multi(user_keys)
-    
-    existing_names = {e.key.name for e in existing_entities if e}
-
-    for name in names:
-        if name not in existing_names:
-            key = client.key('User', name)
-            entity = datastore.Entity(key)
-            entity['follows'] = []
-            new_users.append(entity)
-            
-    if new_users and not dry:
-        # 2. Écriture en une seule fois (ou par lots si > BATCH_SIZE)
-        for i in range(0, len(new_users), BATCH_SIZE):
-            client.put_multi(new_users[i:i + BATCH_SIZE])
-            
-    return len(new_users)
-
-
-def assign_follows(client, names, followees_per_user, dry):
-    """Assigne les relations de suivi par lots."""
-    
-    print(f"[Follows] Assignation de {followees_per_user} followees pour {len(names)} users...")
-    
-    user_keys = [client.key('User', name) for name in names]
-    # Récupérer tous les utilisateurs en une seule fois
-    entities_to_update = client.get_multi(user_keys)
-    
-    updated_entities = []
-
-    for entity in entities_to_update:
-        if entity is None: continue
-        name = entity.key.name
-        
-        others = [u for u in names if u != name]
-        if not others: continue
-        
-        nb_followees = min(followees_per_user, len(others))
-        # Utiliser `random.sample` pour sélectionner un nombre fixe
-        selection = random.sample(others, nb_followees)
-        
-        entity['follows'] = sorted(selection)
-        updated_entities.append(entity)
-
-    if updated_entities and not dry:
-        # Mettre à jour tous les utilisateurs en une seule fois
-        for i in range(0, len(updated_entities), BATCH_SIZE):
-            client.put_multi(updated_entities[i:i + BATCH_SIZE])
-
-
-def create_posts(client, names, posts_per_user, dry):
-    """Crée les posts pour tous les utilisateurs, en utilisant put_multi."""
-    total_posts = len(names) * posts_per_user
+
+    job = PurgeJob(store, workers=opts.workers, max_in_flight=opts.max_in_flight)
+    deleted = run_with_progress(job, 'Clean', PROGRESS_INTERVAL)
+
+    print(f"[Clean] Datastore nettoyé. ({deleted['users']} users, {deleted['posts']} posts, "
+          f"{deleted['inbox']} inbox, {deleted['follows']} follows, {deleted['recent']} recent, {deleted['shards']} shards, "
+          f"{deleted['snapshots']} snapshots supprimés)")
+
+
+def ensure_users(store, source, opts):
+    """Crée les utilisateurs manquants, un lookup et une écriture par lot."""
+    print(f"[Users] Vérification/Création de {len(source.names)} utilisateurs...")
+    created = [0]
+    lock = threading.Lock()
+
+    def task(batch):
+        chunk = source.user_batch(batch)
+        # On ne crée que les utilisateurs qui n'existent pas
+        existing_names = {e.key.name for e in store.get_users(chunk)}
+        new_users = [store.new_user(n) for n in chunk if n not in existing_names]
+        if new_users:
+            store.put_users(new_users)
+        with lock:
+            created[0] += len(new_users)
+        return len(chunk)
+
+    run_batches('Users', 'users', source.n_user_batches, task, len(source.names), opts)
+    return created[0]
+
+
+def assign_follows(store, source, opts):
+    """Assigne les relations de suivi par lots (arêtes Follow et index inverse Follower)."""
+    print(f"[Follows] Assignation de ~{source.total_edges} arêtes pour {len(source.names)} users...")
+    if not source.n_follow_batches:
+        return 0
+
+    def task(batch):
+        follows = source.follow_batch(batch)
+        store.set_follows(follows)
+        return sum(len(followees) for followees in follows.values())
+
+    return run_batches('Follows', 'follows', source.n_follow_batches, task,
+                       source.total_edges, opts)
+
+
+def create_posts(store, source, opts):
+    """Crée les posts par lots (put_multi), auteurs entrelacés (voir Workload.post_batch)."""
+    total_posts = source.total_posts
     if total_posts <= 0: return 0
 
     print(f"[Posts] Création de {total_posts} posts au total...")
-    
-    posts_buffer = []
-    base_time = datetime.utcnow()
-    created = 0
-    
-    for idx, author in enumerate(names):
-        for j in range(posts_per_user):
-            key = client.key('Post')
-            post = datastore.Entity(key)
-            post['author'] = author
-            post['content'] = f"Seed post {j+1} by {author} (TS: {created})"
-            # Décalage unique pour garantir l'ordre
-            post['created'] = base_time - timedelta(seconds=created, milliseconds=random.randint(0, 999))
-            posts_buffer.append(post)
-            created += 1
-            
-            # Flush du buffer si on atteint la taille max du lot
-            if len(posts_buffer) >= BATCH_SIZE and not dry:
-                client.put_multi(posts_buffer)
-                posts_buffer = []
-
-    # Flush du buffer final
-    if posts_buffer and not dry:
-        client.put_multi(posts_buffer)
-        
-    return created
+
+    def task(batch):
+        posts = [store.new_post(author, content, created)
+                 for author, content, created in source.post_batch(batch)]
+        # Lot transactionnel: écrit entièrement ou pas du tout, la reprise est exacte.
+        # Les anneaux sont reconstruits après coup (rebuild_rings): les lots
+        # entrelacés toucheraient chacun l'anneau de centaines d'auteurs, une
+        # transaction par auteur et par lot en contention avec les lots voisins
+        store.put_posts(posts, atomic=True)
+        return len(posts)
+
+    return run_batches('Posts', 'posts', source.n_post_batches, task, total_posts, opts)
+
+
+def rebuild_rings(store, source, opts):
+    """Reconstruit l'anneau des posts récents de chaque auteur, une fois, depuis l'index.
+
+    Écritures simples (sans transaction) d'un anneau par auteur: aucune
+    contention, et un lot rejoué à la reprise réécrit les mêmes anneaux.
+    """
+    if RECENT_POSTS_SIZE <= 0 or source.total_posts <= 0:
+        return 0
+    print(f"[Recent] Reconstruction des anneaux de {len(source.names)} auteurs...")
+
+    def task(batch):
+        return store.rebuild_recent(source.user_batch(batch))
+
+    return run_batches('Recent', 'recent', source.n_user_batches, task, len(source.names), opts)
 
 
 def main():
     args = parse_args()
 
-    # Seed aléatoire pour reproductibilité
-    if args.seed is not None:
-        random.seed(args.seed)
+    # Configuration du seed: la même est exigée pour reprendre un checkpoint.
+    # Graine et horodatage de base sont repris du checkpoint s'il existe.
+    previous = Checkpoint.load_config(args.checkpoint) if not args.clean else None
+    if args.graph:
+        source = GraphFile(args.graph)
+        config = {**source.config, 'backend': args.backend, 'import': os.path.abspath(args.graph)}
+    else:
+        config = {
+            'backend': args.backend,
+            'users': args.users,
+            'posts_per_user': args.posts_per_user,
+            'followees_per_user': args.followees_per_user,
+            'prefix': args.prefix,
+            'layout': 'interleaved',
+            'seed': args.seed if args.seed is not None else
+                    (previous['seed'] if previous else random.randrange(2 ** 32)),
+            'base_time': previous['base_time'] if previous else datetime.utcnow().isoformat(),
+        }
+        # Paramètres de distribution: absents en uniform, comme avant leur ajout
+        if args.distribution != 'uniform' or args.timestamps:
+            config.update(distribution=args.distribution, timestamps=args.timestamps,
+                          days=args.days)
+        if args.distribution == 'zipf':
+            config.update(follow_alpha=args.follow_alpha, post_alpha=args.post_alpha,
+                          followees_sigma=args.followees_sigma)
+        source = Workload([f"{args.prefix}{i}" for i in range(1, args.users + 1)], config)
 
-    client = datastore.Client()
+    store = make_storage(args.backend)
 
-    user_names = [f"{args.prefix}{i}" for i in range(1, args.users + 1)]
+    print(f"[Seed] Configuration: {len(source.names)} users | {config['posts_per_user']} posts/user | "
+          f"{config['followees_per_user']} followees/user | {config.get('distribution', 'uniform')}"
+          + (f" (import de {args.graph})" if args.graph else ""))
+    print(f"[Seed] {args.workers} workers, lots de {BATCH_SIZE}, graine {config['seed']}")
 
-    print(f"[Seed] Configuration: {len(user_names)} users | {args.posts_per_user} posts/user | {args.followees_per_user} followees/user")
+    if args.export:
+        stats = export_graph(source, args.export)
+        print(f"[Export] {args.export}: {stats['edges']} arêtes, {stats['posts']} posts | "
+              f"max {stats['max_followers']} followers, {stats['max_followees']} followees, "
+              f"{stats['max_posts_per_author']} posts par auteur | "
+              f"plus suivis: {', '.join(f'{u} ({n})' for u, n in stats['most_followed'])}")
 
     if args.dry_run:
-        print("\n[Dry-Run] Plan seulement, aucune écriture réalisée.")
+        print(f"\n[Dry-Run] Plan seulement, aucune écriture réalisée: "
+              f"{source.n_user_batches} lots users, {source.n_follow_batches} lots follows, "
+              f"{source.n_post_batches} lots posts.")
+        return
+
+    checkpoint = Checkpoint(args.checkpoint, config)
+    opts = argparse.Namespace(
+        workers=args.workers,
+        max_in_flight=args.max_in_flight or 2 * args.workers,
+        checkpoint=checkpoint,
+    )
 
     # Nettoyage optionnel (avant car les données changent)
-    if args.clean and not args.dry_run:
-        clean_datastore(client)
+    if args.clean:
+        clean_datastore(store, opts)
+        checkpoint.reset()
+
+    start = time.monotonic()
 
     # 1. Users
-    n_new = ensure_users(client, user_names, args.dry_run)
+    n_new = ensure_users(store, source, opts)
     print(f"[Seed] Utilisateurs ajoutés: {n_new}")
 
     # 2. Follows
-    assign_follows(client, user_names, args.followees_per_user, args.dry_run)
+    n_edges = assign_follows(store, source, opts)
     print("[Seed] Relations de suivi (follows) ajustées/créées.")
 
     # 3. Posts
-    n_posts = create_posts(client, user_names, args.posts_per_user, args.dry_run)
+    n_posts = create_posts(store, source, opts)
     print(f"[Seed] Posts créés: {n_posts}")
 
-    print("\n[Seed] Terminé.")
+    # 4. Anneaux des posts récents
+    rebuild_rings(store, source, opts)
+
+    elapsed = time.monotonic() - start
+    total = len(source.names) + n_edges + n_posts
+    print(f"\n[Seed] Terminé en {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} entités/s).")
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,186 @@
+"""Profil du démarrage à froid (STARTUP_PROFILE=1).
+
+Importé en premier par main.py: les imports qui suivent sont chronométrés
+module par module (durée totale, sous-imports compris, et durée propre),
+ainsi que les étapes d'initialisation de l'application (step()) et le
+préchauffage (/_ah/warmup). Le rapport est journalisé quand l'application
+est prête et servi par /admin/startup.
+
+    python startup.py [--module main] [--top 25] [--warmup]
+
+importe le module dans un processus neuf et affiche le rapport.
+
+Désactivé, step() renvoie un contexte vide partagé et aucun hook d'import
+n'est installé.
+"""
+import argparse
+import contextlib
+import importlib
+import importlib.abc
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+ENABLED = os.environ.get('STARTUP_PROFILE', '0') == '1'
+
+log = logging.getLogger(__name__)
+
+_T0 = time.perf_counter()
+_NULL = contextlib.nullcontext()
+_lock = threading.Lock()
+_imports = {}    # module -> (durée totale, durée propre) en secondes
+_steps = {}      # étape -> durée (s)
+_ready = None    # secondes entre l'import de ce module et ready()
+_children = threading.local()
+
+
+# ------------------------------------------------------------
+# Imports — un finder en tête de sys.meta_path enveloppe les loaders
+# ------------------------------------------------------------
+class _TimedLoader(importlib.abc.Loader):
+    """Loader chronométré; le reste de l'interface est celui du loader d'origine."""
+
+    def __init__(self, loader, name):
+        self._loader = loader
+        self._name = name
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        stack = _children.__dict__.setdefault('stack', [])
+        stack.append(0.0)
+        t0 = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - t0
+            nested = stack.pop()
+            if stack:
+                stack[-1] += total
+            with _lock:
+                _imports[self._name] = (total, total - nested)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    # Marque commune aux finders de ce module, même chargé deux fois
+    # (__main__ et startup quand il est lancé comme script)
+    timing_finder = True
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if getattr(finder, 'timing_finder', False) or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimedLoader(spec.loader, name)
+                return spec
+        return None
+
+
+def install():
+    """Chronomètre les imports à venir (idempotent)."""
+    if not any(getattr(f, 'timing_finder', False) for f in sys.meta_path):
+        sys.meta_path.insert(0, _TimingFinder())
+
+
+# ------------------------------------------------------------
+# Étapes d'initialisation
+# ------------------------------------------------------------
+class _Step:
+    __slots__ = ('name', 't0')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.t0
+        with _lock:
+            _steps[self.name] = _steps.get(self.name, 0.0) + seconds
+
+
+def step(name: str):
+    """Contexte qui chronomètre une étape du démarrage."""
+    return _Step(name) if ENABLED else _NULL
+
+
+def record(name: str, seconds: float):
+    """Ajoute une durée mesurée ailleurs (ex: connexion du client Datastore)."""
+    if ENABLED:
+        with _lock:
+            _steps[name] = _steps.get(name, 0.0) + seconds
+
+
+def ready():
+    """Marque l'application prête et journalise le résumé."""
+    global _ready
+    if not ENABLED or _ready is not None:
+        return
+    _ready = time.perf_counter() - _T0
+    summary = report(top=10)
+    log.warning("Démarrage en %.1f ms (imports %.1f ms): %s", summary['ready_ms'],
+                summary['imports_ms'],
+                ', '.join(f"{m['module']}={m['total_ms']}" for m in summary['modules']))
+
+
+def report(top: int = 25):
+    """Rapport du démarrage: modules les plus lents, paquets, étapes (ms)."""
+    with _lock:
+        imports = dict(_imports)
+        steps = dict(_steps)
+
+    packages = {}
+    for name, (_, own) in imports.items():
+        root = name.split('.')[0]
+        packages[root] = packages.get(root, 0.0) + own
+    slowest = sorted(imports.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    return {
+        'enabled': ENABLED,
+        'ready_ms': round(_ready * 1000, 2) if _ready is not None else None,
+        # Somme des durées propres: chaque import n'est compté qu'une fois
+        'imports_ms': round(sum(own for _, own in imports.values()) * 1000, 2),
+        'modules': [{'module': name, 'total_ms': round(total * 1000, 2),
+                     'self_ms': round(own * 1000, 2)}
+                    for name, (total, own) in slowest],
+        'packages': {root: round(seconds * 1000, 2) for root, seconds in
+                     sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]},
+        'steps': {name: round(seconds * 1000, 2) for name, seconds in steps.items()},
+    }
+
+
+if ENABLED and __name__ != '__main__':
+    install()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profil du démarrage à froid de TinyInsta.")
+    parser.add_argument('--module', default='main', help="Module à importer (main ou asgi)")
+    parser.add_argument('--top', type=int, default=25, help="Nombre de modules affichés")
+    parser.add_argument('--warmup', action='store_true',
+                        help="Appelle aussi /_ah/warmup (client Datastore et canaux)")
+    args = parser.parse_args()
+
+    # Exécuté comme script, ce fichier est __main__: le module `startup`
+    # importé par main.py (et dont il faut lire les mesures) est un autre
+    os.environ['STARTUP_PROFILE'] = '1'
+    profiler = importlib.import_module('startup')
+    with profiler.step('import'):
+        importlib.import_module(args.module)
+    if args.warmup:
+        sys.modules['main'].app.test_client().get('/_ah/warmup')
+    profiler.ready()
+    print(json.dumps(profiler.report(args.top), indent=2))
+
+
+if __name__ == '__main__':
+    main()
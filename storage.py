@@ -0,0 +1,1332 @@
+"""Backends de stockage de TinyInsta (STORAGE_BACKEND=datastore|memory).
+
+- datastore : Google Cloud Datastore (Firestore en mode Datastore), le
+              backend de production.
+- memory    : moteur en mémoire du processus, sans aucun aller-retour
+              réseau, pour mesurer le coût CPU propre de l'application et
+              faire tourner les algorithmes de timeline à grande échelle.
+              Les données vivent dans le worker: lancer gunicorn avec un
+              seul worker (`-w 1 --threads N`) et seeder via /admin/seed.
+
+Les deux backends manipulent des entités « à la Datastore »: des dict avec
+un attribut `key` (`key.name` pour un User, `key.id` pour un Post). Les
+follows ne sont pas une propriété du User: ils se lisent par pages via
+followees_page / iter_followee_pages.
+
+google-cloud-datastore n'est importé, et le client construit, qu'au premier
+accès au client (ou par warmup()): un démarrage à froid ne paie ni
+l'import de gRPC ni la découverte des identifiants.
+
+Chaque post porte un shard (propriété `shard`, 0 par défaut) et se lit par
+l'unique index composite author + shard + created. Les posts d'un auteur
+très actif peuvent être répartis sur plusieurs shards (voir shard_posts):
+ses écritures se répartissent sur autant de plages de l'index au lieu de
+s'ajouter toutes en tête d'une seule, et author_posts fusionne les shards.
+
+Le contenu d'un post n'est pas indexé (aucune requête ne filtre ni ne trie
+dessus): une écriture ne met à jour que les index de author et created. Au-delà
+de POST_COMPRESS_MIN_BYTES il est stocké compressé (zlib) dans content_z; les
+lectures de posts rendent toujours `content` en clair. migrate_posts convertit
+les posts écrits avant.
+"""
+import base64
+import contextlib
+import importlib
+import importlib.util
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+
+class _LazyModule:
+    """Module importé au premier accès à l'un de ses attributs."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def available(self):
+        try:
+            return importlib.util.find_spec(self._name) is not None
+        except ImportError:  # paquet parent absent
+            return False
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+# google-cloud-datastore (et gRPC) ne sont importés qu'à la première utilisation
+datastore = _LazyModule('google.cloud.datastore')
+gexc = _LazyModule('google.api_core.exceptions')
+
+# Taille maximale de lot pour Datastore
+BATCH_SIZE = 500
+# Anneau des derniers posts de chaque auteur (0: désactivé)
+RECENT_POSTS_SIZE = int(os.environ.get('RECENT_POSTS_SIZE', '50'))
+# Longueur du contenu recopié dans l'anneau; au-delà le post est relu
+RECENT_SNIPPET_SIZE = int(os.environ.get('RECENT_SNIPPET_SIZE', '280'))
+# Durée (secondes) pendant laquelle la table des auteurs répartis est réutilisée
+POST_SHARD_MAP_TTL = float(os.environ.get('POST_SHARD_MAP_TTL', '30'))
+# Taille (octets UTF-8) au-delà de laquelle le contenu d'un post est compressé (0: jamais)
+POST_COMPRESS_MIN_BYTES = int(os.environ.get('POST_COMPRESS_MIN_BYTES', '0'))
+# Propriétés des posts hors index
+POST_UNINDEXED = ('content', 'content_z')
+
+# Données supprimées par clear, dans l'ordre: (nom du compteur, kind Datastore)
+CLEAR_KINDS = (
+    ('users', 'User'),
+    ('posts', 'Post'),
+    ('inbox', 'Inbox'),
+    ('follows', 'Follow'),
+    ('followers', 'Follower'),
+    ('recent', 'Recent'),
+    ('shards', 'PostShards'),
+    ('snapshots', 'Snapshot'),
+)
+
+# Derniers posts d'un auteur, du plus récent au plus ancien. `truncated`:
+# l'auteur a des posts plus anciens que ceux de l'anneau
+RecentPosts = namedtuple('RecentPosts', ['posts', 'truncated'])
+
+# Instantané de la timeline d'un utilisateur: `entries` (created, id du post)
+# du plus récent au plus ancien, `mark` le created le plus récent couvert,
+# `followees` le condensat de l'ensemble des followees au calcul, `complete`
+# vrai si `entries` contient toute la timeline
+Snapshot = namedtuple('Snapshot', ['entries', 'mark', 'followees', 'complete'])
+
+
+class Storage:
+    """Interface commune aux backends.
+
+    `before` est un watermark (objet avec un attribut `created`): seuls les
+    posts créés à cet instant ou avant sont renvoyés. `cursor` est le
+    curseur opaque renvoyé par l'appel précédent de author_posts.
+    """
+
+    # Users
+    def get_user(self, name: str):
+        """Entité User ou None."""
+        raise NotImplementedError
+
+    def get_users(self, names):
+        """Entités User existantes parmi `names` (ordre quelconque)."""
+        raise NotImplementedError
+
+    def iter_users(self):
+        """Itère sur tous les Users."""
+        raise NotImplementedError
+
+    def new_user(self, name: str):
+        """Nouvelle entité User (non écrite)."""
+        raise NotImplementedError
+
+    def put_user(self, entity):
+        raise NotImplementedError
+
+    def put_users(self, entities):
+        raise NotImplementedError
+
+    # Follows
+    def add_follow(self, user: str, followee: str) -> bool:
+        """Ajoute l'arête user -> followee; False si déjà présente ou user inconnu."""
+        raise NotImplementedError
+
+    def remove_follow(self, user: str, followee: str) -> bool:
+        """Retire l'arête user -> followee; False si elle n'existait pas."""
+        raise NotImplementedError
+
+    def set_follows(self, follows):
+        """Remplace les followees de plusieurs users: `follows` est {user: [noms]}."""
+        raise NotImplementedError
+
+    def followees_page(self, user: str, limit: int = None, cursor: str = None):
+        """Page de followees de `user`: (noms, next_cursor ou None)."""
+        raise NotImplementedError
+
+    def iter_followee_pages(self, user: str, page_size: int):
+        """Followees de `user` par pages, sans charger l'ensemble d'un coup."""
+        cursor = None
+        while True:
+            names, cursor = self.followees_page(user, page_size, cursor)
+            if names:
+                yield names
+            if not cursor:
+                return
+
+    def followees(self, user: str):
+        return [n for page in self.iter_followee_pages(user, BATCH_SIZE) for n in page]
+
+    def followers(self, author: str, limit: int = None):
+        """Noms des utilisateurs qui suivent `author` (index inverse)."""
+        names, _ = self.followers_page(author, limit)
+        return names
+
+    def followers_page(self, author: str, limit: int = None, cursor: str = None):
+        """Page de followers de `author`: (noms, next_cursor ou None)."""
+        raise NotImplementedError
+
+    def rebuild_follower_index(self):
+        """Reconstruit l'index inverse à partir des follows; retourne le nombre d'arêtes."""
+        raise NotImplementedError
+
+    def migrate_follows(self):
+        """Convertit l'ancien format (liste User.follows); retourne le nombre d'arêtes."""
+        return 0
+
+    def migrate_posts(self, cursor: str = None, limit: int = 10 * BATCH_SIZE):
+        """Réécrit au plus `limit` posts avec content hors index (et compressé)
+        et un shard (0 pour les posts écrits sans).
+
+        Retourne (posts lus, posts réécrits, next_cursor ou None à la fin).
+        """
+        return 0, 0, None
+
+    # Posts
+    def new_post(self, author: str, content: str, created: datetime):
+        """Nouvelle entité Post (non écrite, id attribué à l'écriture)."""
+        raise NotImplementedError
+
+    def put_post(self, entity):
+        raise NotImplementedError
+
+    def put_posts(self, entities, atomic: bool = False):
+        """Écrit des posts par lots de BATCH_SIZE.
+
+        Avec `atomic`, chaque lot est écrit dans une transaction: il est
+        entièrement écrit ou pas du tout.
+        """
+        raise NotImplementedError
+
+    def get_posts(self, ids):
+        """Posts existants parmi `ids` (ordre quelconque)."""
+        raise NotImplementedError
+
+    def author_posts(self, author: str, limit: int, before=None, cursor=None,
+                     timeout: float = None, keys_only: bool = False):
+        """Posts d'un auteur du plus récent au plus ancien: (posts, next_cursor).
+
+        Avec `keys_only`, les posts peuvent n'avoir que leur clé, `author` et
+        `created` (requête projetée servie par l'index, sans lecture des
+        entités): le contenu des posts retenus se relit ensuite avec get_posts.
+        Un curseur invalide (ou d'un autre backend) lève ValueError.
+        """
+        raise NotImplementedError
+
+    # Répartition des posts des auteurs très actifs
+    def post_shards(self, author: str) -> int:
+        """Nombre de shards des posts de `author` (1: non réparti)."""
+        raise NotImplementedError
+
+    def shard_posts(self, author: str, shards: int) -> int:
+        """Répartit les posts de `author` sur `shards` shards (1: plus de répartition).
+
+        Les posts existants reçoivent le shard `id % shards`, les nouveaux un
+        shard tiré au hasard (0 sans répartition). Retourne le nombre de posts
+        réécrits.
+        """
+        raise NotImplementedError
+
+    # Inbox (fan-out-on-write)
+    def put_inbox(self, items):
+        """Recopie des posts dans des inbox: `items` est une liste de (owner, post)."""
+        raise NotImplementedError
+
+    def remove_from_inbox(self, items):
+        """Retire des posts des inbox: `items` est une liste de (owner, post)."""
+        raise NotImplementedError
+
+    def inbox(self, owner: str, limit: int, before=None):
+        """Ids des posts de l'inbox de `owner`, du plus récent au plus ancien."""
+        raise NotImplementedError
+
+    # Instantanés de timeline (rafraîchis par les posts plus récents que `mark`)
+    def author_posts_since(self, author: str, after, limit: int, timeout: float = None):
+        """Posts de `author` créés strictement après `after`, du plus récent au plus ancien."""
+        raise NotImplementedError
+
+    def inbox_since(self, owner: str, after, limit: int):
+        """Ids des posts de l'inbox de `owner` créés strictement après `after`."""
+        raise NotImplementedError
+
+    def get_snapshot(self, user: str):
+        """Snapshot de la timeline de `user` ou None."""
+        raise NotImplementedError
+
+    def put_snapshot(self, user: str, snapshot):
+        raise NotImplementedError
+
+    def delete_snapshots(self, users):
+        """Supprime les instantanés de `users` (reconstruits à la lecture suivante)."""
+        raise NotImplementedError
+
+    # Anneau des posts récents (dénormalisé par auteur)
+    def push_recent(self, posts):
+        """Ajoute des posts écrits (id attribué) à l'anneau de leur auteur.
+
+        Un auteur sans anneau en reçoit un construit depuis l'index
+        author + shard + created: l'anneau contient toujours ses derniers posts.
+        """
+        raise NotImplementedError
+
+    def recent_posts(self, authors):
+        """{auteur: RecentPosts} pour les `authors` qui ont un anneau (une lecture groupée).
+
+        Les posts sont des entités Post dont `content` est tronqué à
+        RECENT_SNIPPET_SIZE; ils portent alors `clipped` à True.
+        """
+        raise NotImplementedError
+
+    def rebuild_recent(self, authors):
+        """Reconstruit l'anneau des `authors` depuis l'index; retourne leur nombre."""
+        rings = {author: self._ring_from_index(author) for author in authors}
+        self._put_recent(rings)
+        return len(rings)
+
+    def _ring_from_index(self, author):
+        posts, _ = self.author_posts(author, RECENT_POSTS_SIZE + 1)
+        return _merge_recent([], posts)
+
+    def _put_recent(self, rings):
+        """Écrit des anneaux: `rings` est {auteur: (entrées, tronqué)}."""
+        raise NotImplementedError
+
+    # Démarrage
+    # Durées (ms) de l'import du client et de sa construction, une fois connecté
+    connect_timings = {}
+
+    def warmup(self):
+        """Prépare le backend avant le premier trafic; retourne les durées (ms) par étape."""
+        return {}
+
+    # Admin
+    # True si le backend supprime par pages de clés (key_pages / delete_keys,
+    # voir purge.py); sinon clear() est instantané et suffit
+    paged_clear = False
+
+    def clear(self):
+        """Supprime toutes les données: {nom de CLEAR_KINDS: n}."""
+        raise NotImplementedError
+
+    def key_pages(self, kind: str, cursor=None):
+        """Clés des entités de `kind` par pages de BATCH_SIZE: itère (clés, curseur suivant)."""
+        raise NotImplementedError
+
+    def delete_keys(self, keys):
+        """Supprime les entités de `keys` (au plus BATCH_SIZE); retourne leur nombre."""
+        raise NotImplementedError
+
+
+def _merge_recent(entries, posts, truncated=False):
+    """Fusionne `posts` dans un anneau; retourne (entrées, tronqué).
+
+    Les entrées (created, id, extrait, clipped) sont triées par (created, id)
+    décroissants et bornées à RECENT_POSTS_SIZE: les plus anciennes sortent
+    de l'anneau, qui devient alors définitivement `truncated`. Un post plus
+    ancien que tout un anneau plein n'y entre pas. Refusionner un post déjà
+    présent ne change rien.
+    """
+    by_id = {e[1]: e for e in entries}
+    for post in posts:
+        content = post.get('content') or ''
+        by_id[post.key.id] = (_as_utc(post['created']), post.key.id,
+                              content[:RECENT_SNIPPET_SIZE], len(content) > RECENT_SNIPPET_SIZE)
+    merged = sorted(by_id.values(), key=lambda e: (e[0], e[1]), reverse=True)
+    return merged[:RECENT_POSTS_SIZE], truncated or len(merged) > RECENT_POSTS_SIZE
+
+
+def _encode_mark(created, seen):
+    # Curseur des lectures réparties: watermark sur created + ids déjà servis
+    payload = json.dumps({'w': _micros(created), 's': sorted(seen)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_mark(cursor):
+    # ValueError pour tout curseur qui ne vient pas de _encode_mark
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor))
+        return _EPOCH + timedelta(microseconds=data['w']), set(data['s'])
+    except (TypeError, KeyError, ValueError, OverflowError) as e:
+        raise ValueError('invalid cursor') from e
+
+
+def _should_pack(content):
+    return POST_COMPRESS_MIN_BYTES > 0 and isinstance(content, str) \
+        and len(content.encode('utf-8')) >= POST_COMPRESS_MIN_BYTES
+
+
+@contextlib.contextmanager
+def _packed(entities):
+    """Contenus longs remplacés par content_z le temps d'une écriture, puis rétablis."""
+    swapped = []
+    for entity in entities:
+        content = entity.get('content')
+        if _should_pack(content):
+            entity['content_z'] = zlib.compress(content.encode('utf-8'))
+            del entity['content']
+            swapped.append((entity, content))
+    try:
+        yield
+    finally:
+        for entity, content in swapped:
+            entity['content'] = content
+            del entity['content_z']
+
+
+def _inflate(posts):
+    """Rétablit `content` des posts lus compressés (en place); retourne `posts`."""
+    for post in posts:
+        if post is not None and 'content_z' in post:
+            post['content'] = zlib.decompress(post.pop('content_z')).decode('utf-8')
+            # Une réécriture éventuelle garde le contenu hors index
+            post.exclude_from_indexes.add('content')
+    return posts
+
+
+def _projected(posts, author):
+    # Une propriété filtrée par égalité ne peut pas être projetée: on la remet.
+    # Une projection rend un horodatage en entier (microseconds depuis l'epoch,
+    # meaning GD_WHEN): on le repasse en datetime UTC comme une lecture complète
+    for post in posts:
+        post['author'] = author
+        created = post['created']
+        post['created'] = _EPOCH + timedelta(microseconds=created) \
+            if isinstance(created, int) else _as_utc(created)
+    return posts
+
+
+def _group_by_author(posts):
+    by_author = {}
+    for post in posts:
+        by_author.setdefault(post['author'], []).append(post)
+    return by_author
+
+
+# ------------------------------------------------------------
+# DATASTORE
+# ------------------------------------------------------------
+class DatastoreStorage(Storage):
+
+    def __init__(self, client=None):
+        if client is None and not datastore.available():
+            raise RuntimeError("STORAGE_BACKEND=datastore nécessite google-cloud-datastore")
+        self._client = client
+        self._client_lock = threading.Lock()
+        self._shard_map = {}
+        self._shard_map_expires = 0.0
+        self._shard_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """Client Datastore, construit au premier accès."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    t0 = time.perf_counter()
+                    client_class = datastore.Client
+                    t1 = time.perf_counter()
+                    self._client = client_class()
+                    self.connect_timings = {
+                        'import_ms': round((t1 - t0) * 1000, 2),
+                        'client_ms': round((time.perf_counter() - t1) * 1000, 2),
+                    }
+        return self._client
+
+    def warmup(self):
+        # Une lecture par clé ouvre le canal gRPC (et obtient le jeton d'accès)
+        timings = {}
+        t0 = time.perf_counter()
+        client = self.client
+        timings['client_ms'] = round((time.perf_counter() - t0) * 1000, 2)
+        t0 = time.perf_counter()
+        client.get(client.key('User', '_warmup'))
+        timings['rpc_ms'] = round((time.perf_counter() - t0) * 1000, 2)
+        t0 = time.perf_counter()
+        self._load_shard_map(fresh=True)
+        timings['shards_ms'] = round((time.perf_counter() - t0) * 1000, 2)
+        return timings
+
+    def _put_batched(self, entities):
+        for i in range(0, len(entities), BATCH_SIZE):
+            self.client.put_multi(entities[i:i + BATCH_SIZE])
+
+    def get_user(self, name):
+        return self.client.get(self.client.key('User', name))
+
+    def get_users(self, names):
+        keys = [self.client.key('User', n) for n in names]
+        return self.client.get_multi(keys) if keys else []
+
+    def iter_users(self):
+        return self.client.query(kind='User').fetch()
+
+    def new_user(self, name):
+        return datastore.Entity(self.client.key('User', name))
+
+    def put_user(self, entity):
+        self.client.put(entity)
+
+    def put_users(self, entities):
+        self._put_batched(list(entities))
+
+    # Une arête de follow est une paire d'entités sans propriété:
+    #  - Follow   : enfant du User qui suit, nommée d'après le followee
+    #  - Follower : enfant du User suivi, nommée d'après le follower (index inverse)
+    # Les deux sens se lisent par requête ancêtre keys-only paginable, sans
+    # limite de taille d'entité ni liste à réécrire à chaque follow.
+    def _follow_key(self, user, followee):
+        return self.client.key('User', user, 'Follow', followee)
+
+    def _follower_key(self, author, follower):
+        return self.client.key('User', author, 'Follower', follower)
+
+    def _edge_entities(self, user, followee):
+        return [datastore.Entity(self._follow_key(user, followee)),
+                datastore.Entity(self._follower_key(followee, user))]
+
+    def _edge_keys(self, user, followee):
+        return [self._follow_key(user, followee), self._follower_key(followee, user)]
+
+    def _transactional(self, fn, retries: int = 3):
+        """Exécute `fn` dans une transaction, rejouée en cas de contention."""
+        for attempt in range(retries):
+            try:
+                with self.client.transaction():
+                    return fn()
+            except (gexc.Aborted, gexc.Conflict):
+                if attempt == retries - 1:
+                    raise
+
+    def add_follow(self, user, followee):
+        user_key = self.client.key('User', user)
+        follow_key = self._follow_key(user, followee)
+
+        def txn():
+            found = {e.key for e in self.client.get_multi([user_key, follow_key])}
+            if user_key not in found or follow_key in found:
+                return False
+            self.client.put_multi(self._edge_entities(user, followee))
+            return True
+
+        return self._transactional(txn)
+
+    def remove_follow(self, user, followee):
+        follow_key = self._follow_key(user, followee)
+
+        def txn():
+            if self.client.get(follow_key) is None:
+                return False
+            self.client.delete_multi(self._edge_keys(user, followee))
+            return True
+
+        return self._transactional(txn)
+
+    def set_follows(self, follows):
+        puts, deletes = [], []
+        for user, names in follows.items():
+            old = set(self.followees(user))
+            new = set(names) - {user}
+            for followee in new - old:
+                puts.extend(self._edge_entities(user, followee))
+            for followee in old - new:
+                deletes.extend(self._edge_keys(user, followee))
+        self._put_batched(puts)
+        for i in range(0, len(deletes), BATCH_SIZE):
+            self.client.delete_multi(deletes[i:i + BATCH_SIZE])
+
+    def _children_page(self, kind, parent, limit, cursor):
+        q = self.client.query(kind=kind, ancestor=self.client.key('User', parent))
+        q.keys_only()
+        it = q.fetch(limit=limit, start_cursor=cursor)
+        names = [e.key.name for e in it]
+        token = it.next_page_token if limit is not None and len(names) == limit else None
+        return names, token.decode() if isinstance(token, bytes) else token
+
+    def followees_page(self, user, limit=None, cursor=None):
+        return self._children_page('Follow', user, limit, cursor)
+
+    def followers_page(self, author, limit=None, cursor=None):
+        return self._children_page('Follower', author, limit, cursor)
+
+    def rebuild_follower_index(self):
+        # Les arêtes Follow font foi: l'index inverse en est dérivé
+        self._delete_kind('Follower')
+        q = self.client.query(kind='Follow')
+        q.keys_only()
+        edges = 0
+        batch = []
+        for e in q.fetch():
+            batch.append(datastore.Entity(self._follower_key(e.key.name, e.key.parent.name)))
+            if len(batch) >= BATCH_SIZE:
+                self._put_batched(batch)
+                edges += len(batch)
+                batch = []
+        self._put_batched(batch)
+        return edges + len(batch)
+
+    def migrate_posts(self, cursor=None, limit=10 * BATCH_SIZE):
+        # Parcours par curseur: chaque appel reprend où le précédent s'est arrêté
+        q = self.client.query(kind='Post')
+        it = q.fetch(limit=limit, start_cursor=cursor)
+        scanned, stale = 0, []
+        for post in it:
+            scanned += 1
+            # Posts d'avant le shard 0 implicite: absents de l'index author + shard + created
+            unsharded = 'shard' not in post
+            if unsharded:
+                post['shard'] = 0
+            if unsharded or 'content' in post and ('content' not in post.exclude_from_indexes
+                                                   or _should_pack(post['content'])):
+                post.exclude_from_indexes.update(POST_UNINDEXED)
+                stale.append(post)
+        with _packed(stale):
+            self._put_batched(stale)
+        token = it.next_page_token if scanned == limit else None
+        return scanned, len(stale), token.decode() if isinstance(token, bytes) else token
+
+    def migrate_follows(self):
+        edges = 0
+        for entity in self.iter_users():
+            if 'follows' not in entity:
+                continue
+            user = entity.key.name
+            names = set(entity.pop('follows') or []) - {user}
+            puts = [e for followee in names for e in self._edge_entities(user, followee)]
+            self._put_batched(puts + [entity])
+            edges += len(names)
+        return edges
+
+    def new_post(self, author, content, created):
+        entity = datastore.Entity(self.client.key('Post'), exclude_from_indexes=POST_UNINDEXED)
+        entity.update({
+            'author': author,
+            'content': content,
+            'created': created
+        })
+        shards = self.post_shards(author)
+        entity['shard'] = random.randrange(shards) if shards > 1 else 0
+        return entity
+
+    def put_post(self, entity):
+        with _packed([entity]):
+            self.client.put(entity)
+
+    def put_posts(self, entities, atomic=False):
+        entities = list(entities)
+        with _packed(entities):
+            if not atomic:
+                self._put_batched(entities)
+                return
+            for i in range(0, len(entities), BATCH_SIZE):
+                batch = entities[i:i + BATCH_SIZE]
+                self._transactional(lambda: self.client.put_multi(batch))
+
+    def get_posts(self, ids):
+        keys = [self.client.key('Post', i) for i in ids]
+        return _inflate(self.client.get_multi(keys)) if keys else []
+
+    def author_posts(self, author, limit, before=None, cursor=None, timeout=None,
+                     keys_only=False):
+        # Une requête par shard sur l'index author + shard + created desc (le
+        # seul index composite des posts), fusion. Un auteur non réparti n'a
+        # que le shard 0: une requête, entités complètes sauf keys_only. Un
+        # auteur réparti: requêtes projetées (clé + created) puis un seul
+        # get_multi des posts retenus, `limit` entités lues quel que soit le
+        # nombre de shards. Le curseur est toujours un watermark (les curseurs
+        # Datastore sont propres à chaque requête): il reste valide si
+        # l'auteur est réparti ou regroupé entre deux pages
+        shards = self.post_shards(author)
+        if cursor:
+            mark, seen = _decode_mark(cursor)
+        else:
+            mark, seen = (before.created if before else None), set()
+        project = keys_only or shards > 1
+        candidates = []
+        for shard in range(shards):
+            q = self.client.query(kind='Post')
+            q.add_filter('author', '=', author)
+            q.add_filter('shard', '=', shard)
+            if mark is not None:
+                q.add_filter('created', '<=', mark)
+            q.order = ['-created']
+            if project:
+                q.projection = ['created']
+            found = list(q.fetch(limit=limit + len(seen), timeout=timeout))
+            if project:
+                _projected(found, author)
+            candidates.extend((e['created'], e.key.id, e) for e in found)
+
+        # Ordre d'une requête non répartie: created desc, puis clé croissante
+        candidates = sorted((c for c in candidates if c[1] not in seen), key=lambda c: c[1])
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        top = [(created, pid) for created, pid, _ in candidates[:limit]]
+        if keys_only:
+            posts = [e for _, _, e in candidates[:limit]]
+        elif not project:
+            posts = _inflate([e for _, _, e in candidates[:limit]])
+        else:
+            by_id = {p.key.id: p for p in self.get_posts([pid for _, pid in top])}
+            posts = [by_id[pid] for _, pid in top if pid in by_id]
+
+        next_cursor = None
+        if len(top) == limit:
+            last = top[-1][0]
+            served = {pid for created, pid in top if created == last}
+            next_cursor = _encode_mark(last, served | seen if last == mark else served)
+        return posts, next_cursor
+
+    # Auteurs répartis: une entité PostShards ('authors') à listes parallèles
+    # non indexées, relue au plus toutes les POST_SHARD_MAP_TTL secondes
+    def _shard_map_key(self):
+        return self.client.key('PostShards', 'authors')
+
+    def _load_shard_map(self, fresh=False):
+        with self._shard_lock:
+            if not fresh and time.monotonic() < self._shard_map_expires:
+                return self._shard_map
+        entity = self.client.get(self._shard_map_key())
+        shard_map = dict(zip(entity['authors'], entity['counts'])) if entity is not None else {}
+        with self._shard_lock:
+            self._shard_map = shard_map
+            self._shard_map_expires = time.monotonic() + POST_SHARD_MAP_TTL
+        return shard_map
+
+    def post_shards(self, author):
+        return self._load_shard_map().get(author, 1)
+
+    def shard_posts(self, author, shards):
+        current = self._load_shard_map(fresh=True).get(author, 1)
+
+        def publish():
+            def txn():
+                entity = self.client.get(self._shard_map_key())
+                if entity is None:
+                    entity = datastore.Entity(self._shard_map_key(),
+                                              exclude_from_indexes=('authors', 'counts'))
+                shard_map = dict(zip(entity.get('authors', []), entity.get('counts', [])))
+                if shards > 1:
+                    shard_map[author] = shards
+                else:
+                    shard_map.pop(author, None)
+                entity['authors'] = list(shard_map)
+                entity['counts'] = list(shard_map.values())
+                self.client.put(entity)
+            self._transactional(txn)
+            self._load_shard_map(fresh=True)
+
+        # Les lecteurs interrogent les shards 0..n-1 de la table: chaque post
+        # doit toujours porter un shard dans cet intervalle. En augmentant le
+        # nombre de shards on publie d'abord; sinon on réécrit d'abord
+        updated = 0
+        if current < shards:
+            publish()
+            updated += self._stamp_shards(author, shards)
+        else:
+            updated += self._stamp_shards(author, shards)
+            publish()
+        # Posts écrits pendant l'opération avec l'ancien nombre de shards
+        updated += self._stamp_shards(author, shards, only_missing=True)
+        return updated
+
+    def _stamp_shards(self, author, shards, only_missing=False):
+        q = self.client.query(kind='Post')
+        q.add_filter('author', '=', author)
+        updated, batch = 0, []
+        for post in q.fetch():
+            shard = post.get('shard')
+            if only_missing and shard is not None and 0 <= shard < shards:
+                continue
+            if shard == post.key.id % shards:
+                continue
+            post['shard'] = post.key.id % shards
+            post.exclude_from_indexes.update(POST_UNINDEXED)
+            batch.append(post)
+            if len(batch) == BATCH_SIZE:
+                self.client.put_multi(batch)
+                updated += len(batch)
+                batch = []
+        if batch:
+            self.client.put_multi(batch)
+            updated += len(batch)
+        return updated
+
+    def put_inbox(self, items):
+        # Une entrée Inbox est une entité enfant du User destinataire dont l'id
+        # est celui du Post référencé: recopier deux fois un post est idempotent
+        entities = []
+        for owner, post in items:
+            key = self.client.key('User', owner, 'Inbox', post.key.id)
+            item = datastore.Entity(key, exclude_from_indexes=('author',))
+            item.update({
+                'author': post['author'],
+                'created': post['created']
+            })
+            entities.append(item)
+        self._put_batched(entities)
+
+    def remove_from_inbox(self, items):
+        keys = [self.client.key('User', owner, 'Inbox', post.key.id) for owner, post in items]
+        for i in range(0, len(keys), BATCH_SIZE):
+            self.client.delete_multi(keys[i:i + BATCH_SIZE])
+
+    def inbox(self, owner, limit, before=None):
+        q = self.client.query(kind='Inbox', ancestor=self.client.key('User', owner))
+        if before:
+            q.add_filter('created', '<=', before.created)
+        q.order = ['-created']
+        q.keys_only()
+        return [e.key.id for e in q.fetch(limit=limit)]
+
+    def author_posts_since(self, author, after, limit, timeout=None):
+        # Même index author + shard + created desc qu'author_posts, un shard par requête
+        posts = []
+        for shard in range(self.post_shards(author)):
+            q = self.client.query(kind='Post')
+            q.add_filter('author', '=', author)
+            q.add_filter('shard', '=', shard)
+            q.add_filter('created', '>', after)
+            q.order = ['-created']
+            posts.extend(q.fetch(limit=limit, timeout=timeout))
+        posts.sort(key=lambda p: p.key.id)
+        posts.sort(key=lambda p: p['created'], reverse=True)
+        return _inflate(posts[:limit])
+
+    def inbox_since(self, owner, after, limit):
+        q = self.client.query(kind='Inbox', ancestor=self.client.key('User', owner))
+        q.add_filter('created', '>', after)
+        q.order = ['-created']
+        q.keys_only()
+        return [e.key.id for e in q.fetch(limit=limit)]
+
+    # Une entité Snapshot par utilisateur (clé = nom), listes parallèles non indexées
+    _SNAPSHOT_PROPS = ('ids', 'created', 'mark', 'followees', 'complete')
+
+    def get_snapshot(self, user):
+        entity = self.client.get(self.client.key('Snapshot', user))
+        if entity is None:
+            return None
+        return Snapshot(list(zip(entity['created'], entity['ids'])), entity['mark'],
+                        entity['followees'], entity['complete'])
+
+    def put_snapshot(self, user, snapshot):
+        entity = datastore.Entity(self.client.key('Snapshot', user),
+                                  exclude_from_indexes=self._SNAPSHOT_PROPS)
+        entity.update({
+            'ids': [pid for _, pid in snapshot.entries],
+            'created': [created for created, _ in snapshot.entries],
+            'mark': snapshot.mark,
+            'followees': snapshot.followees,
+            'complete': snapshot.complete,
+        })
+        self.client.put(entity)
+
+    def delete_snapshots(self, users):
+        keys = [self.client.key('Snapshot', u) for u in users]
+        for i in range(0, len(keys), BATCH_SIZE):
+            self.client.delete_multi(keys[i:i + BATCH_SIZE])
+
+    # Une entité Recent par auteur (clé = nom), listes parallèles non indexées
+    _RECENT_PROPS = ('ids', 'created', 'snippets', 'clipped', 'truncated')
+
+    def _recent_entity(self, author, entries, truncated):
+        entity = datastore.Entity(self.client.key('Recent', author),
+                                  exclude_from_indexes=self._RECENT_PROPS)
+        entity.update({
+            'ids': [e[1] for e in entries],
+            'created': [e[0] for e in entries],
+            'snippets': [e[2] for e in entries],
+            'clipped': [e[3] for e in entries],
+            'truncated': truncated,
+        })
+        return entity
+
+    @staticmethod
+    def _recent_entries(entity):
+        return list(zip((_as_utc(c) for c in entity.get('created') or []),
+                        entity.get('ids') or [], entity.get('snippets') or [],
+                        entity.get('clipped') or []))
+
+    def push_recent(self, posts):
+        if RECENT_POSTS_SIZE <= 0:
+            return
+        for author, group in _group_by_author(posts).items():
+            key = self.client.key('Recent', author)
+
+            def txn(initial):
+                entity = self.client.get(key)
+                if entity is not None:
+                    entries, truncated = self._recent_entries(entity), entity.get('truncated', False)
+                elif initial is None:
+                    return False
+                else:
+                    entries, truncated = initial
+                entries, truncated = _merge_recent(entries, group, truncated)
+                self.client.put(self._recent_entity(author, entries, truncated))
+                return True
+
+            # Les requêtes sur index sont interdites en transaction: un anneau
+            # absent est construit hors transaction, puis fusionné dans une
+            # seconde transaction (ou dans l'anneau apparu entre-temps)
+            if not self._transactional(lambda: txn(None)):
+                initial = self._ring_from_index(author)
+                self._transactional(lambda: txn(initial))
+
+    def recent_posts(self, authors):
+        rings = {}
+        authors = list(authors)
+        for i in range(0, len(authors), 1000):
+            keys = [self.client.key('Recent', a) for a in authors[i:i + 1000]]
+            for entity in self.client.get_multi(keys):
+                author = entity.key.name
+                posts = []
+                for created, pid, snippet, clipped in self._recent_entries(entity):
+                    post = datastore.Entity(self.client.key('Post', pid))
+                    post.update({'author': author, 'content': snippet, 'created': created})
+                    if clipped:
+                        post['clipped'] = True
+                    posts.append(post)
+                rings[author] = RecentPosts(posts, entity.get('truncated', False))
+        return rings
+
+    def _put_recent(self, rings):
+        self._put_batched([self._recent_entity(author, entries, truncated)
+                           for author, (entries, truncated) in rings.items()])
+
+    paged_clear = True
+
+    def key_pages(self, kind, cursor=None):
+        # Requête keys-only suivie par curseur: rien n'est relu ni matérialisé
+        # au-delà d'une page, les pages déjà supprimées ne sont pas rescannées
+        while True:
+            query = self.client.query(kind=kind)
+            query.keys_only()
+            it = query.fetch(limit=BATCH_SIZE, start_cursor=cursor)
+            keys = [e.key for e in it]
+            if not keys:
+                return
+            cursor = it.next_page_token
+            yield keys, cursor
+            if cursor is None or len(keys) < BATCH_SIZE:
+                return
+
+    def delete_keys(self, keys):
+        self.client.delete_multi(keys)
+        return len(keys)
+
+    def _delete_kind(self, kind):
+        return sum(self.delete_keys(keys) for keys, _ in self.key_pages(kind))
+
+    def clear(self):
+        # Suppression séquentielle; purge.py supprime les lots en parallèle
+        return {name: self._delete_kind(kind) for name, kind in CLEAR_KINDS}
+
+
+# ------------------------------------------------------------
+# MÉMOIRE
+# ------------------------------------------------------------
+class MemKey(namedtuple('MemKey', ['kind', 'id', 'name'])):
+
+    @property
+    def id_or_name(self):
+        return self.id if self.id is not None else self.name
+
+
+class MemEntity(dict):
+
+    def __init__(self, key, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.key = key
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _as_utc(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+def _micros(dt: datetime) -> int:
+    return (_as_utc(dt) - _EPOCH) // timedelta(microseconds=1)
+
+
+def _insert_sorted(times, ids, t, pid):
+    """Insère (t, pid) dans les tableaux parallèles triés par t croissant."""
+    lo = bisect_left(times, t)
+    hi = bisect_right(times, t)
+    if pid in ids[lo:hi]:
+        return False
+    times.insert(hi, t)
+    ids.insert(hi, pid)
+    return True
+
+
+def _read_since(times, ids, after, limit):
+    """Ids des (au plus `limit`) éléments postérieurs à `after`, du plus récent au plus ancien."""
+    lo = max(bisect_right(times, _micros(after)), len(times) - limit)
+    return list(reversed(ids[lo:]))
+
+
+def _read_desc(times, ids, limit, before=None, cursor=None):
+    """Lit (ids, next_cursor) du plus récent au plus ancien.
+
+    Le curseur est le couple (t, pid) du dernier élément lu: il reste valide
+    si de nouveaux éléments sont insérés entre deux lectures.
+    """
+    hi = len(times)
+    if before is not None:
+        hi = bisect_right(times, _micros(before.created))
+    if cursor is not None:
+        t, pid = cursor
+        lo_t = bisect_left(times, t)
+        pos = lo_t
+        for j in range(lo_t, bisect_right(times, t)):
+            if ids[j] == pid:
+                pos = j
+                break
+        hi = min(hi, pos)
+    lo = 0 if limit is None else max(0, hi - limit)
+    selected = [ids[j] for j in range(hi - 1, lo - 1, -1)]
+    next_cursor = (times[lo], ids[lo]) if lo > 0 and selected else None
+    return selected, next_cursor
+
+
+class MemoryStorage(Storage):
+    """Moteur en mémoire.
+
+    Les noms d'utilisateurs sont internés en entiers; le graphe de follows
+    (et son index inverse) est conservé en tableaux d'entiers triés. Les
+    posts de chaque auteur, comme chaque inbox, sont des tableaux parallèles
+    (created en µs, id) triés par date: une lecture chronologique est une
+    recherche dichotomique suivie d'une tranche.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._uids = {}        # nom -> id interne
+        self._names = []       # id interne -> nom
+        self._props = []       # id interne -> propriétés du User (None: pas de User)
+        self._follows = []     # id interne -> array des followees (triés)
+        self._followers = []   # id interne -> array des followers (triés)
+        self._posts = {}       # post id -> MemEntity
+        self._post_ids = itertools.count(1)
+        self._post_times = {}  # id auteur -> array des created (µs) croissants
+        self._post_keys = {}   # id auteur -> array des post ids (parallèle)
+        self._inbox_times = {}
+        self._inbox_ids = {}
+        self._recent = {}      # id auteur -> (entrées de l'anneau, tronqué)
+        self._shards = {}      # auteur -> nombre de shards de ses posts
+        self._snapshots = {}   # nom -> Snapshot
+
+    def clear(self):
+        with self._lock:
+            counts = {
+                'users': sum(1 for p in self._props if p is not None),
+                'posts': len(self._posts),
+                'inbox': sum(len(ids) for ids in self._inbox_ids.values()),
+                'follows': sum(len(f) for f in self._follows),
+                'followers': sum(len(f) for f in self._followers),
+                'recent': len(self._recent),
+                'shards': len(self._shards),
+                'snapshots': len(self._snapshots),
+            }
+            self._reset()
+            return counts
+
+    def _intern(self, name):
+        uid = self._uids.get(name)
+        if uid is None:
+            uid = len(self._names)
+            self._uids[name] = uid
+            self._names.append(name)
+            self._props.append(None)
+            self._follows.append(array('l'))
+            self._followers.append(array('l'))
+        return uid
+
+    def _user_entity(self, uid):
+        return MemEntity(MemKey('User', None, self._names[uid]), self._props[uid])
+
+    def get_user(self, name):
+        with self._lock:
+            uid = self._uids.get(name)
+            if uid is None or self._props[uid] is None:
+                return None
+            return self._user_entity(uid)
+
+    def get_users(self, names):
+        with self._lock:
+            return [self._user_entity(uid) for uid in (self._uids.get(n) for n in names)
+                    if uid is not None and self._props[uid] is not None]
+
+    def iter_users(self):
+        with self._lock:
+            return [self._user_entity(uid) for uid, p in enumerate(self._props) if p is not None]
+
+    def new_user(self, name):
+        return MemEntity(MemKey('User', None, name))
+
+    def put_user(self, entity):
+        with self._lock:
+            uid = self._intern(entity.key.name)
+            self._props[uid] = dict(entity)
+
+    def put_users(self, entities):
+        for entity in entities:
+            self.put_user(entity)
+
+    def _set_follows(self, uid, names):
+        for f in self._follows[uid]:
+            followers = self._followers[f]
+            del followers[bisect_left(followers, uid)]
+        follows = array('l', sorted({self._intern(n) for n in names} - {uid}))
+        self._follows[uid] = follows
+        for f in follows:
+            insort(self._followers[f], uid)
+
+    def add_follow(self, user, followee):
+        with self._lock:
+            uid = self._uids.get(user)
+            if uid is None or self._props[uid] is None:
+                return False
+            fid = self._intern(followee)
+            follows = self._follows[uid]
+            i = bisect_left(follows, fid)
+            if i < len(follows) and follows[i] == fid:
+                return False
+            follows.insert(i, fid)
+            insort(self._followers[fid], uid)
+            return True
+
+    def remove_follow(self, user, followee):
+        with self._lock:
+            uid = self._uids.get(user)
+            fid = self._uids.get(followee)
+            if uid is None or fid is None:
+                return False
+            follows = self._follows[uid]
+            i = bisect_left(follows, fid)
+            if i == len(follows) or follows[i] != fid:
+                return False
+            del follows[i]
+            followers = self._followers[fid]
+            del followers[bisect_left(followers, uid)]
+            return True
+
+    def set_follows(self, follows):
+        with self._lock:
+            for user, names in follows.items():
+                self._set_follows(self._intern(user), names)
+
+    @staticmethod
+    def _page(ids, names, limit, cursor):
+        # Le curseur est l'id interne du dernier élément servi: les tableaux
+        # étant triés par id, la page suivante reprend par dichotomie
+        start = bisect_right(ids, int(cursor)) if cursor else 0
+        end = len(ids) if limit is None else start + limit
+        page = ids[start:end]
+        more = end < len(ids) and len(page) > 0
+        return [names[i] for i in page], str(page[-1]) if more else None
+
+    def followees_page(self, user, limit=None, cursor=None):
+        with self._lock:
+            uid = self._uids.get(user)
+            if uid is None:
+                return [], None
+            return self._page(self._follows[uid], self._names, limit, cursor)
+
+    def followers_page(self, author, limit=None, cursor=None):
+        with self._lock:
+            uid = self._uids.get(author)
+            if uid is None:
+                return [], None
+            return self._page(self._followers[uid], self._names, limit, cursor)
+
+    def rebuild_follower_index(self):
+        # L'index inverse est maintenu à chaque écriture: on le recalcule
+        # simplement depuis les follows
+        with self._lock:
+            self._followers = [array('l') for _ in self._names]
+            for uid, follows in enumerate(self._follows):
+                for f in follows:
+                    self._followers[f].append(uid)
+            return sum(len(f) for f in self._follows)
+
+    def new_post(self, author, content, created):
+        entity = MemEntity(MemKey('Post', None, None),
+                           author=author, content=content, created=created)
+        shards = self.post_shards(author)
+        entity['shard'] = random.randrange(shards) if shards > 1 else 0
+        return entity
+
+    def put_post(self, entity):
+        with self._lock:
+            if entity.key.id is None:
+                entity.key = entity.key._replace(id=next(self._post_ids))
+            entity['created'] = _as_utc(entity['created'])
+            self._posts[entity.key.id] = entity
+            aid = self._intern(entity['author'])
+            times = self._post_times.setdefault(aid, array('q'))
+            ids = self._post_keys.setdefault(aid, array('q'))
+            _insert_sorted(times, ids, _micros(entity['created']), entity.key.id)
+
+    def put_posts(self, entities, atomic=False):
+        # Le verrou rend le lot atomique vis-à-vis des lecteurs
+        with self._lock:
+            for entity in entities:
+                self.put_post(entity)
+
+    def get_posts(self, ids):
+        with self._lock:
+            return [self._posts[i] for i in ids if i in self._posts]
+
+    def author_posts(self, author, limit, before=None, cursor=None, timeout=None,
+                     keys_only=False):
+        with self._lock:
+            aid = self._uids.get(author)
+            if aid is None or aid not in self._post_times:
+                return [], None
+            ids, next_cursor = _read_desc(self._post_times[aid], self._post_keys[aid],
+                                          limit, before, cursor)
+            posts = [self._posts[i] for i in ids]
+        if keys_only:
+            # Comme une projection Datastore: clé, author et created seulement
+            posts = [MemEntity(p.key, author=p['author'], created=p['created']) for p in posts]
+        return posts, next_cursor
+
+    # Les tableaux par auteur n'ont pas de point chaud: seule la propriété
+    # `shard` est tenue à jour, comme dans Datastore
+    def post_shards(self, author):
+        with self._lock:
+            return self._shards.get(author, 1)
+
+    def shard_posts(self, author, shards):
+        with self._lock:
+            if shards > 1:
+                self._shards[author] = shards
+            else:
+                self._shards.pop(author, None)
+            aid = self._uids.get(author)
+            updated = 0
+            for pid in self._post_keys.get(aid, ()):
+                post = self._posts[pid]
+                if post.get('shard') != pid % shards:
+                    post['shard'] = pid % shards
+                    updated += 1
+            return updated
+
+    def put_inbox(self, items):
+        with self._lock:
+            for owner, post in items:
+                oid = self._intern(owner)
+                times = self._inbox_times.setdefault(oid, array('q'))
+                ids = self._inbox_ids.setdefault(oid, array('q'))
+                _insert_sorted(times, ids, _micros(post['created']), post.key.id)
+
+    def remove_from_inbox(self, items):
+        with self._lock:
+            for owner, post in items:
+                oid = self._uids.get(owner)
+                if oid is None or oid not in self._inbox_times:
+                    continue
+                times, ids = self._inbox_times[oid], self._inbox_ids[oid]
+                t = _micros(post['created'])
+                for j in range(bisect_left(times, t), bisect_right(times, t)):
+                    if ids[j] == post.key.id:
+                        del times[j]
+                        del ids[j]
+                        break
+
+    def inbox(self, owner, limit, before=None):
+        with self._lock:
+            oid = self._uids.get(owner)
+            if oid is None or oid not in self._inbox_times:
+                return []
+            ids, _ = _read_desc(self._inbox_times[oid], self._inbox_ids[oid], limit, before)
+            return ids
+
+    def author_posts_since(self, author, after, limit, timeout=None):
+        with self._lock:
+            aid = self._uids.get(author)
+            if aid is None or aid not in self._post_times:
+                return []
+            ids = _read_since(self._post_times[aid], self._post_keys[aid], after, limit)
+            return [self._posts[i] for i in ids]
+
+    def inbox_since(self, owner, after, limit):
+        with self._lock:
+            oid = self._uids.get(owner)
+            if oid is None or oid not in self._inbox_times:
+                return []
+            return _read_since(self._inbox_times[oid], self._inbox_ids[oid], after, limit)
+
+    def get_snapshot(self, user):
+        with self._lock:
+            return self._snapshots.get(user)
+
+    def put_snapshot(self, user, snapshot):
+        with self._lock:
+            self._snapshots[user] = snapshot
+
+    def delete_snapshots(self, users):
+        with self._lock:
+            for user in users:
+                self._snapshots.pop(user, None)
+
+    def push_recent(self, posts):
+        if RECENT_POSTS_SIZE <= 0:
+            return
+        with self._lock:
+            for author, group in _group_by_author(posts).items():
+                aid = self._intern(author)
+                ring = self._recent.get(aid) or self._ring_from_index(author)
+                self._recent[aid] = _merge_recent(ring[0], group, ring[1])
+
+    def recent_posts(self, authors):
+        with self._lock:
+            rings = {}
+            for author in authors:
+                ring = self._recent.get(self._uids.get(author))
+                if ring is None:
+                    continue
+                posts = []
+                for created, pid, snippet, clipped in ring[0]:
+                    post = MemEntity(MemKey('Post', pid, None),
+                                     author=author, content=snippet, created=created)
+                    if clipped:
+                        post['clipped'] = True
+                    posts.append(post)
+                rings[author] = RecentPosts(posts, ring[1])
+            return rings
+
+    def _put_recent(self, rings):
+        with self._lock:
+            for author, ring in rings.items():
+                self._recent[self._intern(author)] = ring
+
+
+BACKENDS = {
+    'datastore': DatastoreStorage,
+    'memory': MemoryStorage,
+}
+
+
+def make_storage(kind: str = None) -> Storage:
+    """Construit le backend selon STORAGE_BACKEND (datastore par défaut)."""
+    kind = kind or os.environ.get('STORAGE_BACKEND', 'datastore')
+    try:
+        backend = BACKENDS[kind]
+    except KeyError:
+        raise ValueError(f"STORAGE_BACKEND inconnu: {kind}") from None
+    return backend()
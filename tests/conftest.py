@@ -0,0 +1,49 @@
+"""Application sur le backend mémoire, remise à zéro entre deux tests."""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+
+import main  # noqa: E402
+
+BASE_TIME = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def app():
+    """Module main sur un stockage vide; les réglages modifiés par le test sont rétablis."""
+    main.store.clear()
+    main.loader.clear()
+    if main.timeline_cache:
+        main.timeline_cache.clear()
+    yield main
+    main.store.clear()
+    main.loader.clear()
+
+
+def add_users(app, *names):
+    for name in names:
+        app.store.put_user(app.store.new_user(name))
+
+
+def publish(app, author, content, seconds=0):
+    """Publie un post daté de BASE_TIME + `seconds` (ex aequo si même valeur)."""
+    entity = app.store.new_post(author, content, BASE_TIME + timedelta(seconds=seconds))
+    app.publish_post(entity)
+    return entity
+
+
+def all_pages(app, user, limit, max_pages=100):
+    """Contenus de toutes les pages de la timeline de `user`, dans l'ordre."""
+    contents, cursor = [], None
+    for _ in range(max_pages):
+        page = app.timeline_page(user, limit, cursor=cursor)
+        contents.extend(item['content'] for item in page['items'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return contents
+    raise AssertionError(f"pagination sans fin: {contents[:20]}...")
@@ -0,0 +1,20 @@
+"""POST /api/posts: un élément invalide ne rejette que lui-même."""
+import pytest
+
+from conftest import add_users
+
+
+@pytest.mark.parametrize('author', [42, ['a'], {'name': 'a'}, '', True])
+def test_invalid_author_is_a_per_item_error(app, author):
+    add_users(app, 'a')
+    client = app.app.test_client()
+    client.post('/login', data={'username': 'a'})
+    response = client.post('/api/posts', json=[{'content': 'bad', 'author': author},
+                                               {'content': 'good'}])
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['created'], body['failed']) == (1, 1)
+    assert body['results'][0] == {'index': 0, 'error': 'invalid author'}
+    assert 'id' in body['results'][1]
+    posts, _ = app.store.author_posts('a', 10)
+    assert [p['content'] for p in posts] == ['good']
@@ -0,0 +1,59 @@
+"""Cache des pages de timeline: invalidation par génération."""
+import pytest
+
+from cache import make_cache
+from conftest import add_users, publish
+
+
+@pytest.fixture(params=['local', 'shared'])
+def cache(request):
+    return make_cache(request.param)
+
+
+def test_set_after_invalidation_is_dropped(cache):
+    gen = cache.generation('a')
+    cache.invalidate('a')
+    assert not cache.set('a', ['old'], 20, '', gen=gen)
+    assert cache.get('a', 20, '', gen=cache.generation('a')) is None
+    assert cache.stats()['stale'] == 1
+
+
+def test_set_under_current_generation_is_served(cache):
+    gen = cache.generation('a')
+    assert cache.set('a', ['page'], 20, '', gen=gen)
+    assert cache.get('a', 20, '', gen=cache.generation('a')) == ['page']
+
+
+def test_post_during_computation_is_not_hidden(app, monkeypatch, cache):
+    monkeypatch.setattr(app, 'timeline_cache', cache)
+    add_users(app, 'a')
+    publish(app, 'a', 'old', seconds=0)
+
+    compute = app.get_timeline
+
+    def racing_get_timeline(*args, **kwargs):
+        # /post pendant le calcul: invalide la timeline déjà en cours de calcul
+        posts = compute(*args, **kwargs)
+        monkeypatch.setattr(app, 'get_timeline', compute)
+        publish(app, 'a', 'new', seconds=1)
+        return posts
+
+    monkeypatch.setattr(app, 'get_timeline', racing_get_timeline)
+    assert [i['content'] for i in app.timeline_page('a', 20)['items']] == ['old']
+    assert [i['content'] for i in app.timeline_page('a', 20)['items']] == ['new', 'old']
+
+
+def test_post_beyond_celebrity_threshold_reaches_every_follower(app, monkeypatch, cache):
+    monkeypatch.setattr(app, 'timeline_cache', cache)
+    monkeypatch.setattr(app, 'CELEBRITY_THRESHOLD', 2)
+    fans = [f'f{i}' for i in range(7)]
+    add_users(app, 'star', *fans)
+    app.store.set_follows({fan: ['star'] for fan in fans})
+    publish(app, 'star', 'old', seconds=0)
+    for fan in fans:
+        assert [i['content'] for i in app.timeline_page(fan, 20)['items']] == ['old']
+
+    publish(app, 'star', 'new', seconds=1)
+    app.wait_invalidations()
+    for fan in fans:
+        assert [i['content'] for i in app.timeline_page(fan, 20)['items']] == ['new', 'old']
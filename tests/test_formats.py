@@ -0,0 +1,25 @@
+"""Formats de /api/timeline (formats.py)."""
+import json
+
+from conftest import add_users, publish
+
+
+def test_ndjson_is_one_sized_body(app):
+    add_users(app, 'a', 'b')
+    app.store.set_follows({'a': ['b']})
+    for i in range(3):
+        publish(app, 'b', f'p{i}', seconds=i)
+
+    client = app.app.test_client()
+    response = client.get('/api/timeline?user=a&limit=2', headers={'Accept': 'application/x-ndjson'})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.content_length == len(response.data)
+
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [line['content'] for line in lines[:-1]] == ['p2', 'p1']
+    assert lines[-1]['count'] == 2 and lines[-1]['user'] == 'a' and lines[-1]['next_cursor']
+
+    again = client.get('/api/timeline?user=a&limit=2&format=ndjson',
+                       headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
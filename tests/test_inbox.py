@@ -0,0 +1,123 @@
+"""Fan-out-on-write (TIMELINE_MODE=write) comparé au fan-out-on-read."""
+import random
+
+import pytest
+
+from conftest import add_users, all_pages, publish
+
+USERS = ['u0', 'u1', 'u2', 'u3', 'u4', 'u5']
+
+
+@pytest.fixture
+def write_mode(app, monkeypatch):
+    monkeypatch.setattr(app, 'TIMELINE_MODE', 'write')
+    monkeypatch.setattr(app, 'INBOX_BACKFILL_SIZE', 2)
+    return app
+
+
+def read_pages(app, monkeypatch, user, limit):
+    with monkeypatch.context() as m:
+        m.setattr(app, 'TIMELINE_MODE', 'read')
+        return all_pages(app, user, limit)
+
+
+def follow(app, user, other):
+    client = app.app.test_client()
+    client.post('/login', data={'username': user})
+    client.post('/follow', data={'to_follow': other})
+
+
+def unfollow(app, user, other):
+    client = app.app.test_client()
+    client.post('/login', data={'username': user})
+    client.post('/unfollow', data={'to_unfollow': other})
+
+
+def test_follow_serves_history_beyond_backfill_size(write_mode, monkeypatch):
+    app = write_mode
+    add_users(app, 'a', 'b')
+    for i in range(7):
+        publish(app, 'b', f'b{i}', seconds=i)
+    follow(app, 'a', 'b')
+    assert all_pages(app, 'a', 3) == [f'b{i}' for i in reversed(range(7))]
+
+    unfollow(app, 'a', 'b')
+    assert all_pages(app, 'a', 3) == []
+
+
+def test_follow_long_history_writes_a_bounded_window(write_mode, monkeypatch):
+    app = write_mode
+    add_users(app, 'a', 'b')
+    for i in range(50):
+        publish(app, 'b', f'b{i}', seconds=i)
+    publish(app, 'a', 'a-own', seconds=-1)
+
+    written, removed = [], []
+    put_inbox, remove = app.store.put_inbox, app.store.remove_from_inbox
+    monkeypatch.setattr(app.store, 'put_inbox', lambda items: (written.extend(items),
+                                                               put_inbox(items)))
+    monkeypatch.setattr(app.store, 'remove_from_inbox', lambda items: (removed.extend(items),
+                                                                       remove(items)))
+    follow(app, 'a', 'b')
+    assert len(written) == app.INBOX_BACKFILL_SIZE
+    horizon = app.store.get_user('a')['inbox_horizon']
+    assert horizon == app.store.author_posts('b', 2)[0][-1]['created']
+    expected = [f'b{i}' for i in reversed(range(50))] + ['a-own']
+    assert all_pages(app, 'a', 3) == expected
+
+    unfollow(app, 'a', 'b')
+    assert len(removed) == app.INBOX_BACKFILL_SIZE
+    assert all_pages(app, 'a', 3) == ['a-own']
+
+
+def test_celebrity_old_inbox_copies_do_not_shorten_page(write_mode, monkeypatch):
+    app = write_mode
+    monkeypatch.setattr(app, 'CELEBRITY_THRESHOLD', 1)
+    add_users(app, 'a', 'b', 'c')
+    follow(app, 'a', 'b')
+    publish(app, 'b', 'b-old', seconds=1)
+    publish(app, 'a', 'a-own', seconds=0)
+    # Un deuxième follower fait de b une célébrité: b-old reste dans l'inbox de a
+    follow(app, 'c', 'b')
+    publish(app, 'b', 'b-new', seconds=2)
+
+    assert app.loader.get_user('b').get('celebrity')
+    assert all_pages(app, 'a', 3) == ['b-new', 'b-old', 'a-own']
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_operations_match_fan_out_on_read(write_mode, monkeypatch, seed):
+    app = write_mode
+    monkeypatch.setattr(app, 'CELEBRITY_THRESHOLD', 2)
+    rng = random.Random(seed)
+    add_users(app, *USERS)
+    follows = {u: set() for u in USERS}
+    posts = {u: [] for u in USERS}
+    created = {}
+
+    for step in range(120):
+        user, other = rng.sample(USERS, 2)
+        action = rng.random()
+        if action < 0.5:
+            content = f'{user}-{step}'
+            # Quelques ex aequo pour exercer le watermark
+            created[content] = step - step % 3 * (rng.random() < 0.2)
+            publish(app, user, content, seconds=created[content])
+            posts[user].append(content)
+        elif action < 0.8:
+            follow(app, user, other)
+            follows[user].add(other)
+        else:
+            unfollow(app, user, other)
+            follows[user].discard(other)
+
+    for user in USERS:
+        expected = {c for author in follows[user] | {user} for c in posts[author]}
+        for limit in (1, 3, 7):
+            pages = all_pages(app, user, limit)
+            reference = read_pages(app, monkeypatch, user, limit)
+            assert len(pages) == len(set(pages))
+            assert set(pages) == set(reference) == expected
+            # L'ordre des ex aequo n'est pas fixé: seul l'ordre des dates compte
+            order = [created[c] for c in pages]
+            assert order == sorted(order, reverse=True) == [created[c] for c in reference]
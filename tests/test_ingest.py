@@ -0,0 +1,47 @@
+"""Comptage des posts écrits et perdus par le tampon d'écriture (ingest.PostBuffer)."""
+import logging
+
+from ingest import PostBuffer
+
+
+def _buffer(flush_fn, max_items=10):
+    return PostBuffer(flush_fn, max_items=max_items, max_delay=60, max_pending=100)
+
+
+def test_partial_failure_counts_only_written_posts(caplog):
+    written = []
+
+    def flush_fn(batch):
+        # Un lot sur deux en échec, comme publish_posts avec BATCH_SIZE = 2
+        written.extend(batch[:2])
+        return {i: 'contention' for i in range(2, len(batch))}
+
+    buffer = _buffer(flush_fn)
+    for i in range(5):
+        buffer._items.append(i)
+    with caplog.at_level(logging.ERROR, logger='ingest'):
+        buffer.flush()
+
+    stats = buffer.stats()
+    assert (stats['flushed'], stats['dropped'], stats['batches']) == (2, 3, 1)
+    assert written == [0, 1]
+    assert '[2, 3, 4]' in caplog.text
+
+
+def test_exception_drops_whole_batch():
+    def flush_fn(batch):
+        raise RuntimeError('datastore down')
+
+    buffer = _buffer(flush_fn)
+    buffer._items.extend(range(4))
+    buffer.flush()
+    stats = buffer.stats()
+    assert (stats['flushed'], stats['dropped'], stats['batches']) == (0, 4, 0)
+
+
+def test_success_without_errors():
+    buffer = _buffer(lambda batch: {}, max_items=3)
+    buffer._items.extend(range(7))
+    buffer.flush()
+    stats = buffer.stats()
+    assert (stats['flushed'], stats['dropped'], stats['batches']) == (7, 0, 3)
@@ -0,0 +1,39 @@
+"""Pagination par watermark (encode_cursor / decode_cursor)."""
+import pytest
+
+from conftest import add_users, all_pages, publish
+
+
+def test_pages_cover_timeline_once(app):
+    add_users(app, 'a', 'b')
+    app.store.set_follows({'a': ['b']})
+    for i in range(7):
+        publish(app, 'b', f'p{i}', seconds=i)
+    assert all_pages(app, 'a', 3) == [f'p{i}' for i in reversed(range(7))]
+
+
+def test_tie_group_of_two_with_limit_one(app):
+    add_users(app, 'a')
+    publish(app, 'a', 'A')
+    publish(app, 'a', 'B')
+    assert sorted(all_pages(app, 'a', 1)) == ['A', 'B']
+
+
+@pytest.mark.parametrize('limit', [1, 3, 9])
+@pytest.mark.parametrize('neighbours', [False, True])
+def test_tie_group_larger_than_limit(app, limit, neighbours):
+    # Groupe d'ex aequo de 10 posts, seul ou entre un post plus récent et un plus ancien
+    add_users(app, 'a', 'b')
+    app.store.set_follows({'a': ['b']})
+    expected = 10
+    if neighbours:
+        publish(app, 'b', 'newer', seconds=10)
+        publish(app, 'b', 'older', seconds=1)
+        expected += 2
+    for i in range(10):
+        publish(app, 'b', f'tie{i}', seconds=5)
+
+    contents = all_pages(app, 'a', limit)
+    assert len(contents) == len(set(contents)) == expected
+    if neighbours:
+        assert contents[0] == 'newer' and contents[-1] == 'older'
@@ -0,0 +1,119 @@
+"""Lectures projetées des posts (two-phase fetch) et auteurs répartis.
+
+DatastoreStorage est exercé avec un client minimal qui projette comme
+Datastore: une requête projetée sur `created` rend les clés et l'horodatage
+en entier (microsecondes depuis l'epoch), sans les autres propriétés.
+"""
+from datetime import timedelta, timezone
+
+import pytest
+
+import storage
+from conftest import BASE_TIME, add_users, all_pages, publish
+from storage import DatastoreStorage, MemEntity, MemKey
+
+_OPS = {
+    '=': lambda a, b: a == b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+}
+
+
+class _Query:
+
+    def __init__(self, client, kind):
+        self.client = client
+        self.kind = kind
+        self.filters = []
+        self.order = []
+        self.projection = []
+
+    def add_filter(self, prop, op, value):
+        self.filters.append((prop, op, value))
+
+    def fetch(self, limit=None, start_cursor=None, timeout=None):
+        assert start_cursor is None, "curseurs Datastore non utilisés par ces lectures"
+        found = [e for e in self.client.entities.values() if e.key.kind == self.kind
+                 and all(prop in e and _OPS[op](e[prop], value)
+                         for prop, op, value in self.filters)]
+        found.sort(key=lambda e: e.key.id)
+        if self.order == ['-created']:
+            found.sort(key=lambda e: e['created'], reverse=True)
+        found = found[:limit]
+        if self.projection == ['created']:
+            found = [MemEntity(e.key, created=storage._micros(e['created'])) for e in found]
+        else:
+            found = [MemEntity(e.key, e) for e in found]
+        return iter(found)
+
+
+class ProjectingClient:
+    """Sous-ensemble du client Datastore utilisé par author_posts."""
+
+    def __init__(self, shards):
+        self.entities = {}
+        self.shards = shards
+
+    def key(self, kind, id_or_name):
+        return MemKey(kind, id_or_name, None)
+
+    def get(self, key):
+        # Table des auteurs répartis (PostShards)
+        return MemEntity(key, authors=list(self.shards), counts=list(self.shards.values()))
+
+    def get_multi(self, keys):
+        return [MemEntity(k, self.entities[k]) for k in keys if k in self.entities]
+
+    def query(self, kind):
+        return _Query(self, kind)
+
+
+def _datastore(shards=1, posts=23):
+    client = ProjectingClient({'a': shards} if shards > 1 else {})
+    created = BASE_TIME.replace(tzinfo=timezone.utc)
+    for pid in range(1, posts + 1):
+        # Groupes de trois ex aequo
+        client.entities[client.key('Post', pid)] = MemEntity(
+            client.key('Post', pid), author='a', content=f'p{pid}', shard=pid % shards,
+            created=created + timedelta(seconds=pid // 3))
+    expected = sorted(client.entities.values(), key=lambda e: e.key.id)
+    expected.sort(key=lambda e: e['created'], reverse=True)
+    return DatastoreStorage(client), expected
+
+
+def _pages(store, limit, keys_only):
+    posts, cursor = [], None
+    while True:
+        page, cursor = store.author_posts('a', limit, cursor=cursor, keys_only=keys_only)
+        posts.extend(page)
+        if not cursor:
+            return posts
+
+
+@pytest.mark.parametrize('shards', [1, 4])
+@pytest.mark.parametrize('keys_only', [False, True])
+@pytest.mark.parametrize('limit', [2, 5, 100])
+def test_datastore_author_posts_have_datetime_created(shards, keys_only, limit):
+    store, expected = _datastore(shards)
+    posts = _pages(store, limit, keys_only)
+
+    assert [p.key.id for p in posts] == [e.key.id for e in expected]
+    assert [p['created'] for p in posts] == [e['created'] for e in expected]
+    assert all(p['created'].tzinfo is not None and p['author'] == 'a' for p in posts)
+    assert all(('content' in p) != keys_only for p in posts)
+
+
+def test_memory_keys_only_is_a_projection(app):
+    add_users(app, 'a')
+    publish(app, 'a', 'hello')
+    posts, _ = app.store.author_posts('a', 10, keys_only=True)
+    assert [sorted(p) for p in posts] == [['author', 'created']]
+
+
+def test_timeline_hydrates_projected_posts(app, monkeypatch):
+    monkeypatch.setattr(app, 'TIMELINE_TWO_PHASE', True)
+    add_users(app, 'a', 'b', 'c')
+    app.store.set_follows({'a': ['b', 'c']})
+    for i in range(6):
+        publish(app, 'b' if i % 2 else 'c', f'p{i}', seconds=i)
+    assert all_pages(app, 'a', 4) == [f'p{i}' for i in reversed(range(6))]
@@ -0,0 +1,45 @@
+"""seed.py: anneaux des posts récents reconstruits après les lots de posts."""
+import argparse
+import sys
+
+import pytest
+
+import seed
+import storage
+from benchmark import Target
+
+
+@pytest.mark.skipif(storage.RECENT_POSTS_SIZE <= 0, reason="anneaux désactivés")
+def test_seed_rebuilds_every_ring_once(app, monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['seed.py', '--backend', 'memory', '--users', '12',
+                                      '--posts-per-user', '60', '--followees-per-user', '3',
+                                      '--workers', '4', '--seed', '1'])
+    monkeypatch.setattr(seed, 'make_storage', lambda kind=None: app.store)
+    pushed = []
+    monkeypatch.setattr(app.store, 'push_recent', pushed.append)
+    seed.main()
+
+    assert pushed == []
+    authors = [f'user{i}' for i in range(1, 13)]
+    rings = app.store.recent_posts(authors)
+    assert sorted(rings) == sorted(authors)
+    for author, ring in rings.items():
+        newest, _ = app.store.author_posts(author, storage.RECENT_POSTS_SIZE)
+        assert [p.key.id for p in ring.posts] == [p.key.id for p in newest]
+
+
+@pytest.mark.skipif(storage.RECENT_POSTS_SIZE <= 0, reason="anneaux désactivés")
+def test_benchmark_reseed_builds_rings(app):
+    # Cible locale sans serveur: seul le seed est exercé
+    target = Target.__new__(Target)
+    target.args = argparse.Namespace(prefix='user', users=8, workers=2, seed=3,
+                                     distribution='uniform')
+    target.store = app.store
+    target.app_module = app
+    names = target.reseed(posts_per_user=20, followees_per_user=3)
+
+    rings = app.store.recent_posts(names)
+    assert sorted(rings) == sorted(names)
+    for author, ring in rings.items():
+        newest, _ = app.store.author_posts(author, storage.RECENT_POSTS_SIZE)
+        assert [p.key.id for p in ring.posts] == [p.key.id for p in newest]
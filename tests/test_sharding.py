@@ -0,0 +1,56 @@
+"""Répartition des posts (shard_posts) et curseurs des lectures par auteur."""
+import pytest
+
+import storage
+from conftest import BASE_TIME, add_users, all_pages, publish
+
+
+def test_every_post_carries_a_shard(app):
+    add_users(app, 'a')
+    assert publish(app, 'a', 'p0')['shard'] == 0
+    app.store.shard_posts('a', 4)
+    assert 0 <= publish(app, 'a', 'p1')['shard'] < 4
+    app.store.shard_posts('a', 1)
+    posts, _ = app.store.author_posts('a', 10)
+    assert [p['shard'] for p in posts] == [0, 0]
+
+
+@pytest.mark.parametrize('shards', [(1, 4), (4, 1), (4, 2)])
+def test_timeline_pages_across_reshard(app, shards):
+    add_users(app, 'a', 'b')
+    app.store.set_follows({'a': ['b']})
+    for i in range(12):
+        publish(app, 'b', f'p{i}', seconds=i // 3)
+    expected = all_pages(app, 'a', 100)
+
+    app.store.shard_posts('b', shards[0])
+    page = app.timeline_page('a', 5)
+    app.store.shard_posts('b', shards[1])
+    app.loader.clear()
+    contents = [item['content'] for item in page['items']]
+    cursor = page['next_cursor']
+    while cursor:
+        page = app.timeline_page('a', 5, cursor=cursor)
+        contents.extend(item['content'] for item in page['items'])
+        cursor = page['next_cursor']
+    assert sorted(contents) == sorted(expected)
+    assert len(contents) == len(expected)
+
+
+def test_mark_cursor_round_trip():
+    seen = {3, 1, 2}
+    created, decoded = storage._decode_mark(storage._encode_mark(BASE_TIME, seen))
+    assert decoded == seen
+    assert created == storage._as_utc(BASE_TIME)
+
+
+@pytest.mark.parametrize('cursor', ['garbage', 'Zm9v', 'eyJ3IjoxfQ=='])
+def test_mark_cursor_rejects_foreign_cursor(cursor):
+    with pytest.raises(ValueError):
+        storage._decode_mark(cursor)
+
+
+def test_api_rejects_invalid_cursor(app):
+    add_users(app, 'a')
+    response = app.app.test_client().get('/api/timeline?user=a&cursor=garbage')
+    assert response.status_code == 400
@@ -3,7 +3,7 @@ import os
 
 # Définition du répertoire de sortie
 OUTPUT_DIR = 'out'
-FILES_TO_TRANSFORM = ['conc.csv', 'post.csv', 'fanout.csv']
+FILES_TO_TRANSFORM = ['conc.csv', 'post.csv', 'fanout.csv', 'replay.csv']
 
 def transform_to_wide(input_filename):
     input_path = os.path.join(OUTPUT_DIR, input_filename)
@@ -57,7 +57,7 @@ def transform_to_wide(input_filename):
     df_wide.to_csv(output_path, index=False)
     print(f"✅ Fichier transformé et enregistré: {output_path} (Format Large)")
 
-# Exécution pour les trois fichiers
+# Exécution pour chaque fichier
 print("--- Démarrage de la transformation Long -> Large ---")
 for f in FILES_TO_TRANSFORM:
     transform_to_wide(f)
@@ -0,0 +1,279 @@
+"""Jeux de données de seed.py: génération déterministe par lots, export et import.
+
+Distributions (--distribution):
+  uniform : chaque utilisateur suit exactement followees_per_user comptes tirés
+            uniformément, chaque auteur a posts_per_user posts.
+  zipf    : popularité en loi de puissance. Le k-ième utilisateur (ordre des
+            noms: user1 en tête) est suivi avec un poids 1/k^follow_alpha,
+            le nombre de followees d'un utilisateur suit une loi log-normale
+            de moyenne followees_per_user (écart type du log: followees_sigma)
+            et l'auteur de chaque post est tiré avec un poids
+            1/rang^post_alpha, les rangs d'activité étant une permutation
+            aléatoire des utilisateurs. Le nombre total de posts reste
+            users x posts_per_user.
+
+Horodatages (--timestamps):
+  sequential : un post par seconde à rebours de base_time (défaut en uniform).
+  diurnal    : posts répartis sur les `days` jours précédant base_time selon
+               un profil horaire (creux la nuit, pic en soirée, heures UTC),
+               à la microseconde (défaut en zipf).
+
+Chaque lot est généré à partir de son numéro et de la graine: le résultat ne
+dépend ni de l'ordre des threads ni d'une reprise. La mémoire est en
+O(utilisateurs) (poids cumulés), jamais en O(arêtes) ou O(posts).
+
+L'export (--export) écrit le graphe en NDJSON, une ligne par lot (users,
+follows, posts) après une ligne de configuration. GraphFile relit ce
+fichier lot par lot pour re-seeder exactement les mêmes données.
+"""
+import itertools
+import json
+import math
+import random
+import re
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from datetime import datetime, timedelta
+
+# Taille maximale de lot pour Datastore
+BATCH_SIZE = 500
+
+DISTRIBUTIONS = ('uniform', 'zipf')
+TIMESTAMPS = ('sequential', 'diurnal')
+
+# Part relative des posts par heure UTC (0h-23h): creux vers 4h, pic vers 20h
+DIURNAL_PROFILE = (3, 2, 1.5, 1, 1, 1.5, 3, 5, 6, 6, 6, 7,
+                   8, 7, 6, 6, 7, 8, 9, 10, 10, 9, 7, 5)
+
+
+def batch_rng(seed, phase, batch):
+    # Un générateur par lot: résultat indépendant de l'ordre d'exécution
+    # des threads, et identique lorsqu'un lot est rejoué après reprise
+    return random.Random(f"{seed}:{phase}:{batch}")
+
+
+def n_batches(total):
+    return (total + BATCH_SIZE - 1) // BATCH_SIZE
+
+
+def _cumulative(weights):
+    """Poids cumulés (array de doubles) pour un tirage par bisection."""
+    return array('d', itertools.accumulate(weights))
+
+
+def _pick(cum, rng):
+    """Indice tiré avec une probabilité proportionnelle à son poids."""
+    return min(bisect_right(cum, rng.random() * cum[-1]), len(cum) - 1)
+
+
+class Workload:
+    """Données générées: utilisateurs, arêtes de suivi et posts, lot par lot.
+
+    `config` reprend la configuration de seed.py: posts_per_user,
+    followees_per_user, seed, base_time et, hors défauts, distribution,
+    follow_alpha, post_alpha, followees_sigma, timestamps, days.
+    """
+
+    def __init__(self, names, config):
+        self.names = names
+        self.config = config
+        self.seed = config['seed']
+        self.base_time = datetime.fromisoformat(config['base_time'])
+        self.posts_per_user = config['posts_per_user']
+        self.followees_per_user = config['followees_per_user']
+        self.distribution = config.get('distribution', 'uniform')
+        self.timestamps = config.get('timestamps') or \
+            ('diurnal' if self.distribution == 'zipf' else 'sequential')
+        self.days = config.get('days', 30)
+
+        n = len(names)
+        self.total_posts = n * self.posts_per_user
+        self.n_post_batches = n_batches(self.total_posts)
+        nb_followees = min(self.followees_per_user, n - 1)
+        self.n_follow_batches = n_batches(n) if nb_followees > 0 else 0
+        # Nombre d'arêtes (attendu en zipf: sert à la progression)
+        self.total_edges = n * nb_followees if nb_followees > 0 else 0
+
+        if self.distribution == 'zipf':
+            alpha = config.get('follow_alpha', 1.0)
+            self._follow_cum = _cumulative((k + 1) ** -alpha for k in range(n))
+            sigma = config.get('followees_sigma', 1.0)
+            # Log-normale de moyenne followees_per_user
+            self._degree_mu = math.log(max(nb_followees, 1)) - sigma ** 2 / 2
+            self._degree_sigma = sigma
+            ranks = list(range(n))
+            random.Random(f"{self.seed}:ranks").shuffle(ranks)
+            alpha = config.get('post_alpha', 1.0)
+            self._post_cum = _cumulative((r + 1) ** -alpha for r in ranks)
+            del ranks
+        if self.timestamps == 'diurnal':
+            self._hour_cum = _cumulative(DIURNAL_PROFILE)
+            midnight = self.base_time.replace(hour=0, minute=0, second=0, microsecond=0)
+            self._first_day = midnight - timedelta(days=self.days)
+
+    # Utilisateurs
+    @property
+    def n_user_batches(self):
+        return n_batches(len(self.names))
+
+    def user_batch(self, batch):
+        return self.names[batch * BATCH_SIZE:(batch + 1) * BATCH_SIZE]
+
+    # Follows
+    def follow_batch(self, batch):
+        """{utilisateur: followees triés} pour les utilisateurs du lot."""
+        rng = batch_rng(self.seed, 'follows', batch)
+        names = self.names
+        n = len(names)
+        follows = {}
+        for i in range(batch * BATCH_SIZE, min((batch + 1) * BATCH_SIZE, n)):
+            if self.distribution == 'zipf':
+                picked = self._zipf_followees(rng, i)
+            else:
+                # Tirage parmi les n-1 autres indices sans copier la liste des
+                # noms: les indices >= i sont décalés d'un cran pour sauter soi-même
+                picked = [j + 1 if j >= i else j for j in
+                          rng.sample(range(n - 1), min(self.followees_per_user, n - 1))]
+            follows[names[i]] = sorted(names[j] for j in picked)
+        return follows
+
+    def _zipf_followees(self, rng, i):
+        n = len(self.names)
+        degree = round(rng.lognormvariate(self._degree_mu, self._degree_sigma))
+        degree = max(1, min(degree, n - 1))
+        picked = set()
+        # Rejet des doublons et de soi-même; avec un exposant fort et un degré
+        # proche de n, les derniers followees sont complétés uniformément
+        for _ in range(20 * degree):
+            if len(picked) == degree:
+                return picked
+            j = _pick(self._follow_cum, rng)
+            if j != i:
+                picked.add(j)
+        while len(picked) < degree:
+            j = rng.randrange(n)
+            if j != i:
+                picked.add(j)
+        return picked
+
+    # Posts
+    def post_batch(self, batch):
+        """[(auteur, contenu, created)] des posts du lot.
+
+        En uniform les auteurs sont entrelacés (post i de l'auteur i % n):
+        chaque lot écrit dans les plages d'index de centaines d'auteurs au
+        lieu d'ajouter 500 posts en tête de celle d'un seul. En zipf chaque
+        post tire son auteur, ce qui entrelace aussi les lots.
+        """
+        rng = batch_rng(self.seed, 'posts', batch)
+        names = self.names
+        n = len(names)
+        posts = []
+        for i in range(batch * BATCH_SIZE, min((batch + 1) * BATCH_SIZE, self.total_posts)):
+            if self.distribution == 'zipf':
+                author = names[_pick(self._post_cum, rng)]
+                content = f"Seed post by {author} (TS: {i})"
+            else:
+                author = names[i % n]
+                content = f"Seed post {i // n + 1} by {author} (TS: {i})"
+            if self.timestamps == 'diurnal':
+                created = self._first_day + timedelta(
+                    days=rng.randrange(self.days), hours=_pick(self._hour_cum, rng),
+                    microseconds=rng.randrange(3600 * 10 ** 6))
+            else:
+                # Décalage unique pour garantir l'ordre
+                created = self.base_time - timedelta(seconds=i, milliseconds=rng.randint(0, 999))
+            posts.append((author, content, created))
+        return posts
+
+
+# ------------------------------------------------------------
+# Export et import du graphe (NDJSON, une ligne par lot)
+# ------------------------------------------------------------
+def export_graph(source, path):
+    """Écrit les données de `source` dans `path`; retourne des statistiques du graphe."""
+    followers = Counter()
+    posts_by_author = Counter()
+    max_followees = edges = n_posts = 0
+    with open(path, 'w') as f:
+        f.write(json.dumps({'type': 'config', 'config': source.config}) + '\n')
+        for batch in range(source.n_user_batches):
+            f.write(json.dumps({'phase': 'users', 'batch': batch,
+                                'users': source.user_batch(batch)}) + '\n')
+        for batch in range(source.n_follow_batches):
+            follows = source.follow_batch(batch)
+            f.write(json.dumps({'phase': 'follows', 'batch': batch, 'follows': follows}) + '\n')
+            for followees in follows.values():
+                followers.update(followees)
+                edges += len(followees)
+                max_followees = max(max_followees, len(followees))
+        for batch in range(source.n_post_batches):
+            posts = source.post_batch(batch)
+            f.write(json.dumps({'phase': 'posts', 'batch': batch,
+                                'posts': [[a, c, t.isoformat()] for a, c, t in posts]}) + '\n')
+            posts_by_author.update(a for a, _, _ in posts)
+            n_posts += len(posts)
+    return {
+        'edges': edges,
+        'posts': n_posts,
+        'max_followees': max_followees,
+        'max_followers': max(followers.values(), default=0),
+        'max_posts_per_author': max(posts_by_author.values(), default=0),
+        'most_followed': followers.most_common(5),
+    }
+
+
+# Début de chaque ligne de lot écrite par export_graph
+_LINE_PREFIX = re.compile(rb'\{"phase": "(\w+)", "batch": (\d+)')
+
+
+class GraphFile:
+    """Données relues d'un export, avec l'interface de Workload.
+
+    Un premier passage ne garde que la position de chaque ligne; chaque lot
+    est relu à la demande (depuis n'importe quel thread).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._offsets = {}   # (phase, lot) -> position dans le fichier
+        with open(path, 'rb') as f:
+            header = json.loads(f.readline())
+            if header.get('type') != 'config':
+                raise ValueError(f"{path}: export de graphe attendu")
+            self.config = header['config']
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                # Seuls phase et lot sont lus: les lignes de posts sont longues
+                match = _LINE_PREFIX.match(line)
+                self._offsets[match[1].decode(), int(match[2])] = offset
+
+        self.n_user_batches = self._count('users')
+        self.n_follow_batches = self._count('follows')
+        self.n_post_batches = self._count('posts')
+        self.names = [name for b in range(self.n_user_batches) for name in self.user_batch(b)]
+        self.total_posts = self.config['posts_per_user'] * len(self.names)
+        self.total_edges = self.config['followees_per_user'] * len(self.names) \
+            if self.n_follow_batches else 0
+
+    def _count(self, phase):
+        return sum(1 for p, _ in self._offsets if p == phase)
+
+    def _read(self, phase, batch):
+        with open(self.path, 'rb') as f:
+            f.seek(self._offsets[phase, batch])
+            return json.loads(f.readline())[phase]
+
+    def user_batch(self, batch):
+        return self._read('users', batch)
+
+    def follow_batch(self, batch):
+        return self._read('follows', batch)
+
+    def post_batch(self, batch):
+        return [(author, content, datetime.fromisoformat(created))
+                for author, content, created in self._read('posts', batch)]